@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+WebRTC frame conversion microbenchmark
+Compares full-resolution to_ndarray("rgb24") + letterbox resize against
+WebRTCHandler.frame_to_rgb scaling yuv420p planes to letterbox size first, and
+against a single swscale reformat to that size
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import av
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+from inferencr_engine import InferenceEngine
+from webrtc_handler import WebRTCHandler
+
+RESOLUTIONS = {'720p': (1280, 720), '1080p': (1920, 1080)}
+
+def measure(fn, iterations):
+    """Median time (ms) of fn() and the bytes of the array it returns"""
+    result = fn()
+
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(times)), result.nbytes
+
+def yuv420p_frame(width, height, seed=0):
+    """A decoder-like yuv420p frame with smooth, camera-like content"""
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 256, (height // 60, width // 60, 3), dtype=np.uint8)
+    rgb = cv2.resize(base, (width, height), interpolation=cv2.INTER_CUBIC)
+    return av.VideoFrame.from_ndarray(rgb, format='rgb24').reformat(format='yuv420p')
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark aiortc frame conversion paths")
+    parser.add_argument('--model', default='models/yolov5n.onnx')
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args()
+
+    engine = InferenceEngine(mode="server", max_workers=0, model_path=args.model)
+    batch = engine._input_buffer(1)
+
+    print(f"📐 Model input {engine.input_size[0]}x{engine.input_size[1]}, median of {args.iterations} iterations\n")
+    print(f"   {'source':<8}{'path':<22}{'convert ms':>11}{'total ms':>10}{'RGB KB':>9}")
+
+    for name, (width, height) in RESOLUTIONS.items():
+        frame = yuv420p_frame(width, height)
+        size = engine.letterbox_size(width, height)
+
+        def full_then_resize():
+            rgb = WebRTCHandler.frame_to_rgb(frame)
+            engine._preprocess_image(rgb, out=batch[0])
+            return rgb
+
+        def reformat_to_size():
+            rgb = WebRTCHandler.frame_to_rgb(frame, size)
+            engine._preprocess_image(rgb, out=batch[0])
+            return rgb
+
+        def swscale_to_size():
+            rgb = frame.reformat(width=size[0], height=size[1], format='rgb24', interpolation='BILINEAR').to_ndarray()
+            engine._preprocess_image(rgb, out=batch[0])
+            return rgb
+
+        full_convert_ms, _ = measure(lambda: WebRTCHandler.frame_to_rgb(frame), args.iterations)
+        direct_convert_ms, _ = measure(lambda: WebRTCHandler.frame_to_rgb(frame, size), args.iterations)
+        swscale_ms, _ = measure(swscale_to_size, args.iterations)
+        full_ms, full_bytes = measure(full_then_resize, args.iterations)
+        reference = batch[0].copy()
+        direct_ms, direct_bytes = measure(reformat_to_size, args.iterations)
+        difference = np.abs(batch[0].astype(np.float32) - reference.astype(np.float32)).mean() * 255
+
+        print(f"   {name:<8}{'to_ndarray + resize':<22}{full_convert_ms:>11.2f}{full_ms:>10.2f}{full_bytes / 1024:>9.0f}")
+        print(f"   {name:<8}{'yuv420p planes':<22}{direct_convert_ms:>11.2f}{direct_ms:>10.2f}{direct_bytes / 1024:>9.0f}")
+        print(f"   {name:<8}{'swscale reformat':<22}{'':>11}{swscale_ms:>10.2f}{direct_bytes / 1024:>9.0f}")
+        print(f"   {name:<8}saves {full_ms - direct_ms:.2f} ms/frame ({full_ms / direct_ms:.1f}x), "
+              f"mean input delta {difference:.2f}/255\n")
+
+if __name__ == "__main__":
+    main()
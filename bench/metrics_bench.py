@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+MetricsCollector read-path benchmark
+Compares the previous deque-of-dicts storage (lists rebuilt and sorted on every
+read) against the NumPy column ring with sliding-window latency histograms:
+get_current_metrics time, bytes per stored frame, and percentile error
+"""
+
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+from metrics_ring import FrameMetricsRing
+
+def percentile(data, p):
+    """The collector's previous sort-based percentile"""
+    sorted_data = sorted(data)
+    index = (p / 100.0) * (len(sorted_data) - 1)
+    lower = sorted_data[int(index)]
+    upper = sorted_data[min(int(index) + 1, len(sorted_data) - 1)]
+    return lower + (upper - lower) * (index - int(index))
+
+def dict_summary(frames):
+    """Latency section as get_current_metrics built it from a deque of dicts"""
+    e2e = [m['end_to_end_latency'] for m in frames]
+    network = [m['network_latency'] for m in frames]
+    server = [m['server_latency'] for m in frames]
+    return {
+        'end_to_end': (statistics.median(e2e), percentile(e2e, 95), percentile(e2e, 99),
+                       statistics.mean(e2e), min(e2e), max(e2e)),
+        'network': (statistics.median(network), percentile(network, 95), statistics.mean(network)),
+        'server': (statistics.median(server), percentile(server, 95), statistics.mean(server))
+    }
+
+def ring_summary(ring):
+    """Latency section as get_current_metrics builds it from the ring"""
+    histograms = ring.histograms
+    e2e = ring.columns['end_to_end_latency'][:len(ring)]
+    return {
+        'end_to_end': (*histograms['end_to_end_latency'].percentiles(50, 95, 99),
+                       histograms['end_to_end_latency'].mean(), e2e.min(), e2e.max()),
+        'network': (*histograms['network_latency'].percentiles(50, 95), histograms['network_latency'].mean()),
+        'server': (*histograms['server_latency'].percentiles(50, 95), histograms['server_latency'].mean())
+    }
+
+def synthetic_frames(count, seed=0):
+    """Frame rows with log-normal latencies shaped like a loaded server"""
+    rng = np.random.default_rng(seed)
+    network = rng.lognormal(3.0, 0.5, count).round()
+    server = rng.lognormal(4.0, 0.6, count).round()
+    now = int(time.time() * 1000)
+    rows = []
+    for i in range(count):
+        capture_ts = now + i * 33
+        recv_ts = capture_ts + network[i]
+        inference_ts = recv_ts + server[i]
+        display_ts = inference_ts + network[i]
+        rows.append({
+            'timestamp': int(display_ts), 'capture_ts': capture_ts, 'recv_ts': recv_ts,
+            'inference_ts': inference_ts, 'display_ts': display_ts,
+            'network_latency': recv_ts - capture_ts, 'server_latency': inference_ts - recv_ts,
+            'end_to_end_latency': display_ts - capture_ts, 'num_detections': int(rng.integers(0, 10))
+        })
+    return rows
+
+def bytes_per_frame(build, count):
+    """Traced allocation of a store holding count frames"""
+    tracemalloc.start()
+    store = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / count, store
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MetricsCollector frame storage and reads")
+    parser.add_argument('--samples', type=int, default=1000, help='Ring capacity (max_samples)')
+    parser.add_argument('--frames', type=int, default=5000, help='Frames recorded before reading')
+    parser.add_argument('--reads', type=int, default=500)
+    args = parser.parse_args()
+
+    rows = synthetic_frames(args.frames)
+
+    def build_deque():
+        frames = deque(maxlen=args.samples)
+        for row in rows:
+            frames.append(dict(row))
+        return frames
+
+    def build_ring():
+        ring = FrameMetricsRing(args.samples)
+        for row in rows:
+            ring.append(**row)
+        return ring
+
+    deque_bytes, frames = bytes_per_frame(build_deque, args.samples)
+    ring_bytes, ring = bytes_per_frame(build_ring, args.samples)
+
+    def timed(fn):
+        fn()
+        start = time.perf_counter()
+        for _ in range(args.reads):
+            fn()
+        return (time.perf_counter() - start) / args.reads * 1e6
+
+    start = time.perf_counter()
+    build_ring()
+    record_us = (time.perf_counter() - start) / args.frames * 1e6
+
+    dict_us = timed(lambda: dict_summary(frames))
+    ring_us = timed(lambda: ring_summary(ring))
+
+    exact, approx = dict_summary(frames), ring_summary(ring)
+    print(f"📊 {args.frames} frames recorded, window of {args.samples}, {args.reads} reads\n")
+    print(f"   {'storage':<22}{'read us':>10}{'bytes/frame':>13}")
+    print(f"   {'deque of dicts':<22}{dict_us:>10.1f}{deque_bytes:>13.0f}")
+    print(f"   {'numpy ring + hist':<22}{ring_us:>10.1f}{ring_bytes:>13.0f}")
+    print(f"\n   read speedup {dict_us / ring_us:.1f}x, record {record_us:.1f} us/frame (ring), "
+          f"columns alone {ring.nbytes / args.samples:.0f} bytes/frame\n")
+    print(f"   {'series':<12}{'stat':<8}{'exact':>10}{'sketch':>10}{'error':>9}")
+    names = {'end_to_end': ('median', 'p95', 'p99', 'mean', 'min', 'max'),
+             'network': ('median', 'p95', 'mean'), 'server': ('median', 'p95', 'mean')}
+    for series, stats in names.items():
+        for stat, a, b in zip(stats, exact[series], approx[series]):
+            error = abs(b - a) / abs(a) if a else 0.0
+            print(f"   {series:<12}{stat:<8}{a:>10.1f}{float(b):>10.1f}{error:>9.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Postprocessing equivalence check and microbenchmark
+Compares the vectorized InferenceEngine decode against the original per-row loop
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+from inferencr_engine import InferenceEngine
+
+def reference_postprocess(engine, outputs, original_shape):
+    """Original per-row Python loop (before vectorization), without NMS"""
+    detections = []
+    if len(outputs.shape) == 3:
+        outputs = outputs[0]
+
+    orig_h, orig_w = original_shape[:2]
+    input_h, input_w = engine.input_size[1], engine.input_size[0]
+    scale_x = orig_w / input_w
+    scale_y = orig_h / input_h
+
+    for detection in outputs:
+        confidence = detection[4]
+        if confidence < engine.confidence_threshold:
+            continue
+
+        class_scores = detection[5:]
+        class_id = np.argmax(class_scores)
+        class_confidence = class_scores[class_id]
+
+        final_confidence = confidence * class_confidence
+        if final_confidence < engine.confidence_threshold:
+            continue
+
+        # NumPy 1.x promoted these scalar ops to float64; pin that explicitly
+        x_center, y_center, width, height = [float(v) for v in detection[:4]]
+        x1 = (x_center - width / 2) * scale_x
+        y1 = (y_center - height / 2) * scale_y
+        x2 = (x_center + width / 2) * scale_x
+        y2 = (y_center + height / 2) * scale_y
+
+        xmin = max(0, x1 / orig_w)
+        ymin = max(0, y1 / orig_h)
+        xmax = min(1, x2 / orig_w)
+        ymax = min(1, y2 / orig_h)
+
+        if xmax <= xmin or ymax <= ymin:
+            continue
+
+        detections.append({
+            'label': engine.class_names[class_id],
+            'score': float(final_confidence),
+            'xmin': float(xmin),
+            'ymin': float(ymin),
+            'xmax': float(xmax),
+            'ymax': float(ymax)
+        })
+
+    return detections
+
+def reference_nms(detections, nms_threshold):
+    """Original class-agnostic list-of-dicts NMS"""
+    def iou(box1, box2):
+        x1 = max(box1['xmin'], box2['xmin'])
+        y1 = max(box1['ymin'], box2['ymin'])
+        x2 = min(box1['xmax'], box2['xmax'])
+        y2 = min(box1['ymax'], box2['ymax'])
+        if x2 <= x1 or y2 <= y1:
+            return 0.0
+        intersection = (x2 - x1) * (y2 - y1)
+        area1 = (box1['xmax'] - box1['xmin']) * (box1['ymax'] - box1['ymin'])
+        area2 = (box2['xmax'] - box2['xmin']) * (box2['ymax'] - box2['ymin'])
+        union = area1 + area2 - intersection
+        return intersection / union if union > 0 else 0.0
+
+    detections = sorted(detections, key=lambda x: x['score'], reverse=True)
+    kept = []
+    while detections:
+        best = detections.pop(0)
+        kept.append(best)
+        detections = [det for det in detections if iou(best, det) < nms_threshold]
+    return kept
+
+def crowded_scene(rng, num_candidates, num_classes):
+    """Candidates clustered around a few dozen objects, as in a crowded frame"""
+    centers = rng.uniform(0.1, 0.9, (max(1, num_candidates // 10), 2))
+    picks = rng.integers(0, len(centers), num_candidates)
+    xy = centers[picks] + rng.normal(0, 0.01, (num_candidates, 2))
+    wh = rng.uniform(0.05, 0.15, (num_candidates, 2))
+    boxes = np.clip(np.concatenate([xy - wh / 2, xy + wh / 2], axis=1), 0, 1)
+    scores = rng.uniform(0.5, 1.0, num_candidates)
+    class_ids = rng.integers(0, num_classes, num_candidates)
+    return boxes, scores, class_ids
+
+def threshold_scene():
+    """
+    Same-class pairs whose IoU is exactly 0.25, 0.5 and 0.75 (all dyadic, so exact in
+    float32 and float64), each followed by a pair just above it
+    """
+    boxes = []
+    for slot, iou in enumerate((0.25, 0.5, 0.75)):
+        x = slot * 0.25
+        for height in (iou, iou + 2 ** -10):
+            # [x, 0, x + 1/8, 1/2] against [x, 0, x + 1/8, 1/2 * iou]: inside it, so IoU is the height ratio
+            boxes += [[x, 0.5, x + 0.125, 1.0], [x, 0.5, x + 0.125, 0.5 + 0.5 * height]]
+    boxes = np.array(boxes)
+    scores = np.linspace(1.0, 0.5, len(boxes))
+    return boxes, scores, np.zeros(len(boxes), dtype=np.int64)
+
+def check_nms_backends(engine, rng):
+    """Assert the NumPy fallback keeps exactly what OpenCV keeps, including boxes at the IoU threshold"""
+    cases = [crowded_scene(rng, n, 3) for n in (10, 100, 300, 1000)]
+    threshold_cases = [threshold_scene()]
+    saved = engine.nms_threshold, engine.class_agnostic_nms
+    try:
+        for agnostic in (False, True):
+            engine.class_agnostic_nms = agnostic
+            for threshold, scenes in ((saved[0], cases), (0.25, threshold_cases), (0.5, threshold_cases),
+                                      (0.75, threshold_cases)):
+                engine.nms_threshold = threshold
+                for boxes, scores, class_ids in scenes:
+                    order = np.argsort(-scores, kind='stable')
+                    boxes, scores, class_ids = boxes[order], scores[order], class_ids[order]
+                    expected = engine._nms_cv2(boxes, scores, class_ids)[:engine.max_detections]
+                    actual = engine._nms_numpy(boxes, scores, class_ids)
+                    if not np.array_equal(expected, actual):
+                        raise AssertionError(f"NMS backends disagree at threshold {threshold}: "
+                                             f"opencv {expected.tolist()} != numpy {actual.tolist()}")
+    finally:
+        engine.nms_threshold, engine.class_agnostic_nms = saved
+
+def vectorized_postprocess(engine, outputs, original_shape):
+    """Vectorized decode, materialized as dicts, without NMS"""
+    boxes, scores, class_ids = engine._decode_candidates(outputs, original_shape)
+    return [
+        {
+            'label': engine.class_names[class_id],
+            'score': score,
+            'xmin': xmin,
+            'ymin': ymin,
+            'xmax': xmax,
+            'ymax': ymax
+        }
+        for (xmin, ymin, xmax, ymax), score, class_id
+        in zip(boxes.tolist(), scores.tolist(), class_ids.tolist())
+    ]
+
+def synthetic_outputs(rng, num_rows, num_classes, input_size, positive_ratio):
+    """Random YOLO-style output with a controllable share of confident rows"""
+    input_w, input_h = input_size
+    outputs = np.empty((1, num_rows, 5 + num_classes), dtype=np.float32)
+    outputs[0, :, 0] = rng.uniform(-20, input_w + 20, num_rows)
+    outputs[0, :, 1] = rng.uniform(-20, input_h + 20, num_rows)
+    outputs[0, :, 2] = rng.uniform(0, input_w / 2, num_rows)
+    outputs[0, :, 3] = rng.uniform(0, input_h / 2, num_rows)
+    outputs[0, :, 4] = np.where(
+        rng.random(num_rows) < positive_ratio, rng.uniform(0.4, 1.0, num_rows), rng.uniform(0, 0.3, num_rows)
+    )
+    outputs[0, :, 5:] = rng.random((num_rows, num_classes))
+    return outputs
+
+def check_equivalence(engine, outputs, original_shape):
+    """Assert both paths agree on labels, order and values"""
+    expected = reference_postprocess(engine, outputs, original_shape)
+    actual = vectorized_postprocess(engine, outputs, original_shape)
+
+    if len(expected) != len(actual):
+        raise AssertionError(f"Detection count mismatch: {len(expected)} != {len(actual)}")
+
+    for ref, vec in zip(expected, actual):
+        if ref['label'] != vec['label']:
+            raise AssertionError(f"Label mismatch: {ref} != {vec}")
+        for key in ('score', 'xmin', 'ymin', 'xmax', 'ymax'):
+            if not np.isclose(ref[key], vec[key], rtol=1e-6, atol=1e-7):
+                raise AssertionError(f"{key} mismatch: {ref} != {vec}")
+
+    return len(expected)
+
+def time_call(fn, iterations):
+    """Mean wall time of fn() in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description="Postprocessing equivalence check and benchmark")
+    parser.add_argument('--rows', type=int, default=25200, help='Candidate rows per frame')
+    parser.add_argument('--iterations', type=int, default=20, help='Timed iterations per path')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    engine = InferenceEngine(mode="wasm")
+    original_shape = (720, 1280, 3)
+
+    print("🔬 Checking equivalence...")
+    for positive_ratio in (0.0, 0.01, 0.1, 0.5):
+        outputs = synthetic_outputs(rng, args.rows, len(engine.class_names), engine.input_size, positive_ratio)
+        count = check_equivalence(engine, outputs, original_shape)
+        print(f"✅ positive_ratio={positive_ratio}: {count} detections match")
+    if engine.use_cv2_nms:
+        check_nms_backends(engine, rng)
+        print("✅ NumPy and OpenCV NMS keep the same boxes, including at the IoU threshold")
+
+    outputs = synthetic_outputs(rng, args.rows, len(engine.class_names), engine.input_size, 0.05)
+    loop_ms = time_call(lambda: reference_postprocess(engine, outputs, original_shape), args.iterations)
+    vec_ms = time_call(lambda: vectorized_postprocess(engine, outputs, original_shape), args.iterations)
+
+    print(f"\n⏱️ Per-row loop:  {loop_ms:.2f} ms/frame")
+    print(f"⚡ Vectorized:    {vec_ms:.2f} ms/frame")
+    print(f"🚀 Speedup:       {loop_ms / vec_ms:.1f}x")
+
+    print("\n📦 NMS on crowded scenes (class-aware, top-k 300)")
+    for num_candidates in (100, 300, 1000):
+        boxes, scores, class_ids = crowded_scene(rng, num_candidates, 3)
+        detections = [
+            {'label': engine.class_names[c], 'score': s, 'xmin': b[0], 'ymin': b[1], 'xmax': b[2], 'ymax': b[3]}
+            for b, s, c in zip(boxes.tolist(), scores.tolist(), class_ids.tolist())
+        ]
+        dict_ms = time_call(lambda: reference_nms(list(detections), engine.nms_threshold), args.iterations)
+        engine.use_cv2_nms = False
+        numpy_ms = time_call(lambda: engine._apply_nms(boxes, scores, class_ids), args.iterations)
+        engine.use_cv2_nms = True
+        cv2_ms = time_call(lambda: engine._apply_nms(boxes, scores, class_ids), args.iterations)
+        print(f"   n={num_candidates:5d}: dict loop {dict_ms:7.3f} ms | numpy {numpy_ms:6.3f} ms | opencv {cv2_ms:6.3f} ms")
+
+if __name__ == "__main__":
+    main()
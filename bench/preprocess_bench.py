@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Preprocessing allocation and timing report
+Compares the original allocate-per-step preprocessing with the reused-buffer
+letterbox path and IOBinding, stage by stage
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+from inferencr_engine import InferenceEngine
+
+def measure(fn, iterations):
+    """Mean time (ms) and mean peak allocation (bytes) of fn()"""
+    fn()  # Warm caches and lazily created buffers
+
+    total_bytes = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        total_bytes += tracemalloc.get_traced_memory()[1] - before
+    elapsed_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    return elapsed_ms, total_bytes / iterations
+
+def legacy_stages(engine, img):
+    """Original _preprocess_image, split into its allocating steps"""
+    state = {}
+    input_size = engine.input_size
+
+    def cvt():
+        state['rgb'] = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+    def resize():
+        state['resized'] = cv2.resize(state['rgb'], input_size)
+
+    def to_float():
+        state['float'] = state['resized'].astype(np.float32)
+
+    def normalize():
+        state['norm'] = state['float'] / 255.0
+
+    def transpose():
+        state['chw'] = np.transpose(state['norm'], (2, 0, 1))
+
+    def expand():
+        state['batch'] = np.expand_dims(state['chw'], axis=0)
+
+    def to_model_dtype():
+        state['input'] = state['batch'].astype(engine.input_dtype, copy=False)
+
+    return state, [
+        ('cvtColor', cvt), ('resize', resize), ('astype float32', to_float),
+        ('/ 255', normalize), ('transpose', transpose), ('expand_dims', expand),
+        ('astype model dtype', to_model_dtype)
+    ]
+
+def print_report(title, rows):
+    """Print a per-stage table with totals"""
+    print(f"\n{title}")
+    print(f"   {'stage':<22}{'ms':>10}{'alloc KB':>12}")
+    total_ms = total_kb = 0
+    for name, ms, allocated in rows:
+        kb = allocated / 1024
+        total_ms += ms
+        total_kb += kb
+        print(f"   {name:<22}{ms:>10.3f}{kb:>12.1f}")
+    print(f"   {'total':<22}{total_ms:>10.3f}{total_kb:>12.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocessing allocation and timing report")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--model', default='models/yolov5n.onnx', help='Model used for the session.run stages')
+    args = parser.parse_args()
+
+    model_available = Path(args.model).exists()
+    engine = InferenceEngine(mode="server" if model_available else "wasm", max_workers=0, model_path=args.model)
+    img = np.random.randint(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+
+    print(f"📐 Frame {args.width}x{args.height} -> model {engine.input_size[0]}x{engine.input_size[1]}")
+
+    tracemalloc.start()
+
+    state, stages = legacy_stages(engine, img)
+    legacy_rows = [(name, *measure(fn, args.iterations)) for name, fn in stages]
+
+    batch = engine._input_buffer(1)
+    new_rows = [('letterbox + normalize', *measure(lambda: engine._preprocess_image(img, out=batch[0]), args.iterations))]
+
+    if model_available:
+        engine.use_io_binding = False
+        legacy_rows.append(('session.run', *measure(lambda: engine._run_session(state['input']), args.iterations)))
+        engine.use_io_binding = True
+        new_rows.append(('session.run (IOBinding)', *measure(lambda: engine._run_session(batch), args.iterations)))
+
+    tracemalloc.stop()
+
+    print_report("🐢 Original preprocessing (allocate per step)", legacy_rows)
+    print_report("⚡ Reused buffers + letterbox", new_rows)
+    if not model_available:
+        print(f"\n💡 {args.model} not found; session.run stages skipped")
+
+if __name__ == "__main__":
+    main()
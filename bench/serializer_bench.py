@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Detection result serializer benchmark
+Compares json.dumps of the detections message against the binary record
+encoding in frame_protocol, for message size and encode time. Binary time is
+measured both from the detection dicts (tracked frames) and from the engine's
+arrays (records packed in _format_detections, header added at send).
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+from frame_protocol import DetectionList, pack_detection_records, pack_detections, unpack_detections
+from inferencr_engine import InferenceEngine
+
+def make_arrays(class_names, count, seed=0):
+    """Post-NMS boxes, scores and class ids as the engine holds them"""
+    rng = np.random.default_rng(seed)
+    top_left = rng.uniform(0, 0.8, (count, 2))
+    boxes = np.concatenate([top_left, top_left + rng.uniform(0.02, 0.2, (count, 2))], axis=1)
+    return boxes, rng.uniform(0.5, 1.0, count), rng.integers(len(class_names), size=count)
+
+def make_response(class_names, arrays):
+    """A detections message shaped like process_frame_server_mode's output"""
+    boxes, scores, class_ids = arrays
+    detections = DetectionList([
+        {
+            'label': class_names[class_id],
+            'score': score,
+            'xmin': xmin, 'ymin': ymin,
+            'xmax': xmax, 'ymax': ymax
+        }
+        for (xmin, ymin, xmax, ymax), score, class_id in zip(boxes.tolist(), scores.tolist(), class_ids.tolist())
+    ], pack_detection_records(boxes, scores, class_ids))
+    now = int(time.time() * 1000)
+    return {
+        'type': 'detections',
+        'frame_id': 1234,
+        'capture_ts': now - 40,
+        'recv_ts': now - 30,
+        'inference_ts': now,
+        'detections': detections
+    }
+
+def timed(fn, iterations):
+    """Median microseconds per call"""
+    fn()
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1e6)
+    return float(np.median(times))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection result serializers")
+    parser.add_argument('--counts', default='1,5,20,100', help='Comma-separated boxes per frame')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--fps', type=float, default=30)
+    args = parser.parse_args()
+
+    class_names = InferenceEngine(mode="wasm").class_names
+    class_index = {name: class_id for class_id, name in enumerate(class_names)}
+
+    print(f"   {'boxes':>6}{'json B':>9}{'binary B':>10}{'json us':>10}{'dicts us':>10}{'arrays us':>11}"
+          f"{'size x':>8}{'time x':>8}{'kbps @' + str(int(args.fps)):>11}{'max err':>10}")
+    for count in [int(c) for c in args.counts.split(',')]:
+        arrays = make_arrays(class_names, count)
+        response = make_response(class_names, arrays)
+        dict_response = dict(response, detections=list(response['detections']))
+        json_bytes = len(json.dumps(response).encode())
+        binary = pack_detections(response, class_index)
+        assert binary == pack_detections(dict_response, class_index)
+
+        def pack_from_arrays():
+            response['detections'].records = pack_detection_records(*arrays)
+            return pack_detections(response, class_index)
+
+        json_us = timed(lambda: json.dumps(response), args.iterations)
+        dict_us = timed(lambda: pack_detections(dict_response, class_index), args.iterations)
+        binary_us = timed(pack_from_arrays, args.iterations)
+
+        decoded = unpack_detections(binary, class_names)['detections']
+        max_error = max(
+            (abs(a[k] - b[k]) for a, b in zip(response['detections'], decoded)
+             for k in ('score', 'xmin', 'ymin', 'xmax', 'ymax')),
+            default=0.0
+        )
+        assert all(a['label'] == b['label'] for a, b in zip(response['detections'], decoded))
+
+        kbps = len(binary) * 8 * args.fps / 1000
+        print(f"   {count:>6}{json_bytes:>9}{len(binary):>10}{json_us:>10.1f}{dict_us:>10.1f}{binary_us:>11.1f}"
+              f"{json_bytes / len(binary):>8.1f}{json_us / binary_us:>8.1f}{kbps:>11.1f}{max_error:>10.4f}")
+
+if __name__ == "__main__":
+    main()
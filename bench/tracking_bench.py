@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Detect-then-track benchmark
+Compares DetectionTracker against running the detector on every frame: detector
+calls saved, per-frame CPU time, and agreement with full detection
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'server'))
+
+from object_tracker import DetectionTracker, box_iou_matrix
+
+def agreement(reference, candidate, iou_threshold=0.5):
+    """F1 of greedy same-label matches between two detection lists"""
+    if not reference and not candidate:
+        return 1.0
+    ref_boxes = np.array([[d['xmin'], d['ymin'], d['xmax'], d['ymax']] for d in reference]).reshape(-1, 4)
+    cand_boxes = np.array([[d['xmin'], d['ymin'], d['xmax'], d['ymax']] for d in candidate]).reshape(-1, 4)
+    iou = box_iou_matrix(ref_boxes, cand_boxes)
+    for r, ref in enumerate(reference):
+        for c, cand in enumerate(candidate):
+            if ref['label'] != cand['label']:
+                iou[r, c] = 0.0
+
+    matches, used = 0, set()
+    for r in range(len(reference)):
+        order = [c for c in np.argsort(iou[r])[::-1] if c not in used and iou[r, c] >= iou_threshold]
+        if order:
+            used.add(order[0])
+            matches += 1
+    return 2 * matches / (len(reference) + len(candidate))
+
+def video_frames(path, limit):
+    """(timestamp_ms, RGB frame) pairs from a video file"""
+    import cv2
+
+    capture = cv2.VideoCapture(str(path))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 15
+    frames = []
+    while len(frames) < limit:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append((len(frames) * 1000.0 / fps, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+    capture.release()
+    return frames
+
+def run_video(args):
+    """Full detection on every frame vs detect-then-track, through the real engine"""
+    from inferencr_engine import InferenceEngine
+
+    engine = InferenceEngine(mode="server", max_workers=0, model_path=args.model)
+    engine.warmup(2)
+    frames = video_frames(args.video, args.frames)
+    if not frames:
+        print(f"❌ No frames read from {args.video}")
+        sys.exit(1)
+
+    reference, full_times = [], []
+    for _, frame in frames:
+        start = time.perf_counter()
+        reference.append(engine._detect_sync(frame))
+        full_times.append(time.perf_counter() - start)
+
+    def detector(index):
+        return engine._detect_sync(frames[index][1])
+
+    return [ts for ts, _ in frames], reference, detector, float(np.mean(full_times))
+
+def synthetic_scene(num_frames, num_objects, fps, seed):
+    """Constant-velocity boxes with jitter; the 'detector' returns noisy ground truth"""
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform(0.2, 0.8, (num_objects, 2))
+    velocities = rng.uniform(-0.15, 0.15, (num_objects, 2))  # Frame widths per second
+    sizes = rng.uniform(0.08, 0.2, (num_objects, 2))
+    labels = rng.choice(['person', 'car', 'dog'], num_objects)
+
+    timestamps, reference = [], []
+    for i in range(num_frames):
+        t = i / fps
+        positions = centres + velocities * t
+        # Bounce off the frame edges
+        positions = np.abs(((positions - 0.1) % 1.6) - 0.8) + 0.1
+        noise = rng.normal(0, 0.003, (num_objects, 2))
+        detections = []
+        for (cx, cy), (w, h), (nx, ny), label in zip(positions, sizes, noise, labels):
+            detections.append({
+                'label': str(label),
+                'score': 0.8,
+                'xmin': float(cx - w / 2 + nx), 'ymin': float(cy - h / 2 + ny),
+                'xmax': float(cx + w / 2 + nx), 'ymax': float(cy + h / 2 + ny)
+            })
+        timestamps.append(i * 1000.0 / fps)
+        reference.append(detections)
+
+    return timestamps, reference, lambda index: reference[index], None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detect-then-track against full detection")
+    parser.add_argument('--video', default=None, help='Video file; omit for a synthetic moving-box scene')
+    parser.add_argument('--model', default='models/yolov5n.onnx')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--objects', type=int, default=6, help='Synthetic scene only')
+    parser.add_argument('--fps', type=float, default=15, help='Synthetic scene only')
+    parser.add_argument('--min-interval', type=int, default=1)
+    parser.add_argument('--max-interval', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.video:
+        timestamps, reference, detector, full_ms = run_video(args)
+    else:
+        timestamps, reference, detector, full_ms = synthetic_scene(args.frames, args.objects, args.fps, seed=0)
+
+    tracker = DetectionTracker(min_interval=args.min_interval, max_interval=args.max_interval)
+    scores, detect_times, track_times = [], [], []
+    for index, ts in enumerate(timestamps):
+        start = time.perf_counter()
+        if tracker.needs_detection():
+            detections = tracker.update(detector(index), ts)
+            detect_times.append(time.perf_counter() - start)
+        else:
+            detections = tracker.predict(ts)
+            track_times.append(time.perf_counter() - start)
+        scores.append(agreement(reference[index], detections))
+
+    stats = tracker.get_stats()
+    track_ms = float(np.mean(track_times)) * 1000 if track_times else 0.0
+    print(f"📊 {len(timestamps)} frames ({'video' if args.video else 'synthetic'}), "
+          f"keyframe interval {args.min_interval}-{args.max_interval}")
+    print(f"   keyframes:       {stats['keyframes']} ({stats['keyframe_ratio']:.1%} of frames)")
+    print(f"   final interval:  {stats['interval']}")
+    print(f"   tracked frame:   {track_ms:.3f} ms")
+    print(f"   agreement (F1):  mean {np.mean(scores):.3f}, min {np.min(scores):.3f} vs full detection")
+    if full_ms is not None:
+        per_frame = stats['keyframe_ratio'] * full_ms * 1000 + (1 - stats['keyframe_ratio']) * track_ms
+        print(f"   full detection:  {full_ms * 1000:.1f} ms/frame")
+        print(f"   detect+track:    {per_frame:.1f} ms/frame ({full_ms * 1000 / per_frame:.1f}x streams per core)")
+    else:
+        print(f"   detector calls saved: {1 - stats['keyframe_ratio']:.1%} "
+              f"(~{1 / max(stats['keyframe_ratio'], 1e-9):.1f}x streams per core when inference dominates)")
+
+if __name__ == "__main__":
+    main()
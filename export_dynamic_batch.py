@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Export a dynamic-batch copy of a YOLOv5 ONNX model for server-side micro-batching
+
+The stock yolov5n.onnx is exported with a fixed batch dimension of 1. This
+rewrites the graph input/output batch dim to a symbolic 'batch' and patches the
+detect head's Reshape targets so they copy the batch size from their input.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+def make_batch_dynamic(model):
+    """Rewrite a static batch-1 YOLOv5 graph in place to accept any batch size"""
+    import numpy as np
+    from onnx import numpy_helper
+
+    graph = model.graph
+
+    # Mark batch dimension symbolic on graph inputs and outputs
+    for value in list(graph.input) + list(graph.output):
+        dims = value.type.tensor_type.shape.dim
+        if dims and dims[0].dim_value == 1:
+            dims[0].Clear()
+            dims[0].dim_param = 'batch'
+
+    # Reshape targets like [1, 3, 85, H, W] / [1, -1, 85] have the batch baked in;
+    # 0 tells Reshape to copy that dimension from its input instead.
+    constants = {}
+    for node in graph.node:
+        if node.op_type == 'Constant':
+            for attr in node.attribute:
+                if attr.name == 'value':
+                    constants[node.output[0]] = attr
+    initializers = {init.name: init for init in graph.initializer}
+
+    patched = 0
+    for node in graph.node:
+        if node.op_type != 'Reshape':
+            continue
+        shape_name = node.input[1]
+        if shape_name in constants:
+            tensor = constants[shape_name].t
+        elif shape_name in initializers:
+            tensor = initializers[shape_name]
+        else:
+            continue
+
+        shape = numpy_helper.to_array(tensor).copy()
+        if shape.ndim == 1 and len(shape) > 0 and shape[0] == 1:
+            shape[0] = 0
+            tensor.CopyFrom(numpy_helper.from_array(shape.astype(np.int64), tensor.name))
+            patched += 1
+
+    # Drop stale intermediate shapes so ORT re-infers them
+    del graph.value_info[:]
+
+    return patched
+
+def verify(output_path, batch_size):
+    """Run the exported model at batch 1 and batch N to confirm it works"""
+    import numpy as np
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(str(output_path), providers=['CPUExecutionProvider'])
+    input_details = session.get_inputs()[0]
+    _, channels, height, width = input_details.shape
+    dtype = np.float16 if input_details.type == 'tensor(float16)' else np.float32
+
+    for n in (1, batch_size):
+        batch = np.random.rand(n, channels, height, width).astype(dtype)
+        output = session.run(None, {input_details.name: batch})[0]
+        if output.shape[0] != n:
+            raise RuntimeError(f"Expected output batch {n}, got {output.shape}")
+        print(f"✅ Batch {n}: output shape {output.shape}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a dynamic-batch YOLOv5 ONNX model")
+    parser.add_argument('--input', default='models/yolov5n.onnx', help='Source ONNX model')
+    parser.add_argument('--output', default='models/yolov5n_dynamic.onnx', help='Destination ONNX model')
+    parser.add_argument('--verify-batch', type=int, default=8, help='Batch size used to verify the export')
+    args = parser.parse_args()
+
+    try:
+        import onnx
+    except ImportError:
+        print("❌ The 'onnx' package is required: pip install onnx")
+        sys.exit(1)
+
+    input_path = Path(args.input)
+    output_path = Path(args.output)
+    if not input_path.exists():
+        print(f"❌ Model not found: {input_path}")
+        sys.exit(1)
+
+    print(f"📦 Loading {input_path}")
+    model = onnx.load(str(input_path))
+    patched = make_batch_dynamic(model)
+    print(f"🔧 Patched {patched} Reshape nodes")
+
+    onnx.checker.check_model(model)
+    onnx.save(model, str(output_path))
+    print(f"💾 Saved {output_path}")
+
+    verify(output_path, args.verify_batch)
+    print(f"\n💡 Start the server with MODEL_PATH={output_path} BATCHING=true")
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ class WebRTCDetectionApp {
         this.connectionStatus = document.getElementById('connection-status');
         
         this.peerConnection = null;
+        this.detectionChannel = null;
         this.websocket = null;
         this.localStream = null;
         
@@ -29,6 +30,26 @@ class WebRTCDetectionApp {
         // WASM inference (if in WASM mode)
         this.wasmModel = null;
         this.inferenceMode = 'wasm'; // Will be set by server
+        this.binaryFrames = true; // Send server-mode frames as header + raw JPEG
+        this.binaryResults = true; // Ask for detections as fixed-size binary records
+        this.classTable = null; // Class names binary records index into
+        this.deltaUpdates = true; // With JSON results, ask for adds/moves/removes instead of full lists
+        this.deltaObjects = new Map(); // Object id -> detection, as of deltaSeq
+        this.deltaSeq = null;
+        this.stageSpans = false; // Ask for per-stage server timings (ms) with each JSON result
+        
+        // Server-mode pacing: back off when the server drops frames, recover on results
+        this.minFrameInterval = 1000 / 15;
+        this.maxFrameInterval = 500;
+        this.frameInterval = this.minFrameInterval;
+        this.framesDropped = 0;
+        this.lastDetectionCaptureTs = 0;
+        this.serverVideoSource = 'websocket'; // 'webrtc' once the server infers from our video track
+        this.captureWidth = 320; // Low resolution for processing; the server may change it
+        this.captureHeight = 240;
+        this.jpegQuality = 0.8;
+        this.streamLimits = null; // Admission control's fair share for this stream
+        this.captureTargets = null; // Server's latency-driven capture targets
         
         this.init();
     }
@@ -65,15 +86,14 @@ class WebRTCDetectionApp {
         console.log('🔌 Connecting to WebSocket:', wsUrl);
         
         this.websocket = new WebSocket(wsUrl);
+        this.websocket.binaryType = 'arraybuffer';
         
         this.websocket.onopen = () => {
             console.log('✅ WebSocket connected');
             this.updateConnectionStatus('connected', '🟢 Connected');
         };
         
-        this.websocket.onmessage = (event) => {
-            this.handleWebSocketMessage(JSON.parse(event.data));
-        };
+        this.websocket.onmessage = (event) => this.handleIncoming(event.data);
         
         this.websocket.onclose = () => {
             console.log('❌ WebSocket disconnected');
@@ -94,6 +114,63 @@ class WebRTCDetectionApp {
         this.connectionStatus.textContent = text;
     }
 
+    handleIncoming(data) {
+        // Text is JSON; binary is a detections message (server/frame_protocol.py)
+        if (data instanceof ArrayBuffer) {
+            const detections = this.unpackDetections(data);
+            if (detections) {
+                this.handleDetections(detections);
+            }
+            return;
+        }
+        this.handleWebSocketMessage(JSON.parse(data));
+    }
+
+    unpackDetections(buffer) {
+        // Header <BBBBIdddHH (36 bytes), then <BBHHHHH records (12 bytes), little-endian
+        const view = new DataView(buffer);
+        if (!this.classTable || view.getUint8(0) !== 1 || view.getUint8(1) !== 1) {
+            return null;
+        }
+        
+        const flags = view.getUint8(2);
+        const count = view.getUint16(32, true);
+        const recordSize = view.getUint16(34, true);
+        const detections = [];
+        for (let i = 0, offset = 36; i < count; i++, offset += recordSize) {
+            const classId = view.getUint8(offset);
+            const trackId = view.getUint16(offset + 10, true);
+            const detection = {
+                label: this.classTable[classId] || 'unknown',
+                score: view.getUint8(offset + 1) / 255,
+                xmin: view.getUint16(offset + 2, true) / 65535,
+                ymin: view.getUint16(offset + 4, true) / 65535,
+                xmax: view.getUint16(offset + 6, true) / 65535,
+                ymax: view.getUint16(offset + 8, true) / 65535
+            };
+            if (trackId) {
+                detection.track_id = trackId;
+            }
+            detections.push(detection);
+        }
+        
+        const data = {
+            type: 'detections',
+            frame_id: view.getUint32(4, true),
+            capture_ts: view.getFloat64(8, true),
+            recv_ts: view.getFloat64(16, true),
+            inference_ts: view.getFloat64(24, true),
+            detections: detections
+        };
+        if (flags & 0x01) {
+            data.keyframe = Boolean(flags & 0x02);
+        }
+        if (flags & 0x04) {
+            data.cached = Boolean(flags & 0x08);
+        }
+        return data;
+    }
+
     async handleWebSocketMessage(data) {
         switch (data.type) {
             case 'answer':
@@ -106,16 +183,57 @@ class WebRTCDetectionApp {
                 break;
                 
             case 'detections':
+                if (data.sync) {
+                    this.deltaObjects = new Map(data.detections.map(d => [d.id, d]));
+                    this.deltaSeq = data.seq;
+                }
                 this.handleDetections(data);
                 break;
                 
+            case 'detections-delta':
+                this.handleDetectionsDelta(data);
+                break;
+                
+            case 'video-source':
+                this.serverVideoSource = data.source;
+                console.log(`🎥 Server video source: ${this.serverVideoSource}`);
+                break;
+                
+            case 'frame-dropped':
+                this.handleFrameDropped(data);
+                break;
+                
             case 'metrics':
                 this.displayMetrics(data.data);
                 break;
                 
+            case 'class-table':
+                this.classTable = data.classes;
+                console.log(`📇 Binary results enabled (${this.classTable.length} classes)`);
+                break;
+                
+            case 'stream-limits':
+                this.handleStreamLimits(data);
+                break;
+                
+            case 'capture-control':
+                this.handleCaptureControl(data);
+                break;
+                
             case 'config':
                 this.inferenceMode = data.mode || 'wasm';
                 console.log(`🧠 Inference mode: ${this.inferenceMode}`);
+                if (data.admission === 'reject') {
+                    console.warn('🚦 Server is at capacity; running inference in the browser');
+                }
+                if (this.inferenceMode === 'server' && this.binaryResults) {
+                    this.websocket.send(JSON.stringify({ type: 'set-encoding', encoding: 'binary' }));
+                } else if (this.inferenceMode === 'server' && this.deltaUpdates) {
+                    this.websocket.send(JSON.stringify({ type: 'set-updates', mode: 'delta' }));
+                }
+                if (this.inferenceMode === 'server' && this.stageSpans && !this.binaryResults) {
+                    this.websocket.send(JSON.stringify({ type: 'set-tracing', spans: true }));
+                }
                 if (this.inferenceMode === 'wasm') {
                     await this.initWasmInference();
                 }
@@ -239,6 +357,16 @@ class WebRTCDetectionApp {
             this.peerConnection.addTrack(track, this.localStream);
         });
         
+        // Detections come back unordered with no retransmits; ids match server/webrtc_handler.py
+        this.detectionChannel = this.peerConnection.createDataChannel('detections', {
+            ordered: false,
+            maxRetransmits: 0,
+            negotiated: true,
+            id: 1
+        });
+        this.detectionChannel.binaryType = 'arraybuffer';
+        this.detectionChannel.onmessage = (event) => this.handleIncoming(event.data);
+        
         // Handle ICE candidates
         this.peerConnection.onicecandidate = (event) => {
             if (event.candidate && this.websocket.readyState === WebSocket.OPEN) {
@@ -308,14 +436,20 @@ class WebRTCDetectionApp {
                 return;
             }
             
+            if (this.inferenceMode === 'server' && this.serverVideoSource === 'webrtc') {
+                // Server reads the WebRTC track itself; no JPEG re-encode needed
+                setTimeout(() => requestAnimationFrame(processFrame), this.frameInterval);
+                return;
+            }
+            
             try {
                 const captureTs = Date.now();
                 const currentFrameId = `frame_${frameId++}`;
                 
                 // Capture frame from video
                 const canvas = document.createElement('canvas');
-                canvas.width = 320; // Low resolution for processing
-                canvas.height = 240;
+                canvas.width = this.captureWidth;
+                canvas.height = this.captureHeight;
                 const ctx = canvas.getContext('2d');
                 ctx.drawImage(this.localVideo, 0, 0, canvas.width, canvas.height);
                 
@@ -334,9 +468,16 @@ class WebRTCDetectionApp {
                         detections: detections
                     });
                     
+                } else if (this.inferenceMode === 'server' && this.binaryFrames) {
+                    // Server-side inference, binary frame: no base64, no JSON
+                    canvas.toBlob(async (blob) => {
+                        if (!blob || this.websocket.readyState !== WebSocket.OPEN) return;
+                        this.websocket.send(await this.packBinaryFrame(frameId - 1, captureTs, blob));
+                    }, 'image/jpeg', this.jpegQuality);
+                    
                 } else if (this.inferenceMode === 'server') {
                     // Server-side inference
-                    const imageDataUrl = canvas.toDataURL('image/jpeg', 0.8);
+                    const imageDataUrl = canvas.toDataURL('image/jpeg', this.jpegQuality);
                     
                     // Send frame to server
                     if (this.websocket.readyState === WebSocket.OPEN) {
@@ -350,7 +491,7 @@ class WebRTCDetectionApp {
                 }
                 
                 // Limit processing rate
-                setTimeout(() => requestAnimationFrame(processFrame), 1000 / 15); // 15 FPS
+                setTimeout(() => requestAnimationFrame(processFrame), this.frameInterval); // 15 FPS unless backing off
                 
             } catch (error) {
                 console.error('❌ Frame processing error:', error);
@@ -361,9 +502,100 @@ class WebRTCDetectionApp {
         processFrame();
     }
 
+    async packBinaryFrame(frameId, captureTs, blob) {
+        // Header layout matches server/frame_protocol.py: <BBHId (16 bytes, little-endian)
+        const headerSize = 16;
+        const payload = new Uint8Array(await blob.arrayBuffer());
+        const message = new Uint8Array(headerSize + payload.length);
+        const view = new DataView(message.buffer);
+        
+        view.setUint8(0, 1);                 // version
+        view.setUint8(1, 0);                 // flags
+        view.setUint16(2, headerSize, true); // header length
+        view.setUint32(4, frameId, true);    // frame_id
+        view.setFloat64(8, captureTs, true); // capture_ts (ms)
+        message.set(payload, headerSize);
+        
+        return message.buffer;
+    }
+
+    handleStreamLimits(data) {
+        // Server's fair share for this stream: never send faster, cap capture size if asked
+        this.streamLimits = data;
+        this.applyCaptureTargets();
+    }
+
+    handleCaptureControl(data) {
+        // Server's closed-loop targets, held under its end-to-end latency SLO
+        this.captureTargets = data;
+        this.applyCaptureTargets();
+    }
+
+    applyCaptureTargets() {
+        const targets = this.captureTargets || { width: 320, height: 240, fps: 15, jpeg_quality: 0.8 };
+        const limits = this.streamLimits || {};
+        const fps = Math.min(targets.fps, limits.fps || targets.fps);
+        const width = Math.min(targets.width, limits.max_width || targets.width);
+        
+        this.minFrameInterval = 1000 / fps;
+        this.frameInterval = this.minFrameInterval;
+        this.captureWidth = width;
+        this.captureHeight = Math.round(width * targets.height / targets.width);
+        this.jpegQuality = targets.jpeg_quality;
+        
+        // When the server reads our WebRTC track, shape the track itself
+        if (this.serverVideoSource === 'webrtc' && this.localStream) {
+            const [track] = this.localStream.getVideoTracks();
+            if (track) {
+                track.applyConstraints({
+                    width: { ideal: this.captureWidth },
+                    height: { ideal: this.captureHeight },
+                    frameRate: { ideal: fps }
+                }).catch(error => console.warn('⚠️ Could not apply capture constraints:', error));
+            }
+        }
+        console.log(`🎛️ Capture ${this.captureWidth}x${this.captureHeight} @ ${fps.toFixed(1)} fps, JPEG ${this.jpegQuality}`);
+    }
+
+    handleFrameDropped(data) {
+        // Server skipped a frame (superseded by a newer one, or overloaded): slow down
+        this.framesDropped++;
+        this.frameInterval = Math.min(this.maxFrameInterval, this.frameInterval * 1.25);
+    }
+
+    handleDetectionsDelta(data) {
+        // Deltas only apply on top of the set they were computed against
+        if (data.base !== this.deltaSeq) {
+            if (this.deltaSeq !== null) {
+                this.websocket.send(JSON.stringify({ type: 'request-keyframe' }));
+                this.deltaSeq = null;
+            }
+            return;
+        }
+        
+        for (const detection of data.added.concat(data.moved)) {
+            this.deltaObjects.set(detection.id, detection);
+        }
+        for (const id of data.removed) {
+            this.deltaObjects.delete(id);
+        }
+        this.deltaSeq = data.seq;
+        
+        this.handleDetections({ ...data, type: 'detections', detections: Array.from(this.deltaObjects.values()) });
+    }
+
     handleDetections(data) {
         const displayTs = Date.now();
         
+        // Unordered delivery: never let an older result overwrite a newer overlay
+        if (data.capture_ts < this.lastDetectionCaptureTs) {
+            return;
+        }
+        this.lastDetectionCaptureTs = data.capture_ts;
+        
+        // Results are flowing again: ease back toward the target rate
+        this.frameInterval = Math.max(this.minFrameInterval, this.frameInterval * 0.95);
+        
         // Store detections
         this.detections.set(data.frame_id, {
             ...data,
@@ -389,6 +621,9 @@ class WebRTCDetectionApp {
         
         const e2eLatency = displayTs - data.capture_ts;
         this.metrics.latencies.push(e2eLatency);
+        if (data.spans) {
+            this.metrics.stageSpans = data.spans; // Latest frame's server stages
+        }
         
         // Keep only recent latencies
         if (this.metrics.latencies.length > 100) {
@@ -544,6 +779,7 @@ class WebRTCDetectionApp {
         if (this.peerConnection) {
             this.peerConnection.close();
             this.peerConnection = null;
+            this.detectionChannel = null;
         }
         
         // Clear video and canvas
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Produce INT8 quantized variants of a YOLOv5 ONNX model and compare them against FP32
+
+Writes models/<stem>_fp32.onnx, <stem>_int8_dynamic.onnx and <stem>_int8_static.onnx
+(static calibrated on a local image folder), benchmarks each through the same
+InferenceEngine path the server uses, and writes a latency / agreement report.
+Quantized files land in models/, so the model registry serves them by name.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'server'))
+
+from inferencr_engine import InferenceEngine
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+def load_images(folder, limit, seed=0):
+    """RGB images from a folder, or random frames when no folder is given"""
+    if folder:
+        paths = sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:limit]
+        images = []
+        for path in paths:
+            img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if img is not None:
+                images.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        if images:
+            return images
+        print(f"⚠️ No readable images in {folder}, falling back to random frames")
+
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(min(limit, 16))]
+
+def convert_to_fp32(input_path, output_path):
+    """Quantization needs an FP32 graph; the stock export is FP16"""
+    import onnx
+    from onnx import TensorProto, numpy_helper
+
+    model = onnx.load(str(input_path))
+    graph = model.graph
+
+    def upcast(tensor):
+        if tensor.data_type == TensorProto.FLOAT16:
+            tensor.CopyFrom(numpy_helper.from_array(numpy_helper.to_array(tensor).astype(np.float32), tensor.name))
+
+    for init in graph.initializer:
+        upcast(init)
+    for node in graph.node:
+        for attr in node.attribute:
+            if attr.type == onnx.AttributeProto.TENSOR:
+                upcast(attr.t)
+            if node.op_type == 'Cast' and attr.name == 'to' and attr.i == TensorProto.FLOAT16:
+                attr.i = TensorProto.FLOAT
+    for value in list(graph.input) + list(graph.output) + list(graph.value_info):
+        if value.type.tensor_type.elem_type == TensorProto.FLOAT16:
+            value.type.tensor_type.elem_type = TensorProto.FLOAT
+
+    onnx.checker.check_model(model)
+    onnx.save(model, str(output_path))
+
+class ImageCalibrationReader:
+    """Feeds letterboxed calibration frames, preprocessed exactly like the server"""
+
+    def __init__(self, engine, images):
+        self.engine = engine
+        self.images = iter(images)
+
+    def get_next(self):
+        img = next(self.images, None)
+        if img is None:
+            return None
+        batch = np.empty((1, 3, self.engine.input_size[1], self.engine.input_size[0]), dtype=np.float32)
+        self.engine._preprocess_image(img, out=batch[0])
+        return {self.engine.input_name: batch}
+
+    def rewind(self):
+        pass
+
+def detect_head_nodes(model_path):
+    """Non-conv nodes of the YOLOv5 detect head; quantizing the box decode hurts accuracy"""
+    import onnx
+
+    model = onnx.load(str(model_path))
+    return [node.name for node in model.graph.node if node.name.startswith('/model.24/') and node.op_type != 'Conv']
+
+def quantize_variants(fp32_path, output_dir, stem, calibration_images):
+    """Write dynamic and static INT8 variants; returns {name: path}"""
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    variants = {}
+
+    dynamic_path = output_dir / f"{stem}_int8_dynamic.onnx"
+    quantize_dynamic(str(fp32_path), str(dynamic_path), weight_type=QuantType.QUInt8)
+    variants['int8_dynamic'] = dynamic_path
+    print(f"💾 Dynamic INT8: {dynamic_path}")
+
+    static_path = output_dir / f"{stem}_int8_static.onnx"
+    calibration_engine = InferenceEngine(mode="server", max_workers=0, model_path=fp32_path)
+    quantize_static(
+        str(fp32_path), str(static_path),
+        ImageCalibrationReader(calibration_engine, calibration_images),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=detect_head_nodes(fp32_path)
+    )
+    variants['int8_static'] = static_path
+    print(f"💾 Static INT8 ({len(calibration_images)} calibration frames): {static_path}")
+
+    return variants
+
+def box_iou(a, b):
+    """IoU of two detection dicts"""
+    x1, y1 = max(a['xmin'], b['xmin']), max(a['ymin'], b['ymin'])
+    x2, y2 = min(a['xmax'], b['xmax']), min(a['ymax'], b['ymax'])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = ((a['xmax'] - a['xmin']) * (a['ymax'] - a['ymin'])
+             + (b['xmax'] - b['xmin']) * (b['ymax'] - b['ymin']) - intersection)
+    return intersection / union if union > 0 else 0.0
+
+def agreement(reference, candidate, iou_threshold=0.5):
+    """F1 of greedy same-label matches between two detection lists"""
+    if not reference and not candidate:
+        return 1.0
+    unmatched = list(candidate)
+    matches = 0
+    for ref in reference:
+        best = max(
+            (det for det in unmatched if det['label'] == ref['label']),
+            key=lambda det: box_iou(ref, det), default=None
+        )
+        if best is not None and box_iou(ref, best) >= iou_threshold:
+            matches += 1
+            unmatched.remove(best)
+    return 2 * matches / (len(reference) + len(candidate))
+
+def benchmark(model_path, images, warmup, intra_op_threads):
+    """Latency and detections through InferenceEngine._detect_sync"""
+    engine = InferenceEngine(mode="server", max_workers=0, model_path=model_path, intra_op_threads=intra_op_threads)
+    engine.warmup(warmup)
+
+    latencies = []
+    outputs = []
+    for img in images:
+        start = time.perf_counter()
+        outputs.append(engine._detect_sync(img))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'mean_ms': float(np.mean(latencies)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'throughput_fps': 1000.0 / float(np.mean(latencies)),
+        'size_mb': model_path.stat().st_size / (1024 * 1024)
+    }, outputs
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize a YOLOv5 ONNX model to INT8 and compare against FP32")
+    parser.add_argument('--input', default='models/yolov5n.onnx', help='Source ONNX model (FP16 or FP32)')
+    parser.add_argument('--output-dir', default='models', help='Where quantized variants are written')
+    parser.add_argument('--calibration-dir', default=None, help='Folder of images for static calibration')
+    parser.add_argument('--calibration-count', type=int, default=100, help='Max calibration images')
+    parser.add_argument('--eval-dir', default=None, help='Folder of images for the comparison (defaults to calibration set)')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--intra-op-threads', type=int, default=4)
+    parser.add_argument('--report', default='metrics/quantization_report.json')
+    args = parser.parse_args()
+
+    try:
+        import onnx  # noqa: F401
+        import onnxruntime.quantization  # noqa: F401
+    except ImportError:
+        print("❌ The 'onnx' package and onnxruntime quantization tools are required: pip install onnx")
+        sys.exit(1)
+
+    input_path = Path(args.input)
+    output_dir = Path(args.output_dir)
+    if not input_path.exists():
+        print(f"❌ Model not found: {input_path}")
+        sys.exit(1)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stem = input_path.stem
+
+    fp32_path = output_dir / f"{stem}_fp32.onnx"
+    convert_to_fp32(input_path, fp32_path)
+    print(f"💾 FP32 baseline: {fp32_path}")
+
+    calibration_images = load_images(args.calibration_dir, args.calibration_count)
+    eval_images = load_images(args.eval_dir, args.calibration_count) if args.eval_dir else calibration_images
+
+    variants = {'fp32': fp32_path}
+    variants.update(quantize_variants(fp32_path, output_dir, stem, calibration_images))
+
+    print(f"\n⏱️ Benchmarking {len(eval_images)} frames per variant...")
+    results = {}
+    reference = None
+    for name, path in variants.items():
+        stats, outputs = benchmark(path, eval_images, args.warmup, args.intra_op_threads)
+        if reference is None:
+            reference = outputs
+        stats['detection_agreement'] = float(np.mean([agreement(r, c) for r, c in zip(reference, outputs)]))
+        stats['model'] = path.name
+        results[name] = stats
+
+    report = {
+        'source_model': str(input_path),
+        'eval_frames': len(eval_images),
+        'calibration_frames': len(calibration_images),
+        'synthetic_frames': args.eval_dir is None and args.calibration_dir is None,
+        'variants': results
+    }
+    report_path = Path(args.report)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n   {'variant':<14}{'mean ms':>10}{'p95 ms':>10}{'fps':>8}{'MB':>7}{'agree':>8}")
+    for name, stats in results.items():
+        print(f"   {name:<14}{stats['mean_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['throughput_fps']:>8.1f}"
+              f"{stats['size_mb']:>7.1f}{stats['detection_agreement']:>8.2f}")
+    print(f"\n📊 Report written to {report_path}")
+    print(f"💡 Serve a variant with DEFAULT_MODEL={stem}_int8_static (or select-model per connection)")
+
+if __name__ == "__main__":
+    main()
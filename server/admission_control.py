@@ -0,0 +1,76 @@
+"""
+Admission control for server-mode streams
+Turns live inference load (queue depth, recent server-latency p95) into a
+decision for each new stream and a fair-share frame rate for admitted ones
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AdmissionController:
+    def __init__(self, max_streams=8, capacity_fps=30.0, target_p95_ms=200.0, max_fps=15.0, min_fps=2.0,
+                 downgrade_width=240, reject_load=1.5, fallback='wasm'):
+        self.max_streams = max_streams  # Hard cap on admitted server-mode streams
+        self.capacity_fps = capacity_fps  # Frames per second the node sustains across all streams
+        self.target_p95_ms = target_p95_ms  # Server latency p95 at which the node counts as saturated
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.downgrade_width = downgrade_width  # Capture width cap for downgraded streams
+        self.reject_load = reject_load  # Load past which new streams are turned away
+        self.fallback = fallback  # 'wasm' (infer on the client) or 'reject' (close the socket)
+
+        self.decisions = {'accept': 0, 'downgrade': 0, 'reject': 0}
+
+    def load(self, queue_depth, max_queue, server_p95_ms):
+        """Saturation: 1.0 means the inference queue is full or p95 is at target"""
+        return max(queue_depth / max(1, max_queue), server_p95_ms / self.target_p95_ms)
+
+    def decide(self, streams, load):
+        """
+        What to do with a new stream
+        Returns:
+            'accept', 'downgrade' (lower fps and resolution) or 'reject'
+        """
+        if streams >= self.max_streams or load >= self.reject_load:
+            decision = 'reject'
+        elif load >= 1.0:
+            decision = 'downgrade'
+        else:
+            decision = 'accept'
+        self.decisions[decision] += 1
+        return decision
+
+    def fair_share_fps(self, streams, load):
+        """Per-stream frame rate that splits capacity evenly, backed off while saturated"""
+        fps = self.capacity_fps / max(1, streams)
+        if load > 1.0:
+            fps /= load
+        return min(self.max_fps, max(self.min_fps, fps))
+
+    def limits(self, streams, load, downgraded=False):
+        """Frame rate and capture size a stream should send at"""
+        fps = self.fair_share_fps(streams, load)
+        if downgraded:
+            fps = max(self.min_fps, fps / 2)
+        # Half-fps steps so small load wobble does not re-send limits
+        fps = max(self.min_fps, round(fps * 2) / 2)
+        return {'fps': fps, 'max_width': self.downgrade_width if downgraded else None}
+
+    def status(self, streams, load):
+        """Node status for a front load balancer"""
+        if streams >= self.max_streams or load >= self.reject_load:
+            state = 'full'
+        elif load >= 1.0:
+            state = 'degraded'
+        else:
+            state = 'accepting'
+        return {
+            'status': state,
+            'accepting': state != 'full',
+            'streams': streams,
+            'max_streams': self.max_streams,
+            'load': load,
+            'fair_share_fps': self.fair_share_fps(streams + 1, load),
+            'decisions': dict(self.decisions)
+        }
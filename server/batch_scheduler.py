@@ -0,0 +1,129 @@
+"""
+Batch Scheduler for server-mode inference
+Collects frames from many WebSocket clients and runs them as one batched tensor
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class BatchScheduler:
+    def __init__(self, inference_engine, max_batch_size=8, max_delay_ms=10, metrics_collector=None):
+        self.inference_engine = inference_engine
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_delay = max_delay_ms / 1000.0
+        self.metrics_collector = metrics_collector
+
+        # Pending frames: (image_data, engine, future, enqueue_time, trace)
+        self.queue = asyncio.Queue()
+        self.collecting = []  # Frames taken off the queue for the batch still being assembled
+        self.batch_task = None
+        self.running_batches = set()
+
+        logger.info(f"📦 Batch scheduler initialized (max_batch={self.max_batch_size}, max_delay={max_delay_ms}ms)")
+
+    def start(self):
+        """Start the background batching loop"""
+        if self.batch_task is None:
+            self.batch_task = asyncio.create_task(self._batch_loop())
+
+    async def stop(self):
+        """Stop the batching loop and fail any pending frames"""
+        if self.batch_task is not None:
+            self.batch_task.cancel()
+            try:
+                await self.batch_task
+            except asyncio.CancelledError:
+                pass
+            self.batch_task = None
+
+        pending, self.collecting = self.collecting, []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for _, engine, future, _, _ in pending:
+            engine.frames_scheduled -= 1
+            if not future.done():
+                future.set_result(None)
+
+    async def submit(self, image_data, engine=None, trace=None):
+        """
+        Queue a frame for batched inference
+        Args:
+            engine: Engine to run on (defaults to the scheduler's engine); frames
+                for different engines are batched separately
+            trace: Optional FrameTrace; gets a 'batch_wait' span plus the engine's stages
+        Returns:
+            List of detection dictionaries for this frame, or None if dropped
+        """
+        self.start()
+        engine = engine or self.inference_engine
+        future = asyncio.get_running_loop().create_future()
+        # Counted against the engine so a hot swap does not close it under a pending batch
+        engine.frames_scheduled += 1
+        await self.queue.put((image_data, engine, future, time.perf_counter(), trace))
+        return await future
+
+    async def _batch_loop(self):
+        """Collect frames up to max_batch_size or max_delay, then dispatch"""
+        while True:
+            batch = self.collecting = [await self.queue.get()]
+            deadline = batch[0][3] + self.max_delay
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # One batch per engine; dispatch without waiting so the next can fill
+            self.collecting = []
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item[1]), []).append(item)
+            for group in groups.values():
+                task = asyncio.create_task(self._run_batch(group))
+                self.running_batches.add(task)
+                task.add_done_callback(self.running_batches.discard)
+
+    async def _run_batch(self, batch):
+        """Run one batch through the engine and route results to each waiter"""
+        dispatch_time = time.perf_counter()
+        queue_delays_ms = [(dispatch_time - enqueued) * 1000 for _, _, _, enqueued, _ in batch]
+        engine = batch[0][1]
+
+        if self.metrics_collector is not None:
+            self.metrics_collector.record_batch(
+                len(batch), self.max_batch_size, sum(queue_delays_ms) / len(queue_delays_ms)
+            )
+
+        traces = [trace for _, _, _, _, trace in batch]
+        for _, _, _, enqueued, trace in batch:
+            if trace is not None:
+                trace.add('batch_wait', enqueued, dispatch_time)
+
+        # detect_batch takes the frames into queue_depth before its first await
+        engine.frames_scheduled -= len(batch)
+        try:
+            results = await engine.detect_batch([image for image, _, _, _, _ in batch], traces)
+        except Exception as e:
+            logger.error(f"❌ Batch inference error: {e}")
+            results = None
+
+        for idx, (_, _, future, _, _) in enumerate(batch):
+            if future.done():
+                continue
+            future.set_result(results[idx] if results is not None else None)
+
+    def get_stats(self):
+        """Get scheduler state"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_delay_ms": self.max_delay * 1000,
+            "pending": self.queue.qsize(),
+            "running_batches": len(self.running_batches)
+        }
@@ -0,0 +1,100 @@
+"""
+Closed-loop capture controller for server-mode clients
+Adjusts a client's capture resolution, frame rate and JPEG quality from the
+latencies of its own recent frames to hold end-to-end latency under an SLO
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# (width, height, JPEG quality), cheapest first
+QUALITY_LADDER = (
+    (160, 120, 0.5),
+    (256, 192, 0.6),
+    (320, 240, 0.7),
+    (480, 360, 0.75),
+    (640, 480, 0.8)
+)
+
+class CaptureController:
+    def __init__(self, slo_ms=250.0, min_fps=2.0, max_fps=15.0, window=10, headroom=0.7, level=2):
+        self.slo_ms = slo_ms  # End-to-end latency to stay under
+        self.min_fps = min_fps
+        self.max_fps = max_fps  # Upper bound; admission control may lower it per stream
+        self.window = window  # Frames per control decision
+        self.headroom = headroom  # Fraction of the SLO below which the client may send more
+
+        self.level = min(max(level, 0), len(QUALITY_LADDER) - 1)
+        self.fps = max_fps
+        self.network_ms = []
+        self.server_ms = []
+        self.overloaded = 0
+        self.adjustments = 0
+
+    def record_frame(self, network_latency, server_latency):
+        """Add one inferred frame's latencies to the current window"""
+        self.network_ms.append(max(0.0, network_latency))
+        self.server_ms.append(max(0.0, server_latency))
+
+    def record_overload(self):
+        """A frame was dropped because inference was saturated"""
+        self.overloaded += 1
+
+    def targets(self):
+        """Current capture targets, as sent to the client"""
+        width, height, quality = QUALITY_LADDER[self.level]
+        return {'width': width, 'height': height, 'fps': self.fps, 'jpeg_quality': quality}
+
+    def update(self, fps_cap=None, max_width=None, queue_fill=0.0):
+        """
+        Make a control decision once a window of frames is in
+        Returns:
+            New targets if they changed, else None
+        """
+        if len(self.network_ms) + self.overloaded < self.window:
+            return None
+
+        previous = self.targets()
+        max_fps = min(self.max_fps, fps_cap) if fps_cap else self.max_fps
+        max_level = len(QUALITY_LADDER) - 1
+        if max_width:
+            max_level = max([0] + [i for i, (w, _, _) in enumerate(QUALITY_LADDER) if w <= max_width])
+
+        network = float(np.percentile(self.network_ms, 90)) if self.network_ms else 0.0
+        server = float(np.percentile(self.server_ms, 90)) if self.server_ms else self.slo_ms
+        # Results travel back over the same link, so count the network leg twice
+        latency = 2 * network + server
+
+        if latency > self.slo_ms or self.overloaded or queue_fill >= 0.5:
+            if network > server and self.level > 0:
+                # Link is the bottleneck: send smaller frames
+                self.level -= 1
+            else:
+                # Server is the bottleneck: send fewer frames
+                self.fps = self.fps * 0.75
+        elif latency < self.headroom * self.slo_ms:
+            # Headroom: useful fps first, then resolution
+            if self.fps < max_fps:
+                self.fps = self.fps + 1
+            elif self.level < max_level:
+                self.level += 1
+
+        self.fps = round(min(max_fps, max(self.min_fps, self.fps)), 1)
+        self.level = min(self.level, max_level)
+        self.network_ms.clear()
+        self.server_ms.clear()
+        self.overloaded = 0
+
+        current = self.targets()
+        if current == previous:
+            return None
+        self.adjustments += 1
+        logger.debug(f"🎛️ Capture targets {current} (p90 network {network:.0f}ms, server {server:.0f}ms)")
+        return current
+
+    def get_stats(self):
+        """Get controller state"""
+        return dict(self.targets(), level=self.level, adjustments=self.adjustments)
@@ -0,0 +1,150 @@
+"""
+Delta-encoded detection updates
+Keeps the detection set last sent to a connection and turns each new result
+into adds / moves / removes, with periodic full keyframes for resync
+"""
+
+import itertools
+import logging
+
+import numpy as np
+
+from object_tracker import box_iou_matrix
+
+logger = logging.getLogger(__name__)
+
+BOX_KEYS = ('xmin', 'ymin', 'xmax', 'ymax')
+
+class DetectionDeltaEncoder:
+    def __init__(self, move_threshold=0.01, keyframe_interval=30, iou_threshold=0.3):
+        self.move_threshold = move_threshold  # Normalized coordinate change that counts as a move
+        self.keyframe_interval = max(1, keyframe_interval)  # Results between full resyncs, sent or not
+        self.iou_threshold = iou_threshold  # Match threshold when detections carry no track_id
+
+        self.sent = {}  # object id -> detection as last sent
+        self.object_ids = itertools.count(1)
+        self.seq = 0
+        self.frames_since_keyframe = 0
+        self.force_keyframe = True
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.suppressed = 0
+
+    def request_keyframe(self):
+        """Resync on the next result (client saw a gap)"""
+        self.force_keyframe = True
+
+    def encode(self, response):
+        """
+        Turn a detections response into the message to send
+        Returns:
+            A full 'detections' message (sync=True), a 'detections-delta'
+            message, or None when nothing changed beyond the thresholds
+        """
+        current = self._assign_ids(response['detections'])
+        self.frames_since_keyframe += 1
+
+        if self.force_keyframe or self.frames_since_keyframe >= self.keyframe_interval:
+            return self._keyframe(response, current)
+
+        added, moved = [], []
+        for object_id, detection in current.items():
+            previous = self.sent.get(object_id)
+            if previous is None:
+                added.append(detection)
+            elif detection['label'] != previous['label'] or max(
+                    abs(detection[key] - previous[key]) for key in BOX_KEYS) > self.move_threshold:
+                moved.append(detection)
+        removed = [object_id for object_id in self.sent if object_id not in current]
+
+        if not added and not moved and not removed:
+            self.suppressed += 1
+            return None
+
+        for detection in added + moved:
+            self.sent[detection['id']] = detection
+        for object_id in removed:
+            del self.sent[object_id]
+
+        base = self.seq
+        self.seq += 1
+        self.deltas += 1
+        return self._message(response, {
+            'type': 'detections-delta',
+            'seq': self.seq,
+            'base': base,
+            'added': added,
+            'moved': moved,
+            'removed': removed
+        })
+
+    def _keyframe(self, response, current):
+        self.sent = current
+        self.seq += 1
+        self.frames_since_keyframe = 0
+        self.force_keyframe = False
+        self.keyframes += 1
+        return self._message(response, {
+            'type': 'detections',
+            'seq': self.seq,
+            'sync': True,
+            'detections': list(current.values())
+        })
+
+    @staticmethod
+    def _message(response, body):
+        """Carry the frame id, timestamps and tracker/gate flags over from the response"""
+        message = {key: value for key, value in response.items() if key not in ('type', 'detections')}
+        message.update(body)
+        return message
+
+    def _assign_ids(self, detections):
+        """Give each detection a stable object id: its track, else the best-overlapping sent box"""
+        current = {}
+        untracked = []
+        for detection in detections:
+            if 'track_id' in detection:
+                object_id = f"t{detection['track_id']}"
+                current[object_id] = dict(detection, id=object_id)
+            else:
+                untracked.append(detection)
+
+        if not untracked:
+            return current
+
+        candidates = [(object_id, sent) for object_id, sent in self.sent.items()
+                      if object_id not in current and not object_id.startswith('t')]
+        iou = box_iou_matrix(
+            np.array([[d[key] for key in BOX_KEYS] for d in untracked]).reshape(-1, 4),
+            np.array([[sent[key] for key in BOX_KEYS] for _, sent in candidates]).reshape(-1, 4)
+        )
+        for d, detection in enumerate(untracked):
+            for c, (_, sent) in enumerate(candidates):
+                if sent['label'] != detection['label']:
+                    iou[d, c] = 0.0
+
+        matched = {}
+        used = set()
+        for flat in np.argsort(iou, axis=None)[::-1]:
+            d, c = divmod(int(flat), iou.shape[1])
+            if iou[d, c] < self.iou_threshold:
+                break
+            if d in matched or c in used:
+                continue
+            matched[d] = candidates[c][0]
+            used.add(c)
+
+        for d, detection in enumerate(untracked):
+            object_id = matched.get(d) or f"d{next(self.object_ids)}"
+            current[object_id] = dict(detection, id=object_id)
+        return current
+
+    def get_stats(self):
+        """Get encoder counters"""
+        return {
+            "keyframes": self.keyframes,
+            "deltas": self.deltas,
+            "suppressed": self.suppressed,
+            "objects": len(self.sent)
+        }
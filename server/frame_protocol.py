@@ -0,0 +1,189 @@
+"""
+Binary frame protocol for server-mode WebSocket ingestion
+Frames arrive as a small fixed header followed by raw JPEG/WebP bytes; clients
+that opt in get detection results back as fixed-size binary records
+"""
+
+import struct
+
+import numpy as np
+
+# version (u8), flags (u8), header length (u16), frame_id (u32), capture_ts ms (f64)
+FRAME_HEADER = struct.Struct('<BBHId')
+FRAME_VERSION = 1
+
+def parse_binary_frame(data):
+    """
+    Split a binary WebSocket message into header fields and image payload
+    Returns:
+        (frame_id, capture_ts, payload) where payload is a zero-copy memoryview
+    """
+    if len(data) < FRAME_HEADER.size:
+        raise ValueError(f"Binary frame too short: {len(data)} bytes")
+
+    version, _flags, header_len, frame_id, capture_ts = FRAME_HEADER.unpack_from(data)
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported binary frame version: {version}")
+    if header_len < FRAME_HEADER.size or header_len >= len(data):
+        raise ValueError(f"Invalid binary frame header length: {header_len}")
+
+    return frame_id, int(capture_ts), memoryview(data)[header_len:]
+
+def pack_binary_frame(frame_id, capture_ts, payload):
+    """Build a binary frame message (used by benchmarks and test clients)"""
+    return FRAME_HEADER.pack(FRAME_VERSION, 0, FRAME_HEADER.size, frame_id, capture_ts) + bytes(payload)
+
+# version (u8), kind (u8), flags (u8), reserved (u8), frame_id (u32),
+# capture_ts / recv_ts / inference_ts ms (f64), record count (u16), record size (u16)
+DETECTIONS_HEADER = struct.Struct('<BBBBIdddHH')
+DETECTIONS_VERSION = 1
+DETECTIONS_KIND = 1
+
+# class id (u8), score * 255 (u8), xmin / ymin / xmax / ymax * 65535 (u16), track_id (u16, 0 = none)
+DETECTION_RECORD = struct.Struct('<BBHHHHH')
+DETECTION_RECORD_DTYPE = np.dtype([('class_id', 'u1'), ('score', 'u1'), ('box', '<u2', (4,)), ('track_id', '<u2')])
+assert DETECTION_RECORD_DTYPE.itemsize == DETECTION_RECORD.size
+UNKNOWN_CLASS = 255
+
+# Header flags
+FLAG_TRACKED = 0x01  # keyframe bit is meaningful
+FLAG_KEYFRAME = 0x02
+FLAG_GATED = 0x04  # cached bit is meaningful
+FLAG_CACHED = 0x08
+
+class DetectionList(list):
+    """Detection dicts that also carry their DETECTION_RECORD bytes, packed from the engine's arrays"""
+
+    def __init__(self, detections=(), records=None):
+        super().__init__(detections)
+        self.records = records
+
+def pack_detection_records(boxes, scores, class_ids):
+    """
+    DETECTION_RECORD bytes for a frame in one structured-array pass
+    Args:
+        boxes: [N, 4] normalized xyxy, scores: [N] in [0, 1], class_ids: [N] indices into the class table
+    """
+    if len(scores) < 8:
+        # Below NumPy's fixed per-call cost; same rounding as the array path
+        pack = DETECTION_RECORD.pack
+        return b''.join([
+            pack(class_id, int(score * 255 + 0.5),
+                 int(xmin * 65535 + 0.5), int(ymin * 65535 + 0.5),
+                 int(xmax * 65535 + 0.5), int(ymax * 65535 + 0.5), 0)
+            for (xmin, ymin, xmax, ymax), score, class_id
+            in zip(np.asarray(boxes, dtype=np.float64).tolist(), np.asarray(scores, dtype=np.float64).tolist(),
+                   np.asarray(class_ids).tolist())
+        ])
+
+    records = np.zeros(len(scores), DETECTION_RECORD_DTYPE)
+    records['class_id'] = class_ids
+    # Non-negative, so truncating x + 0.5 rounds, as in the per-dict path
+    records['score'] = np.asarray(scores, dtype=np.float64) * 255 + 0.5
+    records['box'] = np.asarray(boxes, dtype=np.float64) * 65535 + 0.5
+    return records.tobytes()
+
+def pack_detections(response, class_index):
+    """
+    Encode a detections response (the JSON message dict) as a binary message
+    Detections straight from the engine arrive as a DetectionList whose records
+    were packed from its arrays; anything rebuilt later (tracks) is packed per dict.
+    Args:
+        class_index: label -> class id, from the class table sent at handshake
+    """
+    detections = response['detections']
+    flags = 0
+    if 'keyframe' in response:
+        flags |= FLAG_TRACKED | (FLAG_KEYFRAME if response['keyframe'] else 0)
+    if 'cached' in response:
+        flags |= FLAG_GATED | (FLAG_CACHED if response['cached'] else 0)
+
+    header = DETECTIONS_HEADER.pack(
+        DETECTIONS_VERSION, DETECTIONS_KIND, flags, 0, response['frame_id'],
+        response['capture_ts'], response['recv_ts'], response['inference_ts'],
+        len(detections), DETECTION_RECORD.size
+    )
+    records = getattr(detections, 'records', None)
+    if records is not None:
+        return header + records
+
+    # Values are non-negative, so int(x + 0.5) rounds (and is cheaper than round())
+    pack = DETECTION_RECORD.pack
+    return header + b''.join([
+        pack(
+            class_index.get(d['label'], UNKNOWN_CLASS),
+            int(d['score'] * 255 + 0.5),
+            int(d['xmin'] * 65535 + 0.5), int(d['ymin'] * 65535 + 0.5),
+            int(d['xmax'] * 65535 + 0.5), int(d['ymax'] * 65535 + 0.5),
+            min(d.get('track_id', 0), 0xFFFF)
+        )
+        for d in detections
+    ])
+
+def unpack_detections(data, class_names):
+    """Decode a binary detections message back into the JSON message shape"""
+    (version, kind, flags, _, frame_id, capture_ts, recv_ts, inference_ts,
+     count, record_size) = DETECTIONS_HEADER.unpack_from(data)
+    if version != DETECTIONS_VERSION or kind != DETECTIONS_KIND:
+        raise ValueError(f"Unsupported detections message: version {version}, kind {kind}")
+
+    detections = []
+    offset = DETECTIONS_HEADER.size
+    for _ in range(count):
+        class_id, score, xmin, ymin, xmax, ymax, track_id = DETECTION_RECORD.unpack_from(data, offset)
+        offset += record_size
+        detection = {
+            'label': class_names[class_id] if class_id < len(class_names) else 'unknown',
+            'score': score / 255,
+            'xmin': xmin / 65535,
+            'ymin': ymin / 65535,
+            'xmax': xmax / 65535,
+            'ymax': ymax / 65535
+        }
+        if track_id:
+            detection['track_id'] = track_id
+        detections.append(detection)
+
+    response = {
+        'type': 'detections',
+        'frame_id': frame_id,
+        'capture_ts': capture_ts,
+        'recv_ts': recv_ts,
+        'inference_ts': inference_ts,
+        'detections': detections
+    }
+    if flags & FLAG_TRACKED:
+        response['keyframe'] = bool(flags & FLAG_KEYFRAME)
+    if flags & FLAG_GATED:
+        response['cached'] = bool(flags & FLAG_CACHED)
+    return response
+
+def jpeg_dimensions(data):
+    """
+    Read (width, height) from a JPEG's SOF marker without decoding
+    Returns None for non-JPEG or truncated data.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:  # Fill byte
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # Standalone markers
+            offset += 2
+            continue
+
+        segment_len = (data[offset + 2] << 8) | data[offset + 3]
+        # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (data[offset + 5] << 8) | data[offset + 6]
+            width = (data[offset + 7] << 8) | data[offset + 8]
+            return width, height
+        offset += 2 + segment_len
+
+    return None
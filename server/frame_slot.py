@@ -0,0 +1,42 @@
+"""
+Latest-frame-wins ingestion slot
+Holds at most one pending frame per connection; a newer frame replaces a stale one
+"""
+
+import asyncio
+
+class LatestFrameSlot:
+    def __init__(self):
+        self.pending = None
+        self.event = asyncio.Event()
+        self.closed = False
+        self.frames_accepted = 0
+        self.frames_dropped = 0
+
+    def put(self, frame):
+        """
+        Offer a frame; never blocks
+        Returns:
+            The frame that was displaced (now dropped), or None
+        """
+        dropped = self.pending
+        self.pending = frame
+        self.frames_accepted += 1
+        if dropped is not None:
+            self.frames_dropped += 1
+        self.event.set()
+        return dropped
+
+    async def get(self):
+        """Wait for the newest pending frame; None once closed"""
+        while self.pending is None and not self.closed:
+            self.event.clear()
+            await self.event.wait()
+        frame, self.pending = self.pending, None
+        return frame
+
+    def close(self):
+        """Wake the consumer so it can exit"""
+        self.closed = True
+        self.pending = None
+        self.event.set()
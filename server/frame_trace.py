@@ -0,0 +1,68 @@
+"""
+Per-frame pipeline tracing
+Lightweight spans (stage, start, end, thread) on the perf_counter clock, kept
+for every frame so stages can be aggregated, and exported for sampled frames
+in Chrome trace-event format (chrome://tracing, Perfetto, speedscope)
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+class FrameTrace:
+    """Spans of one frame through the pipeline"""
+
+    __slots__ = ('frame_id', 'sampled', 'start', 'spans')
+
+    def __init__(self, frame_id=None, sampled=False):
+        self.frame_id = frame_id
+        self.sampled = sampled  # Kept for trace export once finished
+        self.start = time.perf_counter()
+        self.spans = []  # (stage, start, end, native thread id); appended from worker threads too
+
+    def add(self, stage, start, end):
+        self.spans.append((stage, start, end, threading.get_native_id()))
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, start, time.perf_counter())
+
+    def durations(self):
+        """Milliseconds per stage, summed where a stage ran more than once"""
+        totals = {}
+        for stage, start, end, _ in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + (end - start) * 1000
+        return {stage: round(ms, 3) for stage, ms in totals.items()}
+
+def chrome_trace_events(traces, thread_names=None):
+    """
+    Complete ('X') events for finished traces, timestamps in microseconds
+    Each frame's spans keep their real thread, so overlapping frames on
+    different inference workers show up side by side.
+    """
+    pid = os.getpid()
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'detection-server'}}]
+    tids = set()
+    for trace in traces:
+        for stage, start, end, tid in trace.spans:
+            tids.add(tid)
+            events.append({
+                'name': stage,
+                'cat': 'frame',
+                'ph': 'X',
+                'ts': round(start * 1e6, 1),
+                'dur': round((end - start) * 1e6, 1),
+                'pid': pid,
+                'tid': tid,
+                'args': {'frame_id': trace.frame_id}
+            })
+    for tid in sorted(tids):
+        name = (thread_names or {}).get(tid)
+        if name:
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+    return events
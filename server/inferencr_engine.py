@@ -7,7 +7,10 @@ import asyncio
 import base64
 import io
 import logging
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import cv2
@@ -15,41 +18,97 @@ import numpy as np
 import onnxruntime as ort
 from PIL import Image
 
+from frame_protocol import DetectionList, jpeg_dimensions, pack_detection_records
+
 logger = logging.getLogger(__name__)
 
+# COCO class names (YOLOv5 default)
+COCO_CLASS_NAMES = (
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck',
+    'boat', 'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'bench',
+    'bird', 'cat', 'dog', 'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra',
+    'giraffe', 'backpack', 'umbrella', 'handbag', 'tie', 'suitcase', 'frisbee',
+    'skis', 'snowboard', 'sports ball', 'kite', 'baseball bat', 'baseball glove',
+    'skateboard', 'surfboard', 'tennis racket', 'bottle', 'wine glass', 'cup',
+    'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple', 'sandwich', 'orange',
+    'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch',
+    'potted plant', 'bed', 'dining table', 'toilet', 'tv', 'laptop', 'mouse',
+    'remote', 'keyboard', 'cell phone', 'microwave', 'oven', 'toaster', 'sink',
+    'refrigerator', 'book', 'clock', 'vase', 'scissors', 'teddy bear', 'hair drier',
+    'toothbrush'
+)
+
+def letterbox_geometry(input_size, src_w, src_h):
+    """Scale and padding that fit a source resolution into a (width, height) model input"""
+    input_w, input_h = input_size
+    ratio = min(input_w / src_w, input_h / src_h)
+    new_w, new_h = max(1, round(src_w * ratio)), max(1, round(src_h * ratio))
+    left, top = (input_w - new_w) // 2, (input_h - new_h) // 2
+    return ratio, new_w, new_h, left, top
+
 class InferenceEngine:
-    def __init__(self, mode="wasm"):
+    def __init__(self, mode="wasm", max_workers=2, max_queue=8, model_path="models/yolov5n.onnx",
+                 intra_op_threads=4, input_size=None):
         self.mode = mode.lower()
+        self.model_path = Path(model_path)
+        self.intra_op_threads = intra_op_threads
         self.session = None
-        self.input_size = (320, 240)  # Low-resource default
+        # Low-resource default; models with static spatial dims override it
+        self.input_size = tuple(input_size) if input_size else (320, 240)
+        self.input_dtype = np.float32
+        self.input_name = None
+        self.output_name = None
+        self.output_shape = None  # Per-frame output shape when static, enables IOBinding
+        self.output_dtype = np.float32
+        self.supports_batching = False
+        self.use_io_binding = True
+        self.letterbox_pad_value = 114 / 255.0  # YOLOv5 letterbox grey
+        self.reduced_decode = True  # Let libjpeg downscale 2/4/8x while decoding binary frames
         self.confidence_threshold = 0.5
         self.nms_threshold = 0.4
+        self.class_agnostic_nms = False  # True lets different classes suppress each other
+        self.pre_nms_top_k = 300  # Highest-scoring candidates considered by NMS
+        self.max_detections = 100  # Cap on boxes returned per frame
+        self.tile_overlap = 0.2  # Fraction of a tile shared with its neighbour in tiled mode
+        self.use_cv2_nms = hasattr(cv2, 'dnn') and hasattr(cv2.dnn, 'NMSBoxesBatched')
+        
+        # Off-loop execution: decode/preprocess/run/postprocess happen in a
+        # thread pool so the aiohttp event loop never blocks on a frame.
+        # max_workers=0 keeps the old inline behaviour.
+        self.max_workers = max_workers
+        self.max_queue = max(1, max_queue)
+        self.executor = None
+        self.queue_depth = 0  # Submitted and not yet finished
+        self.frames_scheduled = 0  # Held by a BatchScheduler for this engine, not yet submitted
+        self.leases = 0  # Frames that resolved this engine through ModelRegistry.acquire and have not finished
+        self.frames_waiting = 0  # Submitted and not yet started by a worker
+        self.frames_completed = 0
+        self.frames_rejected = 0
+        self.wait_times_ms = deque(maxlen=200)
+        self._stats_lock = threading.Lock()
+        self.stage_observer = None  # Optional callable(stage, seconds) for untraced jobs, called from worker threads
+        
+        # Preprocessing buffers are per worker thread and reused every frame;
+        # letterbox geometry is cached per source resolution.
+        self._local = threading.local()
+        self._letterbox_cache = {}
         
-        # COCO class names (YOLOv5 default)
-        self.class_names = [
-            'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck',
-            'boat', 'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'bench',
-            'bird', 'cat', 'dog', 'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra',
-            'giraffe', 'backpack', 'umbrella', 'handbag', 'tie', 'suitcase', 'frisbee',
-            'skis', 'snowboard', 'sports ball', 'kite', 'baseball bat', 'baseball glove',
-            'skateboard', 'surfboard', 'tennis racket', 'bottle', 'wine glass', 'cup',
-            'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple', 'sandwich', 'orange',
-            'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch',
-            'potted plant', 'bed', 'dining table', 'toilet', 'tv', 'laptop', 'mouse',
-            'remote', 'keyboard', 'cell phone', 'microwave', 'oven', 'toaster', 'sink',
-            'refrigerator', 'book', 'clock', 'vase', 'scissors', 'teddy bear', 'hair drier',
-            'toothbrush'
-        ]
+        self.class_names = list(COCO_CLASS_NAMES)
         
         if self.mode == "server":
             self._initialize_onnx_session()
+            if self.max_workers > 0:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="inference"
+                )
         
         logger.info(f"🧠 Inference engine initialized in {mode.upper()} mode")
 
     def _initialize_onnx_session(self):
         """Initialize ONNX Runtime session for server mode"""
         try:
-            model_path = Path("models/yolov5n.onnx")
+            model_path = self.model_path
             if not model_path.exists():
                 raise FileNotFoundError(f"Model not found: {model_path}")
             
@@ -57,7 +116,7 @@ class InferenceEngine:
             providers = ['CPUExecutionProvider']
             sess_options = ort.SessionOptions()
             sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-            sess_options.intra_op_num_threads = 4
+            sess_options.intra_op_num_threads = self.intra_op_threads
             
             self.session = ort.InferenceSession(
                 str(model_path), 
@@ -70,49 +129,178 @@ class InferenceEngine:
             input_shape = input_details.shape
             
             if len(input_shape) == 4:  # [batch, channels, height, width]
-                self.input_size = (input_shape[3], input_shape[2])  # (width, height)
+                if isinstance(input_shape[2], int) and isinstance(input_shape[3], int):
+                    self.input_size = (input_shape[3], input_shape[2])  # (width, height)
+                # Symbolic batch dim (e.g. 'batch') means the model was exported dynamic
+                self.supports_batching = not isinstance(input_shape[0], int)
+            
+            # Exported FP16 models reject float32 tensors
+            if input_details.type == 'tensor(float16)':
+                self.input_dtype = np.float16
+            self.input_name = input_details.name
+            
+            # IOBinding needs a known output shape to preallocate into
+            output_details = self.session.get_outputs()[0]
+            self.output_name = output_details.name
+            if output_details.type == 'tensor(float16)':
+                self.output_dtype = np.float16
+            if all(isinstance(dim, int) for dim in output_details.shape[1:]):
+                self.output_shape = tuple(output_details.shape[1:])
             
             logger.info(f"✅ ONNX model loaded: {model_path}")
             logger.info(f"📐 Input size: {self.input_size}")
+            logger.info(f"📦 Dynamic batch: {self.supports_batching}")
             
         except Exception as e:
             logger.error(f"❌ Failed to initialize ONNX session: {e}")
             raise
 
-    async def detect_objects(self, image_data):
+    async def detect_objects(self, image_data, trace=None):
         """
         Detect objects in image
         Args:
-            image_data: Base64 encoded image or numpy array
+            image_data: Encoded image bytes, base64 encoded image or numpy array
+            trace: Optional FrameTrace that receives this frame's stage spans
         Returns:
-            List of detection dictionaries
+            List of detection dictionaries, or None if the frame was
+            rejected because the inference queue is full
         """
         if self.mode == "wasm":
             # In WASM mode, detection happens client-side
             return []
         
+        if self.executor is None:
+            return self._run_traced(self._detect_sync, image_data, [trace])
+        
+        return await self._submit(self._detect_sync, image_data, [trace])
+
+    async def detect_batch(self, images, traces=None):
+        """
+        Detect objects in several frames with a single batched session.run
+        Args:
+            images: List of encoded image bytes, base64 encoded images or numpy arrays
+            traces: Optional FrameTrace per image; the shared session.run is added to each
+        Returns:
+            List of detection lists (one per image), or None if the batch was
+            rejected because the inference queue is full
+        """
+        if self.mode == "wasm":
+            return [[] for _ in images]
+        
+        if self.executor is None:
+            return self._run_traced(self._detect_batch_sync, images, traces)
+        
+        return await self._submit(self._detect_batch_sync, images, traces)
+
+    async def detect_regions(self, image_data, regions=None, tile_grid=None, include_full_frame=True, trace=None):
+        """
+        Detect objects at full resolution inside sub-regions of a frame
+        Crops are letterboxed into one batch, run with a single session.run and
+        merged with cross-region NMS, so small objects survive large frames.
+        Args:
+            regions: Normalized (xmin, ymin, xmax, ymax) regions of interest
+            tile_grid: (cols, rows) of overlapping tiles covering the frame
+            include_full_frame: Also run the whole frame, for objects larger than a crop
+            trace: Optional FrameTrace that receives this frame's stage spans
+        Returns:
+            List of detection dictionaries, or None if the frame was rejected
+        """
+        if self.mode == "wasm":
+            return []
+        
+        payload = (image_data, regions, tile_grid, include_full_frame)
+        if self.executor is None:
+            return self._run_traced(self._detect_regions_sync, payload, [trace])
+        
+        return await self._submit(self._detect_regions_sync, payload, [trace])
+
+    async def _submit(self, job, payload, traces=None):
+        """Run a blocking job on the bounded inference thread pool"""
+        if self.queue_depth >= self.max_queue:
+            self.frames_rejected += 1
+            logger.warning(f"⚠️ Inference queue full ({self.queue_depth}/{self.max_queue}), dropping frame")
+            return None
+        
+        self.queue_depth += 1
+        with self._stats_lock:
+            self.frames_waiting += 1
+        
+        try:
+            future = self.executor.submit(self._run_queued_job, job, payload, time.perf_counter(), traces)
+            future.add_done_callback(self._release_cancelled_job)
+            return await asyncio.wrap_future(future)
+        finally:
+            self.queue_depth -= 1
+
+    def _release_cancelled_job(self, future):
+        """Jobs cancelled before a worker picked them up (e.g. by close()) stop counting as waiting"""
+        if future.cancelled():
+            with self._stats_lock:
+                self.frames_waiting -= 1
+
+    def _observe(self, stage, start, frame=None):
+        """
+        Record a stage as a span on the job's frame traces, or report its duration
+        to stage_observer when the job is untraced
+        Args:
+            frame: Index of the frame within a batch job; None for all of its frames
+        Returns:
+            The time to start the next stage
+        """
+        now = time.perf_counter()
+        traces = getattr(self._local, 'traces', None)
+        if traces:
+            for trace in (traces if frame is None else traces[frame:frame + 1]):
+                if trace is not None:
+                    trace.add(stage, start, now)
+        elif self.stage_observer is not None:
+            self.stage_observer(stage, now - start)
+        return now
+
+    def _run_traced(self, job, payload, traces=None, submit_time=None):
+        """Run a job with its frame traces attached to the calling thread"""
+        self._local.traces = traces if traces and any(traces) else None
+        try:
+            if submit_time is not None:
+                self._observe('queue', submit_time)
+            return job(payload)
+        finally:
+            self._local.traces = None
+
+    def _run_queued_job(self, job, payload, submit_time, traces=None):
+        """Worker-thread entry point: record queue wait, then run the job"""
+        wait_ms = (time.perf_counter() - submit_time) * 1000
+        with self._stats_lock:
+            self.frames_waiting -= 1
+            self.wait_times_ms.append(wait_ms)
+        
+        result = self._run_traced(job, payload, traces, submit_time)
+        
+        with self._stats_lock:
+            self.frames_completed += 1
+        return result
+
+    def _detect_sync(self, image_data):
+        """Decode, preprocess, run and postprocess a single frame (blocking)"""
         try:
-            # Decode image
-            if isinstance(image_data, str):
-                # Base64 encoded image
-                image_bytes = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
-                image = Image.open(io.BytesIO(image_bytes))
-                img_array = np.array(image)
-            elif isinstance(image_data, np.ndarray):
-                img_array = image_data
-            else:
-                raise ValueError("Unsupported image format")
+            img_array, stage_start = self._decode_frame(image_data)
             
-            # Preprocess image
-            processed_img = self._preprocess_image(img_array)
+            # Preprocess image into the reused input buffer
+            batch = self._input_buffer(1)
+            letterbox = self._preprocess_image(img_array, out=batch[0])
+            stage_start = self._observe('preprocess', stage_start)
             
             # Run inference
             start_time = time.time()
-            outputs = self.session.run(None, {self.session.get_inputs()[0].name: processed_img})
+            outputs = self._run_session(batch)
             inference_time = time.time() - start_time
+            stage_start = self._observe('inference', stage_start)
             
-            # Post-process detections
-            detections = self._postprocess_detections(outputs[0], img_array.shape)
+            # Post-process detections; NMS is timed on its own
+            boxes, scores, class_ids = self._decode_candidates(outputs[0], img_array.shape, letterbox)
+            stage_start = self._observe('postprocess', stage_start)
+            detections = self._format_detections(boxes, scores, class_ids, self._apply_nms(boxes, scores, class_ids))
+            self._observe('nms', stage_start)
             
             logger.debug(f"🔍 Detected {len(detections)} objects in {inference_time:.3f}s")
             
@@ -122,32 +310,386 @@ class InferenceEngine:
             logger.error(f"❌ Detection error: {e}")
             return []
 
-    def _preprocess_image(self, img_array):
-        """Preprocess image for YOLO model"""
-        # Convert BGR to RGB if needed
-        if img_array.shape[2] == 3:
-            img_rgb = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
+    def _detect_batch_sync(self, images):
+        """Decode and preprocess several frames, run them as one batch (blocking)"""
+        results = [[] for _ in images]
+        batch = self._input_buffer(len(images))
+        decoded = []
+        for idx, image_data in enumerate(images):
+            try:
+                img_array, stage_start = self._decode_frame(image_data, frame=idx)
+                letterbox = self._preprocess_image(img_array, out=batch[len(decoded)])
+                self._observe('preprocess', stage_start, frame=idx)
+                decoded.append((idx, img_array.shape, letterbox))
+            except Exception as e:
+                logger.error(f"❌ Detection error: {e}")
+        
+        if not decoded:
+            return results
+        
+        try:
+            start_time = time.time()
+            stage_start = time.perf_counter()
+            outputs = self._run_session(batch[:len(decoded)])
+            inference_time = time.time() - start_time
+            stage_start = self._observe('inference', stage_start)
+            
+            for row, (idx, shape, letterbox) in enumerate(decoded):
+                boxes, scores, class_ids = self._decode_candidates(outputs[row], shape, letterbox)
+                stage_start = self._observe('postprocess', stage_start, frame=idx)
+                keep = self._apply_nms(boxes, scores, class_ids)
+                results[idx] = self._format_detections(boxes, scores, class_ids, keep)
+                stage_start = self._observe('nms', stage_start, frame=idx)
+            
+            logger.debug(f"🔍 Batch of {len(decoded)} frames inferred in {inference_time:.3f}s")
+            
+        except Exception as e:
+            logger.error(f"❌ Batch detection error: {e}")
+        
+        return results
+
+    def _detect_regions_sync(self, payload):
+        """Crop, batch, run and merge regions of one full-resolution frame (blocking)"""
+        image_data, regions, tile_grid, include_full_frame = payload
+        try:
+            img_array, stage_start = self._decode_frame(image_data, full_resolution=True)
+            height, width = img_array.shape[:2]
+            
+            crops = [(0, 0, width, height)] if include_full_frame else []
+            for xmin, ymin, xmax, ymax in list(regions or []) + self.tile_regions(tile_grid):
+                x0, y0 = int(max(0.0, xmin) * width), int(max(0.0, ymin) * height)
+                x1, y1 = int(np.ceil(min(1.0, xmax) * width)), int(np.ceil(min(1.0, ymax) * height))
+                if x1 - x0 >= 8 and y1 - y0 >= 8:
+                    crops.append((x0, y0, x1, y1))
+            if not crops:
+                return []
+            
+            # Crops are views; the letterbox resize reads them in place
+            batch = self._input_buffer(len(crops))
+            letterboxes = [
+                self._preprocess_image(img_array[y0:y1, x0:x1], out=batch[i])
+                for i, (x0, y0, x1, y1) in enumerate(crops)
+            ]
+            
+            stage_start = self._observe('preprocess', stage_start)
+            
+            start_time = time.time()
+            outputs = self._run_session(batch)
+            inference_time = time.time() - start_time
+            stage_start = self._observe('inference', stage_start)
+            
+            # Map crop-normalized boxes to frame-normalized ones, then NMS across crops
+            all_boxes, all_scores, all_class_ids = [], [], []
+            for i, (x0, y0, x1, y1) in enumerate(crops):
+                boxes, scores, class_ids = self._decode_candidates(outputs[i], (y1 - y0, x1 - x0), letterboxes[i])
+                scale = np.array([(x1 - x0) / width, (y1 - y0) / height] * 2)
+                offset = np.array([x0 / width, y0 / height] * 2)
+                all_boxes.append(boxes * scale + offset)
+                all_scores.append(scores)
+                all_class_ids.append(class_ids)
+            
+            boxes = np.concatenate(all_boxes)
+            scores = np.concatenate(all_scores)
+            class_ids = np.concatenate(all_class_ids)
+            stage_start = self._observe('postprocess', stage_start)
+            keep = self._apply_nms(boxes, scores, class_ids)
+            
+            logger.debug(f"🔍 {len(crops)} regions of a {width}x{height} frame inferred in {inference_time:.3f}s")
+            
+            detections = self._format_detections(boxes, scores, class_ids, keep)
+            self._observe('nms', stage_start)
+            return detections
+            
+        except Exception as e:
+            logger.error(f"❌ Region detection error: {e}")
+            return []
+
+    def tile_regions(self, tile_grid):
+        """Normalized boxes of a (cols, rows) grid of tiles overlapping by tile_overlap"""
+        if not tile_grid:
+            return []
+        
+        def spans(count):
+            count = max(1, int(count))
+            size = 1.0 / (count - self.tile_overlap * (count - 1))
+            step = size * (1 - self.tile_overlap)
+            return [(i * step, min(1.0, i * step + size)) for i in range(count)]
+        
+        cols, rows = tile_grid
+        return [(x0, y0, x1, y1) for y0, y1 in spans(rows) for x0, x1 in spans(cols)]
+
+    def _run_session(self, batch):
+        """
+        Run the model on a preprocessed [N, 3, H, W] batch
+        With IOBinding, ORT writes into a reused per-thread output array, so
+        the result is only valid until this thread's next run.
+        """
+        if not self.supports_batching and batch.shape[0] > 1:
+            # Static batch-1 model: still amortise scheduling, run frame by frame
+            outputs = self._output_buffer(batch.shape[0])
+            if outputs is None:
+                return np.concatenate([self._run_session(batch[i:i + 1]) for i in range(batch.shape[0])])
+            for i in range(batch.shape[0]):
+                self._run_bound(batch[i:i + 1], outputs[i:i + 1])
+            return outputs
+        
+        outputs = self._output_buffer(batch.shape[0])
+        if outputs is None:
+            return self.session.run(None, {self.input_name: batch})[0]
+        
+        self._run_bound(batch, outputs)
+        return outputs
+
+    def _run_bound(self, batch, outputs):
+        """session.run via IOBinding: input and output live in our own arrays"""
+        buffers = self._thread_buffers()
+        if buffers['binding'] is None:
+            buffers['binding'] = self.session.io_binding()
+        binding = buffers['binding']
+        
+        binding.bind_cpu_input(self.input_name, batch)
+        binding.bind_output(
+            self.output_name, 'cpu', 0, self.output_dtype, list(outputs.shape), outputs.ctypes.data
+        )
+        self.session.run_with_iobinding(binding)
+
+    def _thread_buffers(self):
+        """Per-worker-thread reusable arrays"""
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = {'input': None, 'output': None, 'resized': {}, 'binding': None}
+            self._local.buffers = buffers
+        return buffers
+
+    def _input_buffer(self, batch_size):
+        """Reused [N, 3, H, W] model input array, grown on demand"""
+        buffers = self._thread_buffers()
+        input_w, input_h = self.input_size
+        if buffers['input'] is None or buffers['input'].shape[0] < batch_size:
+            buffers['input'] = np.empty((batch_size, 3, input_h, input_w), dtype=self.input_dtype)
+        return buffers['input'][:batch_size]
+
+    def _output_buffer(self, batch_size):
+        """Reused [N, rows, 85] model output array, or None when IOBinding is off"""
+        if not self.use_io_binding or self.output_shape is None:
+            return None
+        buffers = self._thread_buffers()
+        if buffers['output'] is None or buffers['output'].shape[0] < batch_size:
+            buffers['output'] = np.empty((batch_size,) + self.output_shape, dtype=self.output_dtype)
+        return buffers['output'][:batch_size]
+
+    def _decode_image(self, image_data, full_resolution=False):
+        """
+        Decode a frame to an RGB numpy array
+        Accepts raw JPEG/WebP bytes (binary WebSocket frames), base64 data
+        URLs (JSON frames) or an already decoded numpy array.
+        full_resolution disables reduced JPEG decoding (tiled / ROI inference).
+        """
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
+            buffer = np.frombuffer(image_data, dtype=np.uint8)
+            flag = cv2.IMREAD_COLOR if full_resolution else self._imdecode_flag(image_data)
+            img_array = cv2.imdecode(buffer, flag)
+            if img_array is None:
+                raise ValueError("Could not decode binary frame")
+            # OpenCV decodes to BGR; swap in place, the array is ours
+            return cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB, dst=img_array)
+        elif isinstance(image_data, str):
+            # Base64 encoded image
+            return self._decode_pil(self._decode_base64(image_data))
+        elif isinstance(image_data, np.ndarray):
+            return image_data
         else:
-            img_rgb = img_array
+            raise ValueError("Unsupported image format")
+
+    def _decode_frame(self, image_data, full_resolution=False, frame=None):
+        """
+        _decode_image with base64 unwrapping and image decoding timed as separate stages
+        Returns:
+            (RGB array, time the decode finished)
+        """
+        stage_start = time.perf_counter()
+        if isinstance(image_data, str):
+            image_bytes = self._decode_base64(image_data)
+            stage_start = self._observe('base64', stage_start, frame)
+            img_array = self._decode_pil(image_bytes)
+        else:
+            img_array = self._decode_image(image_data, full_resolution)
+        return img_array, self._observe('decode', stage_start, frame)
+
+    @staticmethod
+    def _decode_base64(image_data):
+        """Encoded image bytes from a base64 string or data URL"""
+        return base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
+
+    @staticmethod
+    def _decode_pil(image_bytes):
+        return np.array(Image.open(io.BytesIO(image_bytes)))
+
+    def _imdecode_flag(self, image_data):
+        """Pick the largest JPEG reduced-decode factor that stays above model size"""
+        if not self.reduced_decode:
+            return cv2.IMREAD_COLOR
+        
+        dimensions = jpeg_dimensions(image_data)
+        if dimensions is None:
+            return cv2.IMREAD_COLOR
+        
+        width, height = dimensions
+        input_w, input_h = self.input_size
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                             (4, cv2.IMREAD_REDUCED_COLOR_4),
+                             (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            # Letterboxing is bound by whichever side fills the input first
+            if width // factor >= input_w or height // factor >= input_h:
+                return flag
+        return cv2.IMREAD_COLOR
+
+    def warmup(self, runs=2):
+        """Run dummy frames through the full pipeline before taking traffic"""
+        if self.session is None:
+            return
+        
+        input_w, input_h = self.input_size
+        dummy = np.zeros((input_h, input_w, 3), dtype=np.uint8)
+        start_time = time.time()
         
-        # Resize to model input size
-        img_resized = cv2.resize(img_rgb, self.input_size)
+        for _ in range(runs):
+            self._detect_sync(dummy)
+        # Each pool thread has its own buffers and IOBinding; warm those too
+        if self.executor is not None:
+            for future in [self.executor.submit(self._detect_sync, dummy) for _ in range(self.max_workers)]:
+                future.result()
+        
+        logger.info(f"🔥 Warmed up {self.model_path.name} in {time.time() - start_time:.2f}s")
+
+    @property
+    def pending_frames(self):
+        """Frames that still need this engine's session, whether batching or submitted"""
+        return self.queue_depth + self.frames_scheduled
+
+    def get_queue_stats(self):
+        """Get inference executor queue depth and wait time statistics"""
+        with self._stats_lock:
+            wait_times = list(self.wait_times_ms)
+            waiting = self.frames_waiting
+            completed = self.frames_completed
         
-        # Normalize to [0, 1] and convert to float32
-        img_normalized = img_resized.astype(np.float32) / 255.0
+        return {
+            "executor": "thread" if self.executor is not None else "inline",
+            "workers": self.max_workers if self.executor is not None else 0,
+            "max_queue": self.max_queue,
+            "queue_depth": self.queue_depth,
+            "waiting": waiting,
+            "in_flight": self.queue_depth - waiting,
+            "scheduled": self.frames_scheduled,
+            "completed": completed,
+            "rejected": self.frames_rejected,
+            "wait_ms": {
+                "mean": sum(wait_times) / len(wait_times) if wait_times else 0,
+                "max": max(wait_times) if wait_times else 0,
+                "last": wait_times[-1] if wait_times else 0
+            }
+        }
+
+    def close(self):
+        """Shut down the inference thread pool"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _letterbox_geometry(self, src_w, src_h):
+        """Scale and padding that fit a source resolution into the model input"""
+        key = (src_w, src_h)
+        geometry = self._letterbox_cache.get(key)
+        if geometry is None:
+            geometry = self._letterbox_cache[key] = letterbox_geometry(self.input_size, src_w, src_h)
+        return geometry
+
+    def letterbox_size(self, src_w, src_h):
+        """Size a frame is scaled to before padding; frames already this size skip the resize"""
+        _, new_w, new_h, _, _ = self._letterbox_geometry(src_w, src_h)
+        return new_w, new_h
+
+    def _preprocess_image(self, img_array, out=None):
+        """
+        Letterbox an RGB frame into a [3, H, W] model input slot
+        Resize goes into a reused per-resolution buffer, then normalization and
+        the HWC->CHW transpose write straight into `out` (no temporaries).
+        Returns:
+            (ratio, pad_left, pad_top) needed to map boxes back
+        """
+        if img_array.ndim == 2:
+            img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
+        elif img_array.shape[2] == 4:
+            img_array = img_array[:, :, :3]  # Drop alpha
+        
+        src_h, src_w = img_array.shape[:2]
+        ratio, new_w, new_h, left, top = self._letterbox_geometry(src_w, src_h)
+        
+        if out is None:
+            out = self._input_buffer(1)[0]
+        
+        if (new_w, new_h) == (src_w, src_h):
+            resized = img_array
+        else:
+            resized_buffers = self._thread_buffers()['resized']
+            resized = resized_buffers.get((new_w, new_h))
+            if resized is None:
+                resized = np.empty((new_h, new_w, 3), dtype=np.uint8)
+                resized_buffers[(new_w, new_h)] = resized
+            cv2.resize(img_array, (new_w, new_h), dst=resized, interpolation=cv2.INTER_LINEAR)
         
-        # Convert HWC to CHW format
-        img_transposed = np.transpose(img_normalized, (2, 0, 1))
+        # Padding bands (the slot may have held a different geometry last time)
+        pad = self.letterbox_pad_value
+        out[:, :top, :] = pad
+        out[:, top + new_h:, :] = pad
+        out[:, top:top + new_h, :left] = pad
+        out[:, top:top + new_h, left + new_w:] = pad
         
-        # Add batch dimension
-        img_batch = np.expand_dims(img_transposed, axis=0)
+        # Normalize to [0, 1] and convert HWC to CHW in one pass per channel
+        for channel in range(3):
+            np.multiply(
+                resized[:, :, channel], 1 / 255.0,
+                out=out[channel, top:top + new_h, left:left + new_w],
+                dtype=np.float32, casting='unsafe'
+            )
         
-        return img_batch
+        return ratio, left, top
 
-    def _postprocess_detections(self, outputs, original_shape):
+    def _postprocess_detections(self, outputs, original_shape, letterbox=None):
         """Post-process YOLO outputs to get bounding boxes"""
-        detections = []
+        boxes, scores, class_ids = self._decode_candidates(outputs, original_shape, letterbox)
+        
+        # Apply NMS on arrays; Python objects are only built for the survivors
+        keep = self._apply_nms(boxes, scores, class_ids)
         
+        return self._format_detections(boxes, scores, class_ids, keep)
+
+    def _format_detections(self, boxes, scores, class_ids, keep):
+        """Detection dictionaries for the kept rows, with their binary records packed from the arrays"""
+        boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+        return DetectionList([
+            {
+                'label': self.class_names[class_id],
+                'score': score,
+                'xmin': xmin,
+                'ymin': ymin,
+                'xmax': xmax,
+                'ymax': ymax
+            }
+            for (xmin, ymin, xmax, ymax), score, class_id
+            in zip(boxes.tolist(), scores.tolist(), class_ids.tolist())
+        ], pack_detection_records(boxes, scores, class_ids))
+
+    def _decode_candidates(self, outputs, original_shape, letterbox=None):
+        """
+        Vectorized YOLO decode: filter, pick classes and convert boxes as arrays
+        Args:
+            letterbox: (ratio, pad_left, pad_top) from _preprocess_image, or
+                None for a plain stretch to the model input size
+        Returns:
+            (boxes [N, 4] normalized xyxy, scores [N], class_ids [N])
+        """
         # YOLO output format: [batch, num_detections, 85] 
         # 85 = 4 bbox coords + 1 confidence + 80 class scores
         if len(outputs.shape) == 3:
@@ -156,101 +698,113 @@ class InferenceEngine:
         orig_h, orig_w = original_shape[:2]
         input_h, input_w = self.input_size[1], self.input_size[0]
         
-        # Scale factors
-        scale_x = orig_w / input_w
-        scale_y = orig_h / input_h
+        # Scale factors (model input pixels -> original pixels)
+        if letterbox is None:
+            scale_x = orig_w / input_w
+            scale_y = orig_h / input_h
+            pad = np.zeros(2)
+        else:
+            ratio, pad_left, pad_top = letterbox
+            scale_x = scale_y = 1 / ratio
+            pad = np.array([pad_left, pad_top], dtype=np.float64)
         
-        for detection in outputs:
-            # Extract confidence and class scores
-            confidence = detection[4]
-            if confidence < self.confidence_threshold:
-                continue
-            
-            # Get class with highest score
-            class_scores = detection[5:]
-            class_id = np.argmax(class_scores)
-            class_confidence = class_scores[class_id]
-            
-            # Final confidence
-            final_confidence = confidence * class_confidence
-            if final_confidence < self.confidence_threshold:
-                continue
-            
-            # Extract and scale bounding box
-            x_center, y_center, width, height = detection[:4]
-            
-            # Convert from center format to corner format
-            x1 = (x_center - width / 2) * scale_x
-            y1 = (y_center - height / 2) * scale_y
-            x2 = (x_center + width / 2) * scale_x
-            y2 = (y_center + height / 2) * scale_y
-            
-            # Normalize coordinates to [0, 1]
-            xmin = max(0, x1 / orig_w)
-            ymin = max(0, y1 / orig_h)
-            xmax = min(1, x2 / orig_w)
-            ymax = min(1, y2 / orig_h)
-            
-            # Skip invalid boxes
-            if xmax <= xmin or ymax <= ymin:
-                continue
-            
-            detections.append({
-                'label': self.class_names[class_id],
-                'score': float(final_confidence),
-                'xmin': float(xmin),
-                'ymin': float(ymin),
-                'xmax': float(xmax),
-                'ymax': float(ymax)
-            })
+        # Objectness filter first: discards the vast majority of rows cheaply
+        candidates = outputs[outputs[:, 4] >= self.confidence_threshold]
         
-        # Apply NMS
-        detections = self._apply_nms(detections)
+        # Class with highest score per row
+        class_scores = candidates[:, 5:]
+        class_ids = np.argmax(class_scores, axis=1)
+        class_confidence = np.take_along_axis(class_scores, class_ids[:, None], axis=1)[:, 0]
         
-        return detections
-
-    def _apply_nms(self, detections):
-        """Apply Non-Maximum Suppression to remove overlapping boxes"""
-        if not detections:
-            return detections
+        # Final confidence
+        final_confidence = candidates[:, 4] * class_confidence
+        keep = final_confidence >= self.confidence_threshold
+        candidates = candidates[keep]
+        final_confidence = final_confidence[keep]
+        class_ids = class_ids[keep]
         
-        # Sort by confidence
-        detections.sort(key=lambda x: x['score'], reverse=True)
+        # Convert from center format to corner format, normalized to [0, 1]
+        centers = candidates[:, 0:2].astype(np.float64)
+        half_sizes = candidates[:, 2:4].astype(np.float64) / 2
+        scale = np.array([scale_x, scale_y])
+        size = np.array([orig_w, orig_h])
         
-        kept_detections = []
+        top_left = np.maximum(0, (centers - half_sizes - pad) * scale / size)
+        bottom_right = np.minimum(1, (centers + half_sizes - pad) * scale / size)
         
-        while detections:
-            # Take the detection with highest confidence
-            best = detections.pop(0)
-            kept_detections.append(best)
-            
-            # Remove overlapping detections
-            detections = [
-                det for det in detections 
-                if self._calculate_iou(best, det) < self.nms_threshold
-            ]
+        # Skip invalid boxes
+        valid = np.all(bottom_right > top_left, axis=1)
+        boxes = np.concatenate([top_left, bottom_right], axis=1)[valid]
         
-        return kept_detections
+        return boxes, final_confidence[valid].astype(np.float64), class_ids[valid]
 
-    def _calculate_iou(self, box1, box2):
-        """Calculate Intersection over Union (IoU) between two boxes"""
-        # Calculate intersection area
-        x1 = max(box1['xmin'], box2['xmin'])
-        y1 = max(box1['ymin'], box2['ymin'])
-        x2 = min(box1['xmax'], box2['xmax'])
-        y2 = min(box1['ymax'], box2['ymax'])
+    def _apply_nms(self, boxes, scores, class_ids):
+        """
+        Apply Non-Maximum Suppression to remove overlapping boxes
+        Args:
+            boxes: [N, 4] normalized xyxy, scores: [N], class_ids: [N]
+        Returns:
+            Indices of kept boxes, ordered by descending score
+        """
+        if len(scores) == 0:
+            return np.empty(0, dtype=np.int64)
+        
+        # Pre-NMS top-k: crowded frames can have thousands of candidates
+        order = np.argsort(-scores, kind='stable')[:self.pre_nms_top_k]
         
-        if x2 <= x1 or y2 <= y1:
-            return 0.0
+        if self.use_cv2_nms:
+            keep = self._nms_cv2(boxes[order], scores[order], class_ids[order])
+        else:
+            keep = self._nms_numpy(boxes[order], scores[order], class_ids[order])
+        
+        return order[keep][:self.max_detections]
+
+    def _nms_cv2(self, boxes, scores, class_ids):
+        """OpenCV batched NMS on score-sorted candidates"""
+        xywh = np.concatenate([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], axis=1)
+        if self.class_agnostic_nms:
+            class_ids = np.zeros_like(class_ids)
         
-        intersection = (x2 - x1) * (y2 - y1)
+        keep = cv2.dnn.NMSBoxesBatched(
+            xywh.tolist(), scores.tolist(), class_ids.tolist(), 0.0, self.nms_threshold
+        )
+        keep = np.asarray(keep, dtype=np.int64).reshape(-1)
         
-        # Calculate union area
-        area1 = (box1['xmax'] - box1['xmin']) * (box1['ymax'] - box1['ymin'])
-        area2 = (box2['xmax'] - box2['xmin']) * (box2['ymax'] - box2['ymin'])
-        union = area1 + area2 - intersection
+        # Candidates are already sorted, so index order is score order
+        return np.sort(keep)
+
+    def _nms_numpy(self, boxes, scores, class_ids):
+        """Greedy NMS on score-sorted candidates using one pairwise suppression matrix"""
+        # float32 1-D outer products: no [N, N, 2] temporaries, no clip, no division
+        x1, y1, x2, y2 = np.ascontiguousarray(boxes.T, dtype=np.float32)
+        areas = (x2 - x1) * (y2 - y1)
+        intersection = np.minimum.outer(x2, x2)
+        intersection -= np.maximum.outer(x1, x1)
+        np.maximum(intersection, 0, out=intersection)
+        heights = np.minimum.outer(y2, y2)
+        heights -= np.maximum.outer(y1, y1)
+        np.maximum(heights, 0, out=heights)
+        intersection *= heights
+        union = np.add.outer(areas, areas)
+        union -= intersection
+        
+        # IoU > t  <=>  intersection > t * union (union > 0 for any box that survived decoding);
+        # strict, as in OpenCV, so both backends keep a box exactly at the threshold
+        suppress = intersection > self.nms_threshold * union
+        if not self.class_agnostic_nms:
+            suppress &= class_ids[:, None] == class_ids[None, :]
+        
+        removed = np.zeros(len(scores), dtype=bool)
+        keep = []
+        for idx in range(len(scores)):
+            if removed[idx]:
+                continue
+            keep.append(idx)
+            if len(keep) >= self.max_detections:
+                break
+            removed |= suppress[idx]
         
-        return intersection / union if union > 0 else 0.0
+        return np.asarray(keep, dtype=np.int64)
 
     def get_model_info(self):
         """Get information about the loaded model"""
@@ -267,8 +821,18 @@ class InferenceEngine:
         return {
             "mode": "server",
             "input_size": self.input_size,
+            "letterbox": True,
+            "reduced_decode": self.reduced_decode,
+            "io_binding": self.use_io_binding and self.output_shape is not None,
             "confidence_threshold": self.confidence_threshold,
             "nms_threshold": self.nms_threshold,
+            "class_agnostic_nms": self.class_agnostic_nms,
+            "pre_nms_top_k": self.pre_nms_top_k,
+            "max_detections": self.max_detections,
+            "nms_backend": "opencv" if self.use_cv2_nms else "numpy",
             "num_classes": len(self.class_names),
-            "providers": self.session.get_providers()
+            "model_path": str(self.model_path),
+            "supports_batching": self.supports_batching,
+            "providers": self.session.get_providers(),
+            "queue": self.get_queue_stats()
         }
\ No newline at end of file
@@ -10,15 +10,18 @@ import asyncio
 import json
 import logging
 import os
+import random
 import time
 from io import BytesIO
 import base64
+import hmac
 import socket
 import ssl
 from dotenv import load_dotenv
 
 import aiohttp
-from aiohttp import web, WSMsgType
+from aiohttp import web, WSMsgType, WSCloseCode
+from aiortc.mediastreams import MediaStreamError
 import qrcode
 
 # Load environment variables from .env file
@@ -28,7 +31,20 @@ load_dotenv()
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 from webrtc_handler import WebRTCHandler
-from inferencr_engine import InferenceEngine
+from inferencr_engine import COCO_CLASS_NAMES, InferenceEngine
+from batch_scheduler import BatchScheduler
+from frame_protocol import parse_binary_frame, pack_detections, DETECTIONS_VERSION
+from worker_pool import InferenceWorkerPool
+from model_registry import ModelRegistry
+from frame_slot import LatestFrameSlot
+from object_tracker import DetectionTracker
+from motion_gate import MotionGate, motion_regions
+from detection_delta import DetectionDeltaEncoder
+from send_queue import OutboundQueue
+from admission_control import AdmissionController
+from capture_controller import CaptureController
+from prometheus_exporter import ExpositionWriter, CONTENT_TYPE
+from frame_trace import FrameTrace
 from metrics_collector import MetricsCollector
 
 # Configure logging
@@ -49,16 +65,189 @@ class DetectionServer:
         
         # Initialize components
         self.webrtc_handler = WebRTCHandler()
-        self.inference_engine = InferenceEngine(mode=self.mode)
-        self.metrics_collector = MetricsCollector()
+        self.metrics_collector = MetricsCollector(sample_interval=float(os.getenv('SYSTEM_SAMPLE_INTERVAL', '1')),
+                                                  max_traces=int(os.getenv('TRACE_BUFFER', '500')))
+        self.traffic_task = None
+        
+        # Per-frame stage spans: every frame feeds the stage aggregates, a sample is kept for export
+        self.trace_sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+        self.trace_file = os.getenv('TRACE_FILE')  # Chrome trace written on shutdown, under metrics/
+        self.trace_clients = set()  # ws that asked for stage timings in their detections (set-tracing)
+        if self.trace_sample_rate > 0:
+            logger.info(f"🧵 Sampling {self.trace_sample_rate:.0%} of frame traces for export")
+        engine_settings = {
+            'class_agnostic_nms': os.getenv('NMS_CLASS_AGNOSTIC', 'false').lower() == 'true',
+            'pre_nms_top_k': int(os.getenv('NMS_TOP_K', '300')),
+            'max_detections': int(os.getenv('NMS_MAX_DETECTIONS', '100')),
+            'reduced_decode': os.getenv('REDUCED_DECODE', 'true').lower() == 'true',
+            'tile_overlap': float(os.getenv('TILE_OVERLAP', '0.2'))
+        }
+        
+        # Server mode serves every warm model in ./models; WASM mode needs no session.
+        # Process workers load a single model, so that backend skips discovery and swaps
+        # (engines are loaded further down, once the inference backend is set up).
+        self.inference_backend = os.getenv('INFERENCE_BACKEND', 'thread').lower()
+        self.model_registry = None
+        self.wasm_engine = None
+        if self.mode == 'server':
+            model_path = Path(os.getenv('MODEL_PATH', 'models/yolov5n.onnx'))
+            self.model_registry = ModelRegistry(
+                models_dir=os.getenv('MODELS_DIR', 'models'),
+                default_model=os.getenv('DEFAULT_MODEL', model_path.stem),
+                engine_kwargs={
+                    'max_workers': int(os.getenv('INFERENCE_WORKERS', '2')),
+                    'max_queue': int(os.getenv('INFERENCE_QUEUE_SIZE', '8'))
+                },
+                engine_settings=engine_settings,
+                warmup_runs=int(os.getenv('MODEL_WARMUP_RUNS', '2')),
+                stage_observer=self.metrics_collector.record_stage
+            )
+            if self.inference_backend != 'process':
+                self.model_registry.discover()
+            if model_path.exists():
+                self.model_registry.add_model(model_path.stem, model_path)
+        else:
+            self.wasm_engine = InferenceEngine(mode=self.mode)
+        
+        # Admin routes (model swap/reload, trace export) stay closed until a token is configured
+        self.admin_token = os.getenv('ADMIN_TOKEN')
+        if not self.admin_token:
+            logger.warning("🔒 ADMIN_TOKEN is not set; /api/admin/* endpoints are disabled")
+        
+        # Per-connection model selection (ws -> model name)
+        self.client_models = {}
+        
+        # Per-connection compact result encoding (ws -> label -> class id)
+        self.client_encodings = {}
+        
+        # Per-connection delta updates (ws -> DetectionDeltaEncoder), opted into with set-updates
+        self.delta_config = {
+            'move_threshold': float(os.getenv('DELTA_MOVE_THRESHOLD', '0.01')),
+            'keyframe_interval': int(os.getenv('DELTA_KEYFRAME_INTERVAL', '30'))
+        }
+        self.delta_encoders = {}
+        
+        # Per-connection latest-frame-wins ingestion (ws -> slot / consumer task)
+        self.frame_slots = {}
+        self.frame_tasks = {}
+        
+        # Optional detect-then-track: detector on keyframes, Kalman tracks in between
+        self.tracking = self.mode == 'server' and os.getenv('TRACKING', 'false').lower() == 'true'
+        self.tracker_config = {
+            'min_interval': int(os.getenv('TRACK_MIN_INTERVAL', '1')),
+            'max_interval': int(os.getenv('TRACK_MAX_INTERVAL', '5')),
+            'iou_threshold': float(os.getenv('TRACK_IOU_THRESHOLD', '0.3'))
+        }
+        self.trackers = {}  # ws -> DetectionTracker
+        if self.tracking:
+            logger.info(f"🎯 Detect-then-track enabled (keyframe interval {self.tracker_config['min_interval']}-{self.tracker_config['max_interval']})")
+        
+        # Optional motion gate: reuse the last detections while the scene is static
+        self.motion_gating = self.mode == 'server' and os.getenv('MOTION_GATE', 'false').lower() == 'true'
+        self.motion_gate_config = {
+            'pixel_threshold': int(os.getenv('MOTION_PIXEL_THRESHOLD', '12')),
+            'min_changed_fraction': float(os.getenv('MOTION_MIN_CHANGED', '0.01')),
+            'max_skip': int(os.getenv('MOTION_MAX_SKIP', '30'))
+        }
+        self.motion_gates = {}  # ws -> MotionGate
+        if self.motion_gating:
+            logger.info(f"🚦 Motion gate enabled (max {self.motion_gate_config['max_skip']} skipped frames)")
+        
+        # Optional tiled / ROI inference at full frame resolution
+        self.region_mode = os.getenv('INFERENCE_REGIONS', 'full').lower() if self.mode == 'server' else 'full'
+        tile_grid = os.getenv('TILE_GRID', '2x2').lower().split('x')
+        self.tile_grid = (int(tile_grid[0]), int(tile_grid[1]))
+        self.regions_include_full_frame = os.getenv('REGIONS_INCLUDE_FULL_FRAME', 'true').lower() == 'true'
+        self.client_rois = {}  # ws -> client-defined ROIs
+        self.roi_motion = {}  # ws -> MotionGate holding the previous thumbnail
+        if self.region_mode != 'full':
+            logger.info(f"🧩 Region inference: {self.region_mode}" + (f" ({self.tile_grid[0]}x{self.tile_grid[1]} tiles)" if self.region_mode == 'tiles' else ""))
+        
+        # Server mode infers straight from the peer's WebRTC video track when one arrives
+        self.video_source = os.getenv('VIDEO_SOURCE', 'webrtc').lower()
+        self.peer_sockets = {}  # peer id -> ws
+        self.track_pumps = {}  # ws -> frame pump task
+        self.track_start_timeout = float(os.getenv('WEBRTC_FIRST_FRAME_TIMEOUT', '5'))
+        if self.mode == 'server' and self.video_source == 'webrtc':
+            self.webrtc_handler.on_video_track = self.start_track_pump
+        
+        
+        # Optional multi-process inference backend fed by a shared-memory ring.
+        # Workers own their sessions, so the main process only loads engines for tiled / ROI inference.
+        self.worker_pool = None
+        if self.mode == 'server' and self.inference_backend == 'process':
+            model_name, model_spec = self.model_registry.resolve_default()
+            logger.info(f"🏭 Worker processes serve {model_name}")
+            self.worker_pool = InferenceWorkerPool(
+                num_workers=int(os.getenv('WORKER_PROCESSES', '2')),
+                model_path=model_spec['path'],
+                input_size=model_spec['input_size'],
+                engine_settings=engine_settings,
+                ring_slots=int(os.getenv('WORKER_RING_SLOTS', '16')),
+                slot_bytes=int(float(os.getenv('WORKER_SLOT_MB', '4')) * 1024 * 1024),
+                intra_op_threads=int(os.getenv('WORKER_INTRA_OP_THREADS', '1')),
+                max_restarts=int(os.getenv('WORKER_MAX_RESTARTS', '5')),
+                metrics_collector=self.metrics_collector
+            )
+        
+        if self.region_mode != 'full' and self.worker_pool is not None:
+            logger.info("ℹ️ Tiled / ROI inference runs on the in-process engine, not the worker pool")
+        if self.model_registry is not None and (self.worker_pool is None or self.region_mode != 'full'):
+            self.model_registry.load_all()
+        
+        # Optional cross-client micro-batching in front of the engine
+        self.batch_scheduler = None
+        if self.worker_pool is not None:
+            logger.info("ℹ️ Micro-batching is not used with the process backend")
+        elif self.mode == 'server' and os.getenv('BATCHING', 'false').lower() == 'true':
+            self.batch_scheduler = BatchScheduler(
+                self.inference_engine,
+                max_batch_size=int(os.getenv('BATCH_MAX_SIZE', '8')),
+                max_delay_ms=float(os.getenv('BATCH_MAX_DELAY_MS', '10')),
+                metrics_collector=self.metrics_collector
+            )
         
         # Active connections
         self.websockets = set()
         
+        # Per-connection outbound queues (ws -> OutboundQueue) and their writer tasks
+        self.send_queue_depth = int(os.getenv('SEND_QUEUE_DEPTH', '32'))
+        self.send_max_lag = float(os.getenv('SEND_MAX_LAG_MS', '5000')) / 1000
+        self.send_queues = {}
+        self.send_tasks = {}
+        self.disconnecting = set()
+        
+        # Admission control for server-mode streams (ws -> fair-share limits of admitted streams)
+        self.admission = None
+        if self.mode == 'server' and os.getenv('ADMISSION_CONTROL', 'true').lower() == 'true':
+            self.admission = AdmissionController(
+                max_streams=int(os.getenv('ADMISSION_MAX_STREAMS', '8')),
+                capacity_fps=float(os.getenv('ADMISSION_CAPACITY_FPS', '30')),
+                target_p95_ms=float(os.getenv('ADMISSION_TARGET_P95_MS', '200')),
+                fallback=os.getenv('ADMISSION_FALLBACK', 'wasm')
+            )
+        self.stream_limits = {}
+        self.last_rebalance = 0.0
+        
+        # Closed-loop capture targets per client (ws -> CaptureController), held under LATENCY_SLO_MS
+        self.capture_control = os.getenv('CAPTURE_CONTROL', 'true').lower() == 'true'
+        self.capture_config = {
+            'slo_ms': float(os.getenv('LATENCY_SLO_MS', '250')),
+            'max_fps': float(os.getenv('CAPTURE_MAX_FPS', '15'))
+        }
+        self.capture_controllers = {}
+        
         logger.info(f"🚀 Initializing DetectionServer in {self.mode.upper()} mode")
         if self.use_https:
             logger.info("🔐 HTTPS enabled for mobile camera support")
 
+    @property
+    def inference_engine(self):
+        """Current default engine (changes when the default model is hot-swapped); None when only worker processes infer"""
+        if self.model_registry is not None:
+            return self.model_registry.get() if self.model_registry.engines else None
+        return self.wasm_engine
+
     def get_local_ip(self):
         """Get local IP address"""
         try:
@@ -113,20 +302,57 @@ class DetectionServer:
         self.websockets.add(ws)
         logger.info(f"📱 New WebSocket connection. Total: {len(self.websockets)}")
         
+        self.open_send_queue(ws)
+        
+        # Tell the client where inference runs so it can pick its frame/result formats
+        config = {'type': 'config', 'mode': self.mode}
+        if self.admission is not None:
+            config['admission'] = self.admit_stream(ws)
+            if config['admission'] == 'reject' and self.admission.fallback == 'wasm':
+                config['mode'] = 'wasm'  # Client infers locally instead
+        self.send(ws, config)
+        
         try:
+            if config.get('admission') == 'reject' and self.admission.fallback != 'wasm':
+                await ws.close(code=WSCloseCode.TRY_AGAIN_LATER, message=b'server at capacity')
+            elif ws in self.stream_limits:
+                self.rebalance_streams()
+            
             async for msg in ws:
+                if msg.type in (WSMsgType.TEXT, WSMsgType.BINARY):
+                    self.metrics_collector.record_traffic('websocket', received=len(msg.data))
                 if msg.type == WSMsgType.TEXT:
                     try:
                         data = json.loads(msg.data)
                         await self.handle_websocket_message(ws, data)
                     except json.JSONDecodeError as e:
                         logger.error(f"Invalid JSON: {e}")
+                elif msg.type == WSMsgType.BINARY:
+                    await self.handle_binary_frame(ws, msg.data)
                 elif msg.type == WSMsgType.ERROR:
                     logger.error(f"WebSocket error: {ws.exception()}")
         except Exception as e:
             logger.error(f"WebSocket handler error: {e}")
         finally:
             self.websockets.discard(ws)
+            self.client_models.pop(ws, None)
+            self.client_encodings.pop(ws, None)
+            self.delta_encoders.pop(ws, None)
+            self.trace_clients.discard(ws)
+            self.close_frame_slot(ws)
+            self.close_send_queue(ws)
+            if self.stream_limits.pop(ws, None) is not None:
+                self.rebalance_streams()
+            self.capture_controllers.pop(ws, None)
+            self.trackers.pop(ws, None)
+            self.motion_gates.pop(ws, None)
+            self.client_rois.pop(ws, None)
+            self.roi_motion.pop(ws, None)
+            pump = self.track_pumps.pop(ws, None)
+            if pump is not None:
+                pump.cancel()
+            if self.peer_sockets.pop(self.peer_id(ws), None) is not None:
+                await self.webrtc_handler.cleanup_peer_connection(self.peer_id(ws))
             logger.info(f"📱 WebSocket disconnected. Total: {len(self.websockets)}")
         
         return ws
@@ -137,43 +363,352 @@ class DetectionServer:
         
         if msg_type == 'offer':
             # Handle WebRTC offer
-            answer = await self.webrtc_handler.handle_offer(data['sdp'])
-            await ws.send_str(json.dumps({
+            self.peer_sockets[self.peer_id(ws)] = ws
+            answer = await self.webrtc_handler.handle_offer(data['sdp'], self.peer_id(ws))
+            self.send(ws, {
                 'type': 'answer',
                 'sdp': answer
-            }))
+            })
             
         elif msg_type == 'ice-candidate':
             # Handle ICE candidate
-            await self.webrtc_handler.add_ice_candidate(data['candidate'])
+            await self.webrtc_handler.add_ice_candidate(data['candidate'], self.peer_id(ws))
             
         elif msg_type == 'frame':
             # Handle video frame for inference
             if self.mode == 'server':
-                await self.process_frame_server_mode(ws, data)
+                await self.submit_frame(ws, data)
             # In WASM mode, inference happens client-side
             
+        elif msg_type == 'select-model':
+            # Pin this connection to a specific warm model
+            model = data.get('model')
+            if self.worker_pool is not None:
+                self.send(ws, {
+                    'type': 'error',
+                    'message': "Model selection is not available with the process inference backend"
+                })
+            elif self.model_registry is None or not self.model_registry.has_model(model):
+                self.send(ws, {
+                    'type': 'error',
+                    'message': f"Unknown model: {model}"
+                })
+            else:
+                self.client_models[ws] = model
+                self.send(ws, {
+                    'type': 'model-selected',
+                    'model': model
+                })
+                if ws in self.client_encodings:
+                    await self.send_class_table(ws)
+            
+        elif msg_type == 'set-encoding':
+            # Opt in to binary detection records ('binary') or back to JSON ('json')
+            encoding = data.get('encoding', 'json')
+            if encoding == 'binary' and self.mode == 'server':
+                await self.send_class_table(ws)
+            elif encoding == 'json':
+                self.client_encodings.pop(ws, None)
+                self.send(ws, {'type': 'encoding-set', 'encoding': 'json'})
+            else:
+                self.send(ws, {
+                    'type': 'error',
+                    'message': f"Unsupported encoding: {encoding}"
+                })
+            
+        elif msg_type == 'set-updates':
+            # 'delta' sends adds/moves/removes against the last sent set; 'full' every frame
+            mode = data.get('mode', 'full')
+            if mode == 'delta':
+                config = dict(self.delta_config)
+                for key in ('move_threshold', 'keyframe_interval'):
+                    if key in data:
+                        config[key] = type(config[key])(data[key])
+                self.delta_encoders[ws] = DetectionDeltaEncoder(**config)
+                self.send(ws, {'type': 'updates-set', 'mode': 'delta', **config})
+            else:
+                self.delta_encoders.pop(ws, None)
+                self.send(ws, {'type': 'updates-set', 'mode': 'full'})
+            
+        elif msg_type == 'set-tracing':
+            # Per-stage server timings (ms) on every JSON detections message
+            if data.get('spans'):
+                self.trace_clients.add(ws)
+            else:
+                self.trace_clients.discard(ws)
+            self.send(ws, {'type': 'tracing-set', 'spans': ws in self.trace_clients})
+            
+        elif msg_type == 'request-keyframe':
+            # Client missed a delta; resync with the next result
+            encoder = self.delta_encoders.get(ws)
+            if encoder is not None:
+                encoder.request_keyframe()
+            
+        elif msg_type == 'set-roi':
+            # Normalized [xmin, ymin, xmax, ymax] regions for ROI inference; empty clears
+            try:
+                rois = [tuple(float(v) for v in roi) for roi in data.get('rois', [])]
+                if any(len(roi) != 4 or roi[2] <= roi[0] or roi[3] <= roi[1] for roi in rois):
+                    raise ValueError("ROIs must be [xmin, ymin, xmax, ymax]")
+            except (TypeError, ValueError) as e:
+                self.send(ws, {'type': 'error', 'message': str(e)})
+            else:
+                self.client_rois[ws] = rois
+                self.send(ws, {'type': 'roi-set', 'rois': rois})
+            
         elif msg_type == 'metrics-request':
             # Send current metrics
-            metrics = self.metrics_collector.get_current_metrics()
-            await ws.send_str(json.dumps({
+            metrics = self.get_metrics_snapshot()
+            self.send(ws, {
                 'type': 'metrics',
                 'data': metrics
-            }))
+            }, coalesce='metrics')
+
+    async def handle_binary_frame(self, ws, data):
+        """Process a binary frame message: fixed header + raw JPEG/WebP bytes"""
+        if self.mode != 'server':
+            return
+        
+        try:
+            frame_id, capture_ts, payload = parse_binary_frame(data)
+        except ValueError as e:
+            logger.error(f"Invalid binary frame: {e}")
+            return
+        
+        await self.submit_frame(ws, {
+            'frame_id': frame_id,
+            'capture_ts': capture_ts,
+            'image_data': payload
+        })
+
+    def peer_id(self, ws):
+        """WebRTC peer id for a WebSocket connection"""
+        return f"peer_{id(ws)}"
+
+    def start_track_pump(self, client_id, track):
+        """Start consuming a peer's video track as its inference source"""
+        ws = self.peer_sockets.get(client_id)
+        if ws is None or ws.closed:
+            return
+        previous = self.track_pumps.get(ws)
+        if previous is not None:
+            previous.cancel()
+        self.track_pumps[ws] = asyncio.create_task(self.track_pump(ws, track))
+
+    async def track_pump(self, ws, track):
+        """
+        Drain a peer's decoded video track into its latest-frame-wins slot
+        Frames arrive at the camera rate; only the newest pending one is
+        converted and inferred, the rest are dropped without a client notice.
+        The client keeps sending WebSocket frames until the first decoded frame
+        arrives, so a track whose media never flows does not stall detection.
+        """
+        frame_id = 0
+        try:
+            try:
+                frame = await asyncio.wait_for(track.recv(), self.track_start_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"🎥 No WebRTC frames from {self.peer_id(ws)} after {self.track_start_timeout:g}s, "
+                               f"keeping WebSocket frames")
+                self.send(ws, {'type': 'video-source', 'source': 'websocket'})
+                frame = await track.recv()
+            
+            logger.info(f"🎥 Inferring from WebRTC track for {self.peer_id(ws)}")
+            self.send(ws, {'type': 'video-source', 'source': 'webrtc'})
+            while True:
+                await self.submit_frame(ws, {
+                    'frame_id': frame_id,
+                    'capture_ts': int(time.time() * 1000),
+                    'video_frame': frame
+                }, notify_drops=False)
+                frame_id += 1
+                frame = await track.recv()
+        except MediaStreamError:
+            logger.info(f"🎥 WebRTC track ended for {self.peer_id(ws)}")
+            if self.track_pumps.get(ws) is asyncio.current_task():
+                self.track_pumps.pop(ws, None)
+                if not ws.closed:
+                    # Let the client fall back to sending frames over the WebSocket
+                    self.send(ws, {'type': 'video-source', 'source': 'websocket'})
+
+    async def submit_frame(self, ws, frame_data, notify_drops=True):
+        """
+        Hand a frame to the connection's latest-frame-wins slot
+        The read loop never waits on inference; if a frame is still pending
+        when a newer one arrives, the older one is dropped and the client told.
+        """
+        frame_data['recv_ts'] = int(time.time() * 1000)
+        frame_data['trace'] = FrameTrace(frame_data.get('frame_id'), random.random() < self.trace_sample_rate)
+        
+        if self.admission is not None:
+            limits = self.stream_limits.get(ws)
+            if limits is None:
+                # Sent to WASM fallback at connect; its frames are not ours to infer
+                self.metrics_collector.record_frame_drop('not-admitted')
+                return
+            # Hold each stream to its fair share, with some slack for capture jitter
+            now = time.monotonic()
+            if now - limits['last_frame'] < 0.8 / limits['fps']:
+                if notify_drops:
+                    await self.notify_frame_dropped(ws, frame_data, 'rate-limited')
+                else:
+                    self.metrics_collector.record_frame_drop('rate-limited')
+                return
+            limits['last_frame'] = now
+            if now - self.last_rebalance >= 1.0:
+                # Follow the live load, not just joins and leaves
+                self.rebalance_streams()
+        
+        slot = self.frame_slots.get(ws)
+        if slot is None:
+            slot = LatestFrameSlot()
+            self.frame_slots[ws] = slot
+            self.frame_tasks[ws] = asyncio.create_task(self.frame_consumer(ws, slot))
+        
+        dropped = slot.put(frame_data)
+        if dropped is not None:
+            if notify_drops:
+                await self.notify_frame_dropped(ws, dropped, 'superseded')
+            else:
+                self.metrics_collector.record_frame_drop('superseded')
+
+    def inference_backlog(self):
+        """Frames waiting on the configured inference backend, and how many it can hold"""
+        if self.worker_pool is not None:
+            return len(self.worker_pool.jobs), self.worker_pool.ring_slots
+        engine = self.inference_engine
+        return engine.pending_frames, engine.max_queue
+
+    def inference_load(self):
+        """Admission load from the inference backlog and recent server-latency p95"""
+        pending, capacity = self.inference_backlog()
+        return self.admission.load(
+            pending, capacity,
+            self.metrics_collector.recent_latency_percentile('server_latency', 95)
+        )
+
+    def admit_stream(self, ws):
+        """Decide whether a new connection may stream frames for server-side inference"""
+        load = self.inference_load()
+        decision = self.admission.decide(len(self.stream_limits), load)
+        if decision == 'reject':
+            logger.warning(f"🚦 Stream rejected at load {load:.2f} with {len(self.stream_limits)} streams "
+                           f"(fallback: {self.admission.fallback})")
+            return decision
+        
+        self.stream_limits[ws] = {'downgraded': decision == 'downgrade', 'last_frame': 0.0}
+        logger.info(f"🚦 Stream admitted ({decision}) at load {load:.2f}, {len(self.stream_limits)} streams")
+        return decision
+
+    def rebalance_streams(self):
+        """Give every admitted stream its fair share of inference capacity"""
+        self.last_rebalance = time.monotonic()
+        load = self.inference_load()
+        for ws, limits in self.stream_limits.items():
+            target = self.admission.limits(len(self.stream_limits), load, limits['downgraded'])
+            if target['fps'] != limits.get('fps') or target['max_width'] != limits.get('max_width'):
+                limits.update(target)
+                self.send(ws, {'type': 'stream-limits', **target}, coalesce='stream-limits')
+
+    async def frame_consumer(self, ws, slot):
+        """Per-connection task: always infer the newest pending frame"""
+        while True:
+            frame_data = await slot.get()
+            if frame_data is None:
+                break
+            await self.process_frame_server_mode(ws, frame_data)
+
+    def close_frame_slot(self, ws):
+        """Stop a connection's frame consumer"""
+        slot = self.frame_slots.pop(ws, None)
+        if slot is not None:
+            slot.close()
+        task = self.frame_tasks.pop(ws, None)
+        if task is not None:
+            task.cancel()
+
+    async def notify_frame_dropped(self, ws, frame_data, reason):
+        """Record a dropped frame and tell the client so it can adapt its send rate"""
+        self.metrics_collector.record_frame_drop(reason)
+        self.send(ws, {
+            'type': 'frame-dropped',
+            'frame_id': frame_data.get('frame_id'),
+            'capture_ts': frame_data.get('capture_ts'),
+            'reason': reason
+        }, coalesce='frame-dropped')
 
     async def process_frame_server_mode(self, ws, frame_data):
         """Process frame in server mode with inference"""
+        engine = None
         try:
             frame_id = frame_data.get('frame_id')
             capture_ts = frame_data.get('capture_ts')
-            image_data = frame_data.get('image_data')  # Base64 encoded
+            image_data = frame_data.get('image_data')  # Base64 data URL or raw encoded bytes
+            
+            recv_ts = frame_data.get('recv_ts') or int(time.time() * 1000)
+            trace = frame_data.get('trace') or FrameTrace(frame_id)
+            trace.add('slot', trace.start, time.perf_counter())
+            
+            # Resolve the engine once so a hot swap mid-frame keeps the old session open
+            if self.model_registry.engines:
+                engine = self.model_registry.acquire(self.client_models.get(ws))
             
-            recv_ts = int(time.time() * 1000)
+            # Decoded WebRTC frames skip JPEG entirely; convert only the frame we infer,
+            # straight to letterbox size unless region inference needs full resolution
+            video_frame = frame_data.get('video_frame')
+            if video_frame is not None:
+                size = None
+                if self.region_mode == 'full':
+                    size = (engine or self.worker_pool).letterbox_size(video_frame.width, video_frame.height)
+                with trace.span('convert'):
+                    image_data = await asyncio.to_thread(self.webrtc_handler.frame_to_rgb, video_frame, size)
             
-            # Run inference
-            detections = await self.inference_engine.detect_objects(image_data)
+            tracker = None
+            if self.tracking:
+                tracker = self.trackers.get(ws)
+                if tracker is None:
+                    tracker = self.trackers[ws] = DetectionTracker(**self.tracker_config)
+            
+            gate = None
+            if self.motion_gating:
+                gate = self.motion_gates.get(ws)
+                if gate is None:
+                    gate = self.motion_gates[ws] = MotionGate(**self.motion_gate_config)
+            
+            # Run inference (or propagate tracks between keyframes)
+            keyframe = tracker is None or tracker.needs_detection()
+            cached = False
+            if not keyframe:
+                detections = tracker.predict(capture_ts)
+            else:
+                thumbnail = None
+                if gate is not None:
+                    with trace.span('motion_gate'):
+                        thumbnail = await asyncio.to_thread(gate.thumbnail, image_data)
+                        cached = gate.should_skip(thumbnail)
+                
+                if cached:
+                    detections = gate.detections
+                    self.metrics_collector.record_motion_gate(True, gate.inference_ms)
+                else:
+                    inference_start = time.perf_counter()
+                    detections = await self.run_inference(ws, engine, image_data, trace)
+                    if gate is not None and detections is not None:
+                        gate.record_inference(thumbnail, detections, (time.perf_counter() - inference_start) * 1000)
+                        self.metrics_collector.record_motion_gate(False)
             inference_ts = int(time.time() * 1000)
             
+            if detections is None:
+                # Inference queue is saturated; frame was dropped
+                await self.notify_frame_dropped(ws, frame_data, 'overloaded')
+                self.adapt_capture(ws)
+                return
+            
+            if tracker is not None:
+                if keyframe:
+                    detections = tracker.update(detections, capture_ts)
+                self.metrics_collector.record_tracking(keyframe)
+            
             # Prepare response
             response = {
                 'type': 'detections',
@@ -183,17 +718,204 @@ class DetectionServer:
                 'inference_ts': inference_ts,
                 'detections': detections
             }
+            if tracker is not None:
+                response['keyframe'] = keyframe
+            if gate is not None:
+                response['cached'] = cached
+            if ws in self.trace_clients:
+                # Stages up to here; serialize and send are only in the aggregates and exported traces
+                response['spans'] = trace.durations()
             
-            # Send back to client
-            await ws.send_str(json.dumps(response))
+            # Send back to client: data channel when open, WebSocket otherwise
+            await self.send_detections(ws, response, trace)
+            self.metrics_collector.record_trace(trace)
             
             # Record metrics
             self.metrics_collector.record_frame(
                 capture_ts, recv_ts, inference_ts, len(detections)
             )
+            self.adapt_capture(ws, recv_ts - capture_ts, inference_ts - recv_ts)
             
         except Exception as e:
             logger.error(f"Frame processing error: {e}")
+        finally:
+            if engine is not None:
+                self.model_registry.release(engine)
+
+    def adapt_capture(self, ws, network_latency=None, server_latency=None):
+        """Feed a client's frame latencies (or an overload drop) to its capture controller"""
+        if not self.capture_control or self.mode != 'server':
+            return
+        controller = self.capture_controllers.get(ws)
+        if controller is None:
+            controller = self.capture_controllers[ws] = CaptureController(**self.capture_config)
+        
+        if network_latency is None:
+            controller.record_overload()
+        else:
+            controller.record_frame(network_latency, server_latency)
+        
+        limits = self.stream_limits.get(ws, {})
+        pending, capacity = self.inference_backlog()
+        targets = controller.update(limits.get('fps'), limits.get('max_width'), min(1.0, pending / capacity))
+        if targets is not None:
+            self.send(ws, {'type': 'capture-control', **targets}, coalesce='capture-control')
+
+    async def run_inference(self, ws, engine, image_data, trace=None):
+        """Run one frame on whichever inference backend is configured"""
+        if self.region_mode == 'tiles':
+            return await engine.detect_regions(image_data, tile_grid=self.tile_grid,
+                                               include_full_frame=self.regions_include_full_frame, trace=trace)
+        if self.region_mode == 'roi':
+            return await engine.detect_regions(image_data, regions=await self.inference_regions(ws, image_data),
+                                               include_full_frame=self.regions_include_full_frame, trace=trace)
+        if self.worker_pool is not None:
+            # Worker processes time their own stages; here the round trip is one span
+            start = time.perf_counter()
+            detections = await self.worker_pool.detect_objects(image_data)
+            if trace is not None:
+                trace.add('worker', start, time.perf_counter())
+            return detections
+        if self.batch_scheduler is not None:
+            return await self.batch_scheduler.submit(image_data, engine, trace)
+        return await engine.detect_objects(image_data, trace)
+
+    async def inference_regions(self, ws, image_data):
+        """ROIs for a frame: the client's own, else the areas that moved since its last frame"""
+        rois = self.client_rois.get(ws)
+        if rois:
+            return rois
+        
+        detector = self.roi_motion.get(ws)
+        if detector is None:
+            detector = self.roi_motion[ws] = MotionGate(thumbnail_size=(160, 120))
+        thumbnail = await asyncio.to_thread(detector.thumbnail, image_data)
+        regions = motion_regions(detector.reference, thumbnail, self.motion_gate_config['pixel_threshold'])
+        detector.reference = thumbnail
+        return regions
+
+    async def send_class_table(self, ws):
+        """Switch a connection to binary results and send the class table they index into"""
+        if self.model_registry.engines:
+            class_names = self.model_registry.get(self.client_models.get(ws)).class_names
+        else:
+            class_names = list(COCO_CLASS_NAMES)  # What the worker processes' engines label with
+        self.client_encodings[ws] = {name: class_id for class_id, name in enumerate(class_names)}
+        self.send(ws, {
+            'type': 'class-table',
+            'encoding': 'binary',
+            'version': DETECTIONS_VERSION,
+            'classes': class_names
+        })
+
+    async def send_detections(self, ws, response, trace=None):
+        """
+        Deliver a detections message over the peer's data channel, or queue it on the WebSocket
+        Adds 'serialize' and 'send' (until the write completes) spans to the frame's trace.
+        """
+        trace = trace or FrameTrace(response.get('frame_id'))
+        serialize_start = time.perf_counter()
+        class_index = self.client_encodings.get(ws)
+        encoder = self.delta_encoders.get(ws)
+        coalesce = 'detections'  # Full results supersede each other
+        if class_index is not None and isinstance(response['frame_id'], int):
+            message = pack_detections(response, class_index)
+        elif encoder is not None:
+            coalesce = None  # Deltas build on one another and must all go out
+            update = encoder.encode(response)
+            self.metrics_collector.record_delta_update(
+                'suppressed' if update is None else 'keyframe' if update.get('sync') else 'delta'
+            )
+            if update is None:
+                return
+            message = json.dumps(update)
+        else:
+            # JSON clients, and JSON frames whose ids are not numeric
+            message = json.dumps(response)
+        send_start = time.perf_counter()
+        trace.add('serialize', serialize_start, send_start)
+        
+        if self.webrtc_handler.send_detections(self.peer_id(ws), message):
+            trace.add('send', send_start, time.perf_counter())
+            self.metrics_collector.record_traffic('datachannel', sent=len(message))
+            return
+        self.send(ws, message, coalesce=coalesce, on_sent=lambda: self.record_send(trace, send_start))
+
+    def record_send(self, trace, send_start):
+        """Writer callback for a queued result; the frame's trace has already been recorded"""
+        end = time.perf_counter()
+        trace.add('send', send_start, end)
+        self.metrics_collector.record_stage('send', end - send_start)
+
+    def open_send_queue(self, ws):
+        """Give a connection its bounded outbound queue and writer task"""
+        queue = OutboundQueue(max_depth=self.send_queue_depth)
+        self.send_queues[ws] = queue
+        self.send_tasks[ws] = asyncio.create_task(self.message_writer(ws, queue))
+
+    def close_send_queue(self, ws):
+        """Stop a connection's writer and discard what it had queued"""
+        queue = self.send_queues.pop(ws, None)
+        if queue is not None:
+            queue.close()
+        task = self.send_tasks.pop(ws, None)
+        if task is not None:
+            task.cancel()
+
+    def send(self, ws, message, coalesce=None, on_sent=None):
+        """
+        Queue a message (dict, str or bytes) for the connection's writer; never blocks
+        A queued message with the same coalesce key is replaced by this one.
+        on_sent is called once the message has been written.
+        Returns:
+            False if the message was not queued
+        """
+        queue = self.send_queues.get(ws)
+        if queue is None or queue.closed or ws.closed:
+            return False
+        if isinstance(message, dict):
+            message = json.dumps(message)
+        
+        if queue.lag() > self.send_max_lag:
+            self.disconnect_slow_consumer(ws, 'lag')
+            return False
+        coalesced = queue.messages_coalesced
+        if not queue.put(message, coalesce, on_sent):
+            self.disconnect_slow_consumer(ws, 'overflow')
+            return False
+        if queue.messages_coalesced > coalesced:
+            self.metrics_collector.record_message_drop('coalesced')
+        return True
+
+    async def message_writer(self, ws, queue):
+        """Per-connection task: write queued messages in order"""
+        while True:
+            message = await queue.get()
+            if message is None:
+                break
+            try:
+                if isinstance(message, bytes):
+                    await ws.send_bytes(message)
+                else:
+                    await ws.send_str(message)
+            except Exception as e:
+                logger.debug(f"WebSocket write failed: {e}")
+                queue.close()
+                break
+            queue.sent()
+            self.metrics_collector.record_traffic('websocket', sent=len(message))
+
+    def disconnect_slow_consumer(self, ws, reason):
+        """Close a connection whose client is not reading its messages"""
+        queue = self.send_queues.get(ws)
+        stats = queue.get_stats()
+        logger.warning(f"🐢 Disconnecting slow consumer ({reason}): "
+                       f"{stats['lag_ms']:.0f}ms behind, {stats['depth']} messages queued")
+        self.metrics_collector.record_message_drop(f'slow_consumer_{reason}', stats['depth'])
+        self.close_send_queue(ws)
+        task = asyncio.create_task(ws.close(code=WSCloseCode.TRY_AGAIN_LATER, message=b'slow consumer'))
+        self.disconnecting.add(task)
+        task.add_done_callback(self.disconnecting.discard)
 
     async def index_handler(self, request):
         """Serve the main page"""
@@ -327,9 +1049,188 @@ class DetectionServer:
         }
         return web.json_response(config)
     
+    def get_metrics_snapshot(self):
+        """Collect metrics plus live inference queue statistics"""
+        metrics = self.metrics_collector.get_current_metrics()
+        if self.mode == 'server':
+            if self.inference_engine is not None:
+                metrics['inference_queue'] = self.inference_engine.get_queue_stats()
+            if self.batch_scheduler is not None:
+                metrics['batch_scheduler'] = self.batch_scheduler.get_stats()
+            if self.worker_pool is not None and self.worker_pool.shm is not None:
+                metrics['worker_pool'] = self.worker_pool.get_stats()
+        metrics['webrtc'] = self.webrtc_handler.get_connection_stats()
+        if self.capture_controllers:
+            controllers = [controller.get_stats() for controller in self.capture_controllers.values()]
+            metrics['capture_control'] = {
+                'slo_ms': self.capture_config['slo_ms'],
+                'clients': len(controllers),
+                'mean_fps': sum(stats['fps'] for stats in controllers) / len(controllers),
+                'mean_width': sum(stats['width'] for stats in controllers) / len(controllers),
+                'adjustments': sum(stats['adjustments'] for stats in controllers)
+            }
+        if self.admission is not None:
+            metrics['admission'] = self.admission.status(len(self.stream_limits), self.inference_load())
+        
+        queues = [queue.get_stats() for queue in self.send_queues.values()]
+        metrics['send_queues'] = dict(
+            metrics.get('send_queues', {}),
+            connections=len(queues),
+            depth=sum(stats['depth'] for stats in queues),
+            max_depth=max((stats['depth'] for stats in queues), default=0),
+            peak_depth=max((stats['peak_depth'] for stats in queues), default=0),
+            max_lag_ms=max((stats['lag_ms'] for stats in queues), default=0.0)
+        )
+        return metrics
+
+    async def prometheus_handler(self, request):
+        """Prometheus text exposition: counters, gauges and latency histograms"""
+        writer = ExpositionWriter()
+        self.metrics_collector.write_prometheus(writer)
+        
+        writer.gauge('detection_websocket_connections', 'Open WebSocket connections', len(self.websockets))
+        writer.gauge('detection_peer_connections', 'Open WebRTC peer connections',
+                     len(self.webrtc_handler.peer_connections))
+        writer.gauge('detection_send_queue_depth', 'Messages queued for WebSocket writers',
+                     sum(len(queue.pending) for queue in self.send_queues.values()))
+        if self.model_registry is not None:
+            for name, engine in self.model_registry.engines.items():
+                writer.gauge('detection_inference_queue_depth', 'Frames submitted to a model and not finished',
+                             engine.queue_depth, {'model': name})
+        if self.admission is not None:
+            writer.gauge('detection_admitted_streams', 'Streams admitted for server-side inference',
+                         len(self.stream_limits))
+        
+        process = self.metrics_collector.process
+        cpu_times = process.cpu_times()
+        writer.gauge('process_resident_memory_bytes', 'Resident memory size in bytes', process.memory_info().rss)
+        writer.counter('process_cpu_seconds_total', 'User and system CPU time spent in seconds',
+                       cpu_times.user + cpu_times.system)
+        
+        return web.Response(body=writer.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    async def status_handler(self, request):
+        """Node status for load balancers: 503 while new streams would be turned away"""
+        if self.admission is None:
+            return web.json_response({'status': 'accepting', 'accepting': True, 'mode': self.mode})
+        status = self.admission.status(len(self.stream_limits), self.inference_load())
+        return web.json_response(status, status=200 if status['accepting'] else 503)
+
+    async def models_list_handler(self, request):
+        """List loaded models and the current default"""
+        if self.model_registry is None:
+            return web.json_response({'default': None, 'models': {}})
+        if not self.model_registry.engines:
+            # Only the worker processes hold a session
+            name = self.model_registry.default_model
+            spec = self.model_registry.specs[name]
+            return web.json_response({
+                'default': name,
+                'models': {name: {'path': str(spec['path']), 'input_size': self.worker_pool.input_size,
+                                  'backend': 'process'}}
+            })
+        return web.json_response(self.model_registry.list_models())
+
+    def check_admin(self, request):
+        """
+        Admin endpoints require X-Admin-Token to match ADMIN_TOKEN
+        Returns:
+            An error response, or None if the request may proceed
+        """
+        if not self.admin_token:
+            return web.json_response({'error': 'admin endpoints are disabled (ADMIN_TOKEN not set)'}, status=403)
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), self.admin_token.encode()):
+            return web.json_response({'error': 'unauthorized'}, status=401)
+        return None
+
+    async def read_json_object(self, request, required=True):
+        """
+        Parse a request body that must be a JSON object
+        Returns:
+            (body, None), or (None, 400 response) if it is missing, malformed or not an object
+        """
+        if not required and not request.can_read_body:
+            return {}, None
+        try:
+            body = await request.json()
+        except ValueError as e:
+            return None, web.json_response({'error': f'invalid JSON body: {e}'}, status=400)
+        if not isinstance(body, dict):
+            return None, web.json_response({'error': 'JSON body must be an object'}, status=400)
+        return body, None
+
+    async def admin_default_model_handler(self, request):
+        """Atomically switch the default model: {"model": name}"""
+        denied = self.check_admin(request)
+        if denied is not None:
+            return denied
+        if self.model_registry is None:
+            return web.json_response({'error': 'server mode only'}, status=400)
+        if self.worker_pool is not None:
+            return web.json_response({'error': 'model swaps are not available with the process inference backend'},
+                                     status=409)
+        
+        body, error = await self.read_json_object(request)
+        if error is not None:
+            return error
+        model = body.get('model')
+        if not isinstance(model, str):
+            return web.json_response({'error': '"model" must be a model name'}, status=400)
+        try:
+            previous = self.model_registry.set_default(model)
+        except KeyError as e:
+            return web.json_response({'error': str(e)}, status=404)
+        return web.json_response({'default': model, 'previous': previous})
+
+    async def admin_reload_model_handler(self, request):
+        """Load (or reload) a model from disk, optionally making it default: {"model": name, "default": bool}"""
+        denied = self.check_admin(request)
+        if denied is not None:
+            return denied
+        if self.model_registry is None:
+            return web.json_response({'error': 'server mode only'}, status=400)
+        if self.worker_pool is not None:
+            return web.json_response({'error': 'model swaps are not available with the process inference backend'},
+                                     status=409)
+        
+        body, error = await self.read_json_object(request)
+        if error is not None:
+            return error
+        model = body.get('model')
+        if not isinstance(model, str):
+            return web.json_response({'error': '"model" must be a model name'}, status=400)
+        try:
+            await self.model_registry.load_model(model, make_default=bool(body.get('default')))
+        except KeyError as e:
+            return web.json_response({'error': str(e)}, status=404)
+        except Exception as e:
+            logger.error(f"❌ Model reload failed: {e}")
+            return web.json_response({'error': str(e)}, status=500)
+        return web.json_response(self.model_registry.list_models())
+
+    async def admin_export_traces_handler(self, request):
+        """Write sampled frame traces as a Chrome trace-event file under metrics/: {"filename": name}"""
+        denied = self.check_admin(request)
+        if denied is not None:
+            return denied
+        
+        body, error = await self.read_json_object(request, required=False)
+        if error is not None:
+            return error
+        filename = body.get('filename') or f"traces_{int(time.time())}.json"
+        if not isinstance(filename, str):
+            return web.json_response({'error': '"filename" must be a string'}, status=400)
+        filename = Path(filename).name
+        try:
+            path = self.metrics_collector.export_traces(filename)
+        except OSError as e:
+            logger.error(f"❌ Trace export failed: {e}")
+            return web.json_response({'error': str(e)}, status=500)
+        return web.json_response({'path': str(path), 'traces': len(self.metrics_collector.sampled_traces)})
+
     async def metrics_handler(self, request):
         """API endpoint for metrics"""
-        metrics = self.metrics_collector.get_current_metrics()
+        metrics = self.get_metrics_snapshot()
         return web.json_response(metrics)
 
     def create_ssl_context(self):
@@ -375,15 +1276,45 @@ class DetectionServer:
         app.router.add_get('/demo', self.index_handler)  # Main demo page
         app.router.add_get('/ws', self.websocket_handler)
         app.router.add_get('/api/metrics', self.metrics_handler)
+        app.router.add_get('/api/status', self.status_handler)
+        app.router.add_get('/metrics', self.prometheus_handler)
+        app.router.add_get('/api/models', self.models_list_handler)
+        app.router.add_post('/api/admin/models/default', self.admin_default_model_handler)
+        app.router.add_post('/api/admin/models/reload', self.admin_reload_model_handler)
+        app.router.add_post('/api/admin/traces/export', self.admin_export_traces_handler)
         app.router.add_get('/api/ip', self.ip_handler)  # Get server IP for mobile QR codes
         app.router.add_get('/api/config', self.config_handler)  # Get detection configuration from .env
         app.router.add_get('/static/{filename}', self.static_handler)
         app.router.add_get('/models/{filename}', self.models_handler)
         app.router.add_get('/qr', self.qr_handler)  # QR code generator endpoint
         app.router.add_get('/test', self.mobile_test_handler)  # Mobile test page
+        
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
 
         return app
 
+    async def on_startup(self, app):
+        """Start background accounting once the event loop is running"""
+        self.metrics_collector.register_thread('event_loop')
+        self.traffic_task = asyncio.create_task(self.webrtc_traffic_loop())
+
+    async def on_cleanup(self, app):
+        if self.traffic_task is not None:
+            self.traffic_task.cancel()
+        if self.trace_file and self.metrics_collector.sampled_traces:
+            self.metrics_collector.export_traces(Path(self.trace_file).name)
+
+    async def webrtc_traffic_loop(self):
+        """Feed WebRTC transport byte counts (RTP, RTCP, SCTP) into the metrics at the sample interval"""
+        while True:
+            await asyncio.sleep(self.metrics_collector.sample_interval)
+            try:
+                sent, received = await self.webrtc_handler.poll_transport_bytes()
+                self.metrics_collector.record_traffic('webrtc', sent, received)
+            except Exception as e:
+                logger.debug(f"WebRTC stats poll failed: {e}")
+
     async def landing_handler(self, request):
         """Serve landing page to help users choose HTTP/HTTPS"""
         static_dir = Path(__file__).parent.parent / 'static'
@@ -472,19 +1403,29 @@ class DetectionServer:
         
         logger.info(f"📱 Mode: {self.mode.upper()}")
         
-        # Keep server running
+        if self.worker_pool is not None:
+            self.worker_pool.start()
+        
+        # Keep server running; Ctrl-C under asyncio.run arrives here as CancelledError
         try:
             await asyncio.Future()  # Run forever
-        except KeyboardInterrupt:
+        finally:
             logger.info("🛑 Shutting down server...")
             await runner.cleanup()
+            if self.batch_scheduler is not None:
+                await self.batch_scheduler.stop()
+            if self.worker_pool is not None:
+                await self.worker_pool.stop()
+            if self.model_registry is not None:
+                self.model_registry.close()
+            self.metrics_collector.stop()
 
 if __name__ == "__main__":
     server = DetectionServer()
     
     # Check if models exist for server mode
     if server.mode == 'server':
-        model_path = Path("models/yolov5n.onnx")
+        model_path = server.model_registry.specs[server.model_registry.default_model]['path']
         if not model_path.exists():
             logger.error("❌ Model file not found. Please ensure yolov5n.onnx is in ./models/")
             logger.info("💡 Run: wget https://github.com/ultralytics/yolov5/releases/download/v7.0/yolov5n.onnx -O models/yolov5n.onnx")
@@ -9,32 +9,66 @@ import time
 import threading
 from collections import deque
 from pathlib import Path
+import numpy as np
 import psutil
 import statistics
 
+from metrics_ring import FrameMetricsRing, LatencyHistogram
+from system_sampler import SystemSampler
+from prometheus_exporter import Histogram, LATENCY_BUCKETS, STAGE_BUCKETS
+from frame_trace import chrome_trace_events
+
 logger = logging.getLogger(__name__)
 
 class MetricsCollector:
-    def __init__(self, max_samples=1000):
+    def __init__(self, max_samples=1000, sample_interval=1.0, max_traces=500):
         self.max_samples = max_samples
+        self.sample_interval = sample_interval  # Seconds between system snapshots
         self.start_time = time.time()
         
         # Metrics storage
-        self.frame_metrics = deque(maxlen=max_samples)
+        self.frame_metrics = FrameMetricsRing(max_samples)
         self.system_metrics = deque(maxlen=100)  # Store last 100 system snapshots
+        self.batch_metrics = deque(maxlen=max_samples)
+        self.worker_metrics = {}  # worker_id -> latest utilisation snapshot
         
         # Counters
         self.total_frames = 0
         self.total_detections = 0
         self.frames_processed = 0
+        self.total_batches = 0
+        self.frames_dropped = 0
+        self.drop_reasons = {}
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self.gate_frames_checked = 0
+        self.gate_frames_skipped = 0
+        self.inference_ms_saved = 0.0
+        self.delta_updates = {}  # 'keyframe' / 'delta' / 'suppressed' -> count
+        self.messages_dropped = {}  # Outbound WebSocket messages never written, by reason
+        self.slow_consumer_disconnects = 0
+        self.traffic = {}  # Our own traffic by channel ('websocket', 'webrtc', ...) -> [sent, received] bytes
+        
+        # Prometheus histograms, fed per observation so /metrics never touches the samples
+        self.latency_histograms = {
+            kind: Histogram(LATENCY_BUCKETS) for kind in ('network', 'server', 'end_to_end')
+        }
+        self.stage_histograms = {}  # Pipeline stage ('decode', 'inference', 'send', ...) -> Histogram
+        self.stage_latency = {}  # Same stages at 0.1 ms resolution (ms), for the JSON summary
+        self.stage_lock = threading.Lock()
+        
+        # Finished traces of sampled frames, for Chrome trace-event export
+        self.sampled_traces = deque(maxlen=max_traces)
         
         # System monitoring
         self.process = psutil.Process()
         self.initial_cpu_times = self.process.cpu_times()
+        self.sampler = SystemSampler(self.process)
         
         # Threading for periodic system metrics
         self.system_monitor_active = True
-        self.system_monitor_thread = threading.Thread(target=self._monitor_system)
+        self.system_monitor_stop = threading.Event()
+        self.system_monitor_thread = threading.Thread(target=self._monitor_system, name='metrics-sampler')
         self.system_monitor_thread.daemon = True
         self.system_monitor_thread.start()
         
@@ -51,53 +85,117 @@ class MetricsCollector:
         server_latency = inference_ts - recv_ts
         end_to_end_latency = display_ts - capture_ts
         
-        frame_metric = {
-            'timestamp': current_ts,
-            'capture_ts': capture_ts,
-            'recv_ts': recv_ts,
-            'inference_ts': inference_ts,
-            'display_ts': display_ts,
-            'network_latency': network_latency,
-            'server_latency': server_latency,
-            'end_to_end_latency': end_to_end_latency,
-            'num_detections': num_detections
-        }
-        
-        self.frame_metrics.append(frame_metric)
+        self.frame_metrics.append(
+            timestamp=current_ts,
+            capture_ts=capture_ts,
+            recv_ts=recv_ts,
+            inference_ts=inference_ts,
+            display_ts=display_ts,
+            network_latency=network_latency,
+            server_latency=server_latency,
+            end_to_end_latency=end_to_end_latency,
+            num_detections=num_detections
+        )
+        for kind, latency in (('network', network_latency), ('server', server_latency),
+                              ('end_to_end', end_to_end_latency)):
+            self.latency_histograms[kind].observe(max(0.0, latency) / 1000)
         self.total_frames += 1
         self.total_detections += num_detections
         self.frames_processed += 1
         
         logger.debug(f"📈 Frame {self.total_frames}: E2E={end_to_end_latency}ms, Objects={num_detections}")
 
+    def record_frame_drop(self, reason='superseded'):
+        """Record a frame that was dropped before inference"""
+        self.frames_dropped += 1
+        self.drop_reasons[reason] = self.drop_reasons.get(reason, 0) + 1
+
+    def record_tracking(self, keyframe):
+        """Record whether a tracked stream's frame ran the detector or was propagated"""
+        if keyframe:
+            self.keyframes += 1
+        else:
+            self.tracked_frames += 1
+
+    def record_motion_gate(self, skipped, saved_ms=0.0):
+        """Record a motion-gate decision and the inference time a skip saved"""
+        self.gate_frames_checked += 1
+        if skipped:
+            self.gate_frames_skipped += 1
+            self.inference_ms_saved += saved_ms
+
+    def record_delta_update(self, kind):
+        """Record what a delta-mode connection was sent for one result"""
+        self.delta_updates[kind] = self.delta_updates.get(kind, 0) + 1
+
+    def record_message_drop(self, reason, count=1):
+        """Record outbound messages dropped: coalesced, or discarded with a slow consumer"""
+        self.messages_dropped[reason] = self.messages_dropped.get(reason, 0) + count
+        if reason.startswith('slow_consumer'):
+            self.slow_consumer_disconnects += 1
+
+    def record_stage(self, stage, seconds):
+        """Record one pipeline stage timing (also called from inference threads)"""
+        with self.stage_lock:
+            histogram = self.stage_histograms.get(stage)
+            if histogram is None:
+                histogram = self.stage_histograms[stage] = Histogram(STAGE_BUCKETS)
+                self.stage_latency[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+            self.stage_latency[stage].add(seconds * 1000)
+
+    def record_trace(self, trace):
+        """Aggregate a finished frame's spans per stage, keeping the trace if it was sampled"""
+        for stage, start, end, _ in trace.spans:
+            self.record_stage(stage, end - start)
+        if trace.sampled:
+            self.sampled_traces.append(trace)
+
+    def record_traffic(self, channel, sent=0, received=0):
+        """Count bytes of our own traffic on a channel"""
+        counters = self.traffic.setdefault(channel, [0, 0])
+        counters[0] += sent
+        counters[1] += received
+
+    def register_thread(self, group):
+        """Attribute the calling thread's CPU to a named group in the per-thread breakdown"""
+        self.sampler.register_thread(group)
+
+    def record_batch(self, batch_size, max_batch_size, queue_delay_ms):
+        """Record fill ratio and queueing delay for a dispatched inference batch"""
+        self.batch_metrics.append({
+            'timestamp': int(time.time() * 1000),
+            'batch_size': batch_size,
+            'fill_ratio': batch_size / max_batch_size if max_batch_size > 0 else 0,
+            'queue_delay_ms': queue_delay_ms
+        })
+        self.total_batches += 1
+
+    def record_worker_utilisation(self, worker_id, utilisation, frames=0, restarts=0, in_flight=0, alive=True,
+                                  failed=False):
+        """Record the latest utilisation snapshot for an inference worker process"""
+        self.worker_metrics[worker_id] = {
+            'timestamp': int(time.time() * 1000),
+            'utilisation': utilisation,
+            'frames': frames,
+            'restarts': restarts,
+            'in_flight': in_flight,
+            'alive': alive,
+            'failed': failed
+        }
+
     def _monitor_system(self):
         """Background thread to monitor system metrics"""
         while self.system_monitor_active:
             try:
-                # CPU and memory usage
-                cpu_percent = self.process.cpu_percent()
-                memory_info = self.process.memory_info()
-                system_cpu = psutil.cpu_percent(interval=1)
-                
-                # Network I/O (if available)
-                net_io = psutil.net_io_counters()
-                
-                system_metric = {
-                    'timestamp': int(time.time() * 1000),
-                    'process_cpu_percent': cpu_percent,
-                    'system_cpu_percent': system_cpu,
-                    'memory_rss': memory_info.rss,
-                    'memory_vms': memory_info.vms,
-                    'bytes_sent': net_io.bytes_sent if net_io else 0,
-                    'bytes_recv': net_io.bytes_recv if net_io else 0
-                }
-                
+                system_metric = self.sampler.sample()
+                system_metric['traffic'] = {channel: tuple(counters) for channel, counters in self.traffic.items()}
                 self.system_metrics.append(system_metric)
                 
             except Exception as e:
                 logger.error(f"❌ Error collecting system metrics: {e}")
             
-            time.sleep(5)  # Collect every 5 seconds
+            self.system_monitor_stop.wait(self.sample_interval)
 
     def get_current_metrics(self):
         """Get current performance metrics"""
@@ -110,38 +208,115 @@ class MetricsCollector:
             'total_detections': self.total_detections,
             'frames_processed': self.frames_processed,
             'processed_fps': self.frames_processed / runtime_seconds if runtime_seconds > 0 else 0,
-            'avg_detections_per_frame': self.total_detections / self.total_frames if self.total_frames > 0 else 0
+            'avg_detections_per_frame': self.total_detections / self.total_frames if self.total_frames > 0 else 0,
+            'frames_dropped': self.frames_dropped,
+            'drop_reasons': dict(self.drop_reasons)
         }
         
-        # Latency statistics
+        # Latency statistics (histograms track the ring, so no sorting here)
         if self.frame_metrics:
-            e2e_latencies = [m['end_to_end_latency'] for m in self.frame_metrics]
-            network_latencies = [m['network_latency'] for m in self.frame_metrics]
-            server_latencies = [m['server_latency'] for m in self.frame_metrics]
+            histograms = self.frame_metrics.histograms
+            e2e = histograms['end_to_end_latency']
+            e2e_median, e2e_p95, e2e_p99 = e2e.percentiles(50, 95, 99)
+            e2e_values = self.frame_metrics.columns['end_to_end_latency'][:len(self.frame_metrics)]
+            network_median, network_p95 = histograms['network_latency'].percentiles(50, 95)
+            server_median, server_p95 = histograms['server_latency'].percentiles(50, 95)
             
             metrics.update({
                 'latency': {
                     'end_to_end': {
-                        'median': statistics.median(e2e_latencies),
-                        'p95': self._percentile(e2e_latencies, 95),
-                        'p99': self._percentile(e2e_latencies, 99),
-                        'mean': statistics.mean(e2e_latencies),
-                        'min': min(e2e_latencies),
-                        'max': max(e2e_latencies)
+                        'median': e2e_median,
+                        'p95': e2e_p95,
+                        'p99': e2e_p99,
+                        'mean': e2e.mean(),
+                        'min': float(e2e_values.min()),
+                        'max': float(e2e_values.max())
                     },
                     'network': {
-                        'median': statistics.median(network_latencies),
-                        'p95': self._percentile(network_latencies, 95),
-                        'mean': statistics.mean(network_latencies)
+                        'median': network_median,
+                        'p95': network_p95,
+                        'mean': histograms['network_latency'].mean()
                     },
                     'server': {
-                        'median': statistics.median(server_latencies),
-                        'p95': self._percentile(server_latencies, 95),
-                        'mean': statistics.mean(server_latencies)
+                        'median': server_median,
+                        'p95': server_p95,
+                        'mean': histograms['server_latency'].mean()
                     }
                 }
             })
         
+        # Batching statistics
+        if self.batch_metrics:
+            batch_sizes = [b['batch_size'] for b in self.batch_metrics]
+            fill_ratios = [b['fill_ratio'] for b in self.batch_metrics]
+            queue_delays = [b['queue_delay_ms'] for b in self.batch_metrics]
+            
+            metrics['batching'] = {
+                'total_batches': self.total_batches,
+                'mean_batch_size': statistics.mean(batch_sizes),
+                'mean_fill_ratio': statistics.mean(fill_ratios),
+                'queue_delay_ms': {
+                    'median': statistics.median(queue_delays),
+                    'p95': self._percentile(queue_delays, 95),
+                    'mean': statistics.mean(queue_delays)
+                }
+            }
+        
+        # Detect-then-track
+        if self.keyframes or self.tracked_frames:
+            metrics['tracking'] = {
+                'keyframes': self.keyframes,
+                'tracked_frames': self.tracked_frames,
+                'keyframe_ratio': self.keyframes / (self.keyframes + self.tracked_frames)
+            }
+        
+        # Motion gate
+        if self.gate_frames_checked:
+            metrics['motion_gate'] = {
+                'frames_checked': self.gate_frames_checked,
+                'frames_skipped': self.gate_frames_skipped,
+                'skip_rate': self.gate_frames_skipped / self.gate_frames_checked,
+                'inference_ms_saved': self.inference_ms_saved
+            }
+        
+        # Delta-encoded result updates
+        if self.delta_updates:
+            total = sum(self.delta_updates.values())
+            metrics['delta_updates'] = dict(
+                self.delta_updates,
+                message_rate=(total - self.delta_updates.get('suppressed', 0)) / total
+            )
+        
+        # Outbound WebSocket queues (live depth is added by the server)
+        if self.messages_dropped:
+            metrics['send_queues'] = {
+                'messages_dropped': dict(self.messages_dropped),
+                'slow_consumer_disconnects': self.slow_consumer_disconnects
+            }
+        
+        # Per-stage pipeline timings
+        if self.stage_latency:
+            stages = {}
+            with self.stage_lock:
+                for stage, histogram in sorted(self.stage_latency.items()):
+                    if histogram.count:
+                        median, p95, p99 = histogram.percentiles(50, 95, 99)
+                        stages[stage] = {
+                            'count': histogram.count,
+                            'median': median,
+                            'p95': p95,
+                            'p99': p99,
+                            'mean': histogram.mean()
+                        }
+            metrics['stages'] = stages
+            metrics['sampled_traces'] = len(self.sampled_traces)
+        
+        # Inference worker processes
+        if self.worker_metrics:
+            metrics['workers'] = {
+                str(worker_id): dict(snapshot) for worker_id, snapshot in sorted(self.worker_metrics.items())
+            }
+        
         # System metrics
         if self.system_metrics:
             latest_system = self.system_metrics[-1]
@@ -161,18 +336,70 @@ class MetricsCollector:
                 uplink_kbps = 0
                 downlink_kbps = 0
             
+            # Our own channels over the same interval
+            traffic_kbps = {}
+            if len(self.system_metrics) >= 2 and time_diff > 0:
+                for channel, (sent, received) in latest_system['traffic'].items():
+                    prev_sent, prev_received = prev_system['traffic'].get(channel, (0, 0))
+                    traffic_kbps[channel] = {
+                        'uplink_kbps': (sent - prev_sent) * 8 / (time_diff * 1000),
+                        'downlink_kbps': (received - prev_received) * 8 / (time_diff * 1000)
+                    }
+            
             metrics.update({
                 'system': {
                     'process_cpu_percent': latest_system['process_cpu_percent'],
                     'system_cpu_percent': latest_system['system_cpu_percent'],
+                    'thread_cpu_percent': latest_system['thread_cpu_percent'],
                     'memory_mb': latest_system['memory_rss'] / (1024 * 1024),
+                    'net_source': latest_system['net_source'],
                     'uplink_kbps': uplink_kbps,
-                    'downlink_kbps': downlink_kbps
+                    'downlink_kbps': downlink_kbps,
+                    'traffic_kbps': traffic_kbps,
+                    'sample_interval_s': self.sample_interval
                 }
             })
         
         return metrics
 
+    def write_prometheus(self, writer):
+        """Add the collector's counters and histograms to a Prometheus exposition"""
+        writer.counter('detection_frames_total', 'Frames inferred and answered', self.total_frames)
+        writer.counter('detection_objects_total', 'Objects detected across all frames', self.total_detections)
+        for reason, count in sorted(self.drop_reasons.items()):
+            writer.counter('detection_frames_dropped_total', 'Frames dropped before inference',
+                           count, {'reason': reason})
+        for reason, count in sorted(self.messages_dropped.items()):
+            writer.counter('detection_messages_dropped_total', 'Outbound messages never written',
+                           count, {'reason': reason})
+        writer.counter('detection_slow_consumer_disconnects_total', 'Clients closed for not reading',
+                       self.slow_consumer_disconnects)
+        for kind, count in (('keyframe', self.keyframes), ('tracked', self.tracked_frames)):
+            writer.counter('detection_tracking_frames_total', 'Tracked-stream frames by how they were answered',
+                           count, {'kind': kind})
+        writer.counter('detection_motion_gate_skipped_total', 'Frames answered from the motion gate cache',
+                       self.gate_frames_skipped)
+        for channel, (sent, received) in sorted(self.traffic.items()):
+            for direction, count in (('sent', sent), ('received', received)):
+                writer.counter('detection_traffic_bytes_total', 'Bytes of our own traffic by channel',
+                               count, {'channel': channel, 'direction': direction})
+        
+        for kind, histogram in self.latency_histograms.items():
+            writer.histogram('detection_latency_seconds', 'Per-frame latency by leg',
+                             histogram, {'leg': kind})
+        with self.stage_lock:
+            stage_histograms = sorted(self.stage_histograms.items())
+        for stage, histogram in stage_histograms:
+            writer.histogram('detection_inference_stage_seconds', 'Frame pipeline stage timings',
+                             histogram, {'stage': stage})
+
+    def recent_latency_percentile(self, kind='server_latency', p=95, window_s=10):
+        """Percentile of one latency over the last window_s seconds of frames"""
+        if not self.frame_metrics:
+            return 0
+        recent = self.frame_metrics.column(kind)[self.frame_metrics.since(int(time.time() * 1000) - window_s * 1000)]
+        return float(np.percentile(recent, p)) if len(recent) else 0
+
     def _percentile(self, data, p):
         """Calculate percentile of data"""
         if not data:
@@ -191,16 +418,14 @@ class MetricsCollector:
         metrics = self.get_current_metrics()
         
         # Add raw frame data if requested
-        frame_data = []
-        for frame in self.frame_metrics:
-            if duration_filter is None or frame['timestamp'] >= duration_filter:
-                frame_data.append(frame)
+        mask = None if duration_filter is None else self.frame_metrics.since(duration_filter)
+        frame_count = len(self.frame_metrics) if mask is None else int(mask.sum())
         
         export_data = {
             'summary': metrics,
             'export_timestamp': int(time.time() * 1000),
-            'frame_count': len(frame_data),
-            'frames': frame_data[-100:] if len(frame_data) > 100 else frame_data  # Last 100 frames
+            'frame_count': frame_count,
+            'frames': self.frame_metrics.rows(mask, limit=100)  # Last 100 frames
         }
         
         # Save to file
@@ -213,32 +438,50 @@ class MetricsCollector:
         logger.info(f"📊 Metrics exported to {output_path}")
         return output_path
 
+    def export_traces(self, filename="traces.json"):
+        """Export sampled frame traces in Chrome trace-event format (chrome://tracing, Perfetto)"""
+        thread_names = {thread.native_id: thread.name for thread in threading.enumerate()}
+        thread_names.update(self.sampler.thread_groups)
+        export_data = {
+            'traceEvents': chrome_trace_events(list(self.sampled_traces), thread_names),
+            'displayTimeUnit': 'ms'
+        }
+        
+        output_path = Path("metrics") / filename
+        output_path.parent.mkdir(exist_ok=True)
+        
+        with open(output_path, 'w') as f:
+            json.dump(export_data, f)
+        
+        logger.info(f"🧵 {len(self.sampled_traces)} frame traces exported to {output_path}")
+        return output_path
+
     def get_benchmark_summary(self, duration_seconds=30):
         """Get a benchmark summary for the specified duration"""
         if not self.frame_metrics:
             return {"error": "No metrics available"}
         
         # Filter frames from the last duration_seconds
-        cutoff_time = int(time.time() * 1000) - (duration_seconds * 1000)
-        recent_frames = [f for f in self.frame_metrics if f['timestamp'] >= cutoff_time]
+        recent = self.frame_metrics.since(int(time.time() * 1000) - (duration_seconds * 1000))
+        frame_count = int(recent.sum())
         
-        if not recent_frames:
+        if not frame_count:
             return {"error": f"No metrics in last {duration_seconds} seconds"}
         
         # Calculate key metrics
-        e2e_latencies = [f['end_to_end_latency'] for f in recent_frames]
-        total_detections = sum(f['num_detections'] for f in recent_frames)
+        e2e_latencies = self.frame_metrics.column('end_to_end_latency')[recent]
+        total_detections = int(self.frame_metrics.column('num_detections')[recent].sum())
         
-        fps = len(recent_frames) / duration_seconds
+        fps = frame_count / duration_seconds
         
         summary = {
             'duration_seconds': duration_seconds,
-            'frames_processed': len(recent_frames),
+            'frames_processed': frame_count,
             'processed_fps': fps,
             'total_detections': total_detections,
-            'median_e2e_latency_ms': statistics.median(e2e_latencies),
-            'p95_e2e_latency_ms': self._percentile(e2e_latencies, 95),
-            'mean_e2e_latency_ms': statistics.mean(e2e_latencies)
+            'median_e2e_latency_ms': float(np.median(e2e_latencies)),
+            'p95_e2e_latency_ms': float(np.percentile(e2e_latencies, 95)),
+            'mean_e2e_latency_ms': float(e2e_latencies.mean())
         }
         
         # Add bandwidth if available
@@ -261,7 +504,29 @@ class MetricsCollector:
     def reset_metrics(self):
         """Reset all metrics counters"""
         self.frame_metrics.clear()
+        for histogram in self.latency_histograms.values():
+            histogram.reset()
+        # Inference threads record stages concurrently
+        with self.stage_lock:
+            for histogram in self.stage_histograms.values():
+                histogram.reset()
+            for histogram in self.stage_latency.values():
+                histogram.clear()
+        self.sampled_traces.clear()
         self.system_metrics.clear()
+        self.batch_metrics.clear()
+        self.worker_metrics.clear()
+        self.total_batches = 0
+        self.frames_dropped = 0
+        self.drop_reasons = {}
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self.gate_frames_checked = 0
+        self.gate_frames_skipped = 0
+        self.inference_ms_saved = 0.0
+        self.delta_updates = {}
+        self.messages_dropped = {}
+        self.slow_consumer_disconnects = 0
         self.total_frames = 0
         self.total_detections = 0
         self.frames_processed = 0
@@ -272,6 +537,7 @@ class MetricsCollector:
     def stop(self):
         """Stop the metrics collector"""
         self.system_monitor_active = False
+        self.system_monitor_stop.set()
         if self.system_monitor_thread.is_alive():
             self.system_monitor_thread.join(timeout=2)
         
@@ -0,0 +1,153 @@
+"""
+Column-oriented frame metrics storage
+A fixed-capacity ring of preallocated NumPy columns, plus log-linear latency
+histograms kept in step with the ring so percentiles never need a sort
+"""
+
+import numpy as np
+
+# Ring columns and their dtypes; timestamps stay float64 so client clocks keep sub-ms precision
+FRAME_COLUMNS = (
+    ('timestamp', np.int64),
+    ('capture_ts', np.float64),
+    ('recv_ts', np.float64),
+    ('inference_ts', np.float64),
+    ('display_ts', np.float64),
+    ('network_latency', np.float32),
+    ('server_latency', np.float32),
+    ('end_to_end_latency', np.float32),
+    ('num_detections', np.int32)
+)
+
+LATENCY_COLUMNS = ('network_latency', 'server_latency', 'end_to_end_latency')
+
+class LatencyHistogram:
+    """
+    HDR-style histogram over signed millisecond values
+    Values are counted in 0.1 ms units: exact below 12.8 ms, then 64 sub-buckets
+    per power of two (under 1.6% relative error) up to the clamp at max_ms.
+    Negative values (client/server clock skew) mirror into their own buckets.
+    """
+
+    UNIT_MS = 0.1
+    LINEAR = 128  # Exact unit buckets before the log-linear part
+    SUB_BUCKETS = 64  # Per power of two
+
+    def __init__(self, max_ms=60000.0):
+        self.max_units = int(max_ms / self.UNIT_MS)
+        size = self._index(self.max_units) + 1
+        self.positive = np.zeros(size, dtype=np.int64)
+        self.negative = np.zeros(size, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+
+        # Representative value (ms) of every bucket in value order, negatives first
+        representatives = np.round(np.array([self._representative(i) for i in range(size)]) * self.UNIT_MS, 2)
+        self.values = np.concatenate((-representatives[::-1], representatives))
+
+    def _index(self, units):
+        if units < self.LINEAR:
+            return units
+        shift = units.bit_length() - 7  # 128 == 2**7
+        sub = units >> shift  # 64..127
+        return self.LINEAR + (shift - 1) * self.SUB_BUCKETS + (sub - self.SUB_BUCKETS)
+
+    def _representative(self, index):
+        if index < self.LINEAR:
+            return index  # One unit wide, so the lower bound is exact to 0.1 ms
+        shift, sub = divmod(index - self.LINEAR, self.SUB_BUCKETS)
+        shift += 1
+        return ((sub + self.SUB_BUCKETS) << shift) + (1 << shift) / 2  # Midpoint
+
+    def _bucket(self, value):
+        units = min(int(abs(value) / self.UNIT_MS), self.max_units)
+        return (self.negative if value < 0 else self.positive), self._index(units)
+
+    def add(self, value):
+        counts, index = self._bucket(value)
+        counts[index] += 1
+        self.count += 1
+        self.total += value
+
+    def remove(self, value):
+        counts, index = self._bucket(value)
+        counts[index] -= 1
+        self.count -= 1
+        self.total -= value
+
+    def clear(self):
+        self.positive[:] = 0
+        self.negative[:] = 0
+        self.count = 0
+        self.total = 0.0
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentiles(self, *ps):
+        """Approximate percentiles in one O(buckets) pass"""
+        if not self.count:
+            return [0] * len(ps)
+        cumulative = np.cumsum(np.concatenate((self.negative[::-1], self.positive)))
+        ranks = [max(1, int(np.ceil(p / 100.0 * self.count))) for p in ps]
+        return [float(self.values[i]) for i in np.searchsorted(cumulative, ranks)]
+
+    def percentile(self, p):
+        return self.percentiles(p)[0]
+
+class FrameMetricsRing:
+    """Last `capacity` frames as NumPy columns, with sliding-window latency histograms"""
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in FRAME_COLUMNS}
+        self.histograms = {name: LatencyHistogram() for name in LATENCY_COLUMNS}
+        self.next = 0  # Slot the next frame is written to
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, **row):
+        """Store one frame, evicting the oldest from the histograms once full"""
+        slot = self.next
+        for name, histogram in self.histograms.items():
+            if self.size == self.capacity:
+                histogram.remove(float(self.columns[name][slot]))
+            self.columns[name][slot] = row[name]
+            histogram.add(float(self.columns[name][slot]))
+        for name in ('timestamp', 'capture_ts', 'recv_ts', 'inference_ts', 'display_ts', 'num_detections'):
+            self.columns[name][slot] = row[name]
+
+        self.next = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def column(self, name):
+        """A column's stored values, oldest first"""
+        values = self.columns[name]
+        if self.size < self.capacity:
+            return values[:self.size]
+        return np.concatenate((values[self.next:], values[:self.next]))
+
+    def since(self, timestamp_ms):
+        """Boolean mask (oldest first) of frames recorded at or after timestamp_ms"""
+        return self.column('timestamp') >= timestamp_ms
+
+    def rows(self, mask=None, limit=None):
+        """Frames as dicts, oldest first, for export"""
+        columns = {name: self.column(name) for name, _ in FRAME_COLUMNS}
+        if mask is not None:
+            columns = {name: values[mask] for name, values in columns.items()}
+        count = len(columns['timestamp'])
+        start = 0 if limit is None else max(0, count - limit)
+        return [{name: values[i].item() for name, values in columns.items()} for i in range(start, count)]
+
+    def clear(self):
+        self.next = 0
+        self.size = 0
+        for histogram in self.histograms.values():
+            histogram.clear()
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.columns.values())
@@ -0,0 +1,194 @@
+"""
+Model Registry for server-mode inference
+Loads and warms several ONNX models and hot-swaps the default without dropping peers
+"""
+
+import asyncio
+import json
+import logging
+from pathlib import Path
+
+from inferencr_engine import InferenceEngine
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    def __init__(self, models_dir="models", default_model=None, manifest_path=None,
+                 engine_kwargs=None, engine_settings=None, warmup_runs=2, stage_observer=None):
+        self.models_dir = Path(models_dir)
+        self.manifest_path = Path(manifest_path) if manifest_path else self.models_dir / 'models.json'
+        self.default_model = default_model
+        self.engine_kwargs = engine_kwargs or {}
+        self.engine_settings = engine_settings or {}  # Attributes applied after construction
+        self.warmup_runs = warmup_runs
+        self.stage_observer = stage_observer  # Attached after warmup so cold runs are not timed
+
+        self.specs = {}  # name -> {'path': Path, 'input_size': (w, h) or None}
+        self.engines = {}  # name -> warm InferenceEngine
+        self.retiring = set()
+        self.swap_lock = asyncio.Lock()
+
+    def discover(self):
+        """
+        Find models to serve
+        Every *.onnx in models_dir is registered under its file stem. An optional
+        models.json manifest adds named variants, e.g.
+            {"default": "yolov5n", "models": {"yolov5n_320": {"path": "yolov5n_320.onnx", "input_size": [320, 320]}}}
+        """
+        specs = {}
+        for path in sorted(self.models_dir.glob('*.onnx')):
+            specs[path.stem] = {'path': path, 'input_size': None}
+
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            for name, entry in manifest.get('models', {}).items():
+                path = Path(entry['path'])
+                if not path.is_absolute():
+                    path = self.models_dir / path
+                input_size = entry.get('input_size')
+                specs[name] = {'path': path, 'input_size': tuple(input_size) if input_size else None}
+            if self.default_model is None:
+                self.default_model = manifest.get('default')
+
+        self.specs.update(specs)
+        return specs
+
+    def add_model(self, name, path, input_size=None):
+        """Register a model file outside the discovery rules (e.g. MODEL_PATH)"""
+        self.specs[name] = {'path': Path(path), 'input_size': tuple(input_size) if input_size else None}
+
+    def load_all(self):
+        """Load and warm every registered model (blocking, used at startup)"""
+        if not self.specs:
+            self.discover()
+
+        for name, spec in self.specs.items():
+            try:
+                self.engines[name] = self._create_engine(spec)
+            except Exception as e:
+                logger.error(f"❌ Could not load model {name}: {e}")
+
+        if not self.engines:
+            raise RuntimeError(f"No loadable ONNX models in {self.models_dir}")
+
+        if self.default_model not in self.engines:
+            fallback = next(iter(self.engines))
+            if self.default_model is not None:
+                logger.warning(f"⚠️ Default model {self.default_model} unavailable, using {fallback}")
+            self.default_model = fallback
+
+        logger.info(f"📚 Model registry ready: {', '.join(self.engines)} (default: {self.default_model})")
+
+    def resolve_default(self):
+        """
+        Pick the default model without loading it, for backends that run sessions elsewhere
+        Returns:
+            (name, spec)
+        """
+        if not self.specs:
+            self.discover()
+
+        if not self.specs:
+            raise RuntimeError(f"No ONNX models in {self.models_dir}")
+
+        if self.default_model not in self.specs:
+            fallback = next(iter(self.specs))
+            if self.default_model is not None:
+                logger.warning(f"⚠️ Default model {self.default_model} unavailable, using {fallback}")
+            self.default_model = fallback
+
+        return self.default_model, self.specs[self.default_model]
+
+    def _create_engine(self, spec):
+        """Build, configure and warm one engine"""
+        engine = InferenceEngine(
+            mode="server",
+            model_path=spec['path'],
+            input_size=spec['input_size'],
+            **self.engine_kwargs
+        )
+        for attr, value in self.engine_settings.items():
+            setattr(engine, attr, value)
+        engine.warmup(self.warmup_runs)
+        engine.stage_observer = self.stage_observer
+        return engine
+
+    def get(self, name=None):
+        """Engine for a model name, or the current default"""
+        if name is not None and name in self.engines:
+            return self.engines[name]
+        return self.engines[self.default_model]
+
+    def acquire(self, name=None):
+        """Engine for a frame; a swap will not close it until the frame calls release()"""
+        engine = self.get(name)
+        engine.leases += 1
+        return engine
+
+    def release(self, engine):
+        engine.leases -= 1
+
+    def has_model(self, name):
+        return name in self.engines
+
+    def set_default(self, name):
+        """Atomically point new frames at another warm model"""
+        if name not in self.engines:
+            raise KeyError(f"Unknown model: {name}")
+        previous = self.default_model
+        self.default_model = name
+        logger.info(f"🔀 Default model switched: {previous} -> {name}")
+        return previous
+
+    async def load_model(self, name, make_default=False):
+        """
+        (Re)load a model from disk without interrupting traffic
+        The new engine is loaded and warmed off the event loop, swapped in, and
+        the old engine is closed only after its in-flight frames finish.
+        """
+        async with self.swap_lock:
+            self.discover()
+            if name not in self.specs:
+                raise KeyError(f"Unknown model: {name}")
+
+            engine = await asyncio.to_thread(self._create_engine, self.specs[name])
+            previous = self.engines.get(name)
+            self.engines[name] = engine
+            if make_default:
+                self.set_default(name)
+
+        if previous is not None:
+            task = asyncio.create_task(self._retire(previous))
+            self.retiring.add(task)
+            task.add_done_callback(self.retiring.discard)
+
+        logger.info(f"✅ Model {name} loaded and warm")
+        return engine
+
+    async def _retire(self, engine):
+        """Close a replaced engine once no frame holds it and nothing is queued or batching on it"""
+        while engine.leases > 0 or engine.pending_frames > 0:
+            await asyncio.sleep(0.05)
+        engine.close()
+        logger.info(f"🧹 Retired previous session for {engine.model_path.name}")
+
+    def list_models(self):
+        """Describe every loaded model"""
+        return {
+            "default": self.default_model,
+            "models": {
+                name: {
+                    "path": str(engine.model_path),
+                    "input_size": engine.input_size,
+                    "supports_batching": engine.supports_batching,
+                    "queue_depth": engine.queue_depth
+                }
+                for name, engine in self.engines.items()
+            }
+        }
+
+    def close(self):
+        """Shut down every engine"""
+        for engine in self.engines.values():
+            engine.close()
@@ -0,0 +1,122 @@
+"""
+Motion gate for server-mode streams
+Compares each frame to the last inferred one on a small grayscale thumbnail and
+reuses the cached detections when the scene has not meaningfully changed
+"""
+
+import base64
+import logging
+
+import cv2
+import numpy as np
+
+from frame_protocol import jpeg_dimensions
+
+logger = logging.getLogger(__name__)
+
+def motion_regions(previous, current, pixel_threshold=12, min_area_fraction=0.002, pad_fraction=0.05, max_regions=4):
+    """Normalized (xmin, ymin, xmax, ymax) boxes around areas that changed between two thumbnails"""
+    if previous is None or current is None or previous.shape != current.shape:
+        return []
+
+    mask = (cv2.absdiff(previous, current) > pixel_threshold).astype(np.uint8)
+    mask = cv2.dilate(mask, np.ones((3, 3), dtype=np.uint8), iterations=2)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+
+    height, width = mask.shape
+    regions = []
+    for x, y, w, h, area in stats[1:]:  # Row 0 is the background
+        if area < min_area_fraction * width * height:
+            continue
+        regions.append((area, (
+            max(0.0, x / width - pad_fraction),
+            max(0.0, y / height - pad_fraction),
+            min(1.0, (x + w) / width + pad_fraction),
+            min(1.0, (y + h) / height + pad_fraction)
+        )))
+
+    regions.sort(key=lambda region: region[0], reverse=True)
+    return [box for _, box in regions[:max_regions]]
+
+class MotionGate:
+    def __init__(self, pixel_threshold=12, min_changed_fraction=0.01, max_skip=30, thumbnail_size=(64, 48)):
+        self.pixel_threshold = pixel_threshold  # Gray-level delta for a pixel to count as changed
+        self.min_changed_fraction = min_changed_fraction  # Changed-pixel share that forces inference
+        self.max_skip = max_skip  # Consecutive skips before inference is forced anyway
+        self.thumbnail_size = thumbnail_size
+
+        self.reference = None
+        self.detections = None
+        self.skipped_in_row = 0
+        self.inference_ms = 0.0  # Moving average of this stream's inference cost
+
+        self.frames_checked = 0
+        self.frames_skipped = 0
+        self.last_changed_fraction = 1.0
+
+    def thumbnail(self, image_data):
+        """Downsampled grayscale of a frame, or None if it cannot be decoded"""
+        try:
+            if isinstance(image_data, str):
+                image_data = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
+            if isinstance(image_data, (bytes, bytearray, memoryview)):
+                gray = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), self._imdecode_flag(image_data))
+            elif isinstance(image_data, np.ndarray):
+                gray = cv2.cvtColor(image_data, cv2.COLOR_RGB2GRAY) if image_data.ndim == 3 else image_data
+            else:
+                return None
+        except Exception as e:
+            logger.debug(f"Motion gate could not decode frame: {e}")
+            return None
+
+        if gray is None:
+            return None
+        return cv2.resize(gray, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+
+    def _imdecode_flag(self, image_data):
+        """Largest JPEG reduced grayscale decode that still covers the thumbnail"""
+        dimensions = jpeg_dimensions(image_data)
+        if dimensions is None:
+            return cv2.IMREAD_GRAYSCALE
+
+        width, height = dimensions
+        thumb_w, thumb_h = self.thumbnail_size
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                             (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                             (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+            if width // factor >= thumb_w and height // factor >= thumb_h:
+                return flag
+        return cv2.IMREAD_GRAYSCALE
+
+    def should_skip(self, thumbnail):
+        """Whether cached detections can stand in for this frame"""
+        self.frames_checked += 1
+
+        if (thumbnail is None or self.reference is None or self.detections is None
+                or thumbnail.shape != self.reference.shape or self.skipped_in_row >= self.max_skip):
+            return False
+
+        changed = np.count_nonzero(cv2.absdiff(thumbnail, self.reference) > self.pixel_threshold)
+        self.last_changed_fraction = changed / thumbnail.size
+        if self.last_changed_fraction >= self.min_changed_fraction:
+            return False
+
+        self.skipped_in_row += 1
+        self.frames_skipped += 1
+        return True
+
+    def record_inference(self, thumbnail, detections, inference_ms):
+        """Make an inferred frame the new reference"""
+        self.reference = thumbnail
+        self.detections = detections
+        self.skipped_in_row = 0
+        self.inference_ms = inference_ms if self.inference_ms == 0 else 0.8 * self.inference_ms + 0.2 * inference_ms
+
+    def get_stats(self):
+        """Get gate state"""
+        return {
+            "frames_checked": self.frames_checked,
+            "frames_skipped": self.frames_skipped,
+            "skip_rate": self.frames_skipped / self.frames_checked if self.frames_checked else 0,
+            "changed_fraction": self.last_changed_fraction
+        }
@@ -0,0 +1,227 @@
+"""
+Detect-then-track for server-mode streams
+Runs the detector on keyframes and propagates boxes with a constant-velocity
+Kalman filter in between; the keyframe interval adapts to motion and match quality
+"""
+
+import itertools
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FRAME_DT = 1.0 / 15  # Seconds between frames when no timestamps are given
+
+def box_iou_matrix(a, b):
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-12), 0.0)
+
+class KalmanBoxTrack:
+    """One tracked object; state is [cx, cy, w, h, vcx, vcy, vw, vh] in normalized units per second"""
+
+    def __init__(self, track_id, detection):
+        self.track_id = track_id
+        self.label = detection['label']
+        self.score = detection['score']
+        self.hits = 1
+        self.misses = 0
+
+        self.x = np.zeros(8)
+        self.x[:4] = self._to_cxcywh(detection)
+        self.P = np.diag([1e-3, 1e-3, 1e-3, 1e-3, 1e-1, 1e-1, 1e-1, 1e-1])
+
+    @staticmethod
+    def _to_cxcywh(detection):
+        w = detection['xmax'] - detection['xmin']
+        h = detection['ymax'] - detection['ymin']
+        return np.array([detection['xmin'] + w / 2, detection['ymin'] + h / 2, w, h])
+
+    def predict(self, dt):
+        """Advance the state by dt seconds"""
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        # Process noise grows with dt and object size
+        scale = max(self.x[2], self.x[3], 1e-3)
+        q = (scale * 0.5) ** 2
+        Q = np.diag([q * dt ** 2] * 4 + [q] * 4)
+        self.x = F @ self.x
+        self.x[2:4] = np.maximum(self.x[2:4], 1e-4)
+        self.P = F @ self.P @ F.T + Q
+
+    def update(self, detection):
+        """Correct the state with a matched detection"""
+        z = self._to_cxcywh(detection)
+        R = np.eye(4) * (0.05 * max(z[2], z[3], 1e-3)) ** 2
+        H = np.eye(4, 8)
+        S = H @ self.P @ H.T + R
+        K = self.P @ H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - H @ self.x)
+        self.P = (np.eye(8) - K @ H) @ self.P
+
+        self.label = detection['label']
+        self.score = detection['score']
+        self.hits += 1
+        self.misses = 0
+
+    def box(self):
+        """Current xyxy box"""
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+    def speed(self):
+        """Centre speed relative to object size (sizes per second)"""
+        return float(np.hypot(self.x[4], self.x[5]) / max(self.x[2], self.x[3], 1e-3))
+
+    def to_detection(self):
+        xmin, ymin, xmax, ymax = np.clip(self.box(), 0.0, 1.0).tolist()
+        return {
+            'label': self.label,
+            'score': self.score,
+            'xmin': xmin,
+            'ymin': ymin,
+            'xmax': xmax,
+            'ymax': ymax,
+            'track_id': self.track_id
+        }
+
+class DetectionTracker:
+    def __init__(self, min_interval=1, max_interval=5, iou_threshold=0.3, max_misses=2,
+                 motion_threshold=1.5, confidence_threshold=0.6):
+        self.min_interval = max(1, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.motion_threshold = motion_threshold  # Object sizes per second before shortening the interval
+        self.confidence_threshold = confidence_threshold  # Mean keyframe IoU needed to lengthen it
+
+        self.tracks = []
+        self.track_ids = itertools.count(1)
+        self.interval = self.min_interval
+        self.frames_since_keyframe = 0
+        self.last_ts = None
+
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self.last_confidence = 1.0
+
+    def needs_detection(self):
+        """Whether the next frame should run the detector"""
+        return self.last_ts is None or self.frames_since_keyframe + 1 >= self.interval
+
+    def _advance(self, timestamp):
+        """Predict every track forward to timestamp (ms)"""
+        if timestamp is not None and self.last_ts is not None and timestamp > self.last_ts:
+            dt = (timestamp - self.last_ts) / 1000.0
+        else:
+            dt = DEFAULT_FRAME_DT
+        if timestamp is not None:
+            self.last_ts = timestamp
+        elif self.last_ts is None:
+            self.last_ts = 0
+        for track in self.tracks:
+            track.predict(dt)
+
+    def predict(self, timestamp=None):
+        """
+        Propagate tracks to an intermediate frame without running the detector
+        Returns:
+            List of detection dictionaries with track_id
+        """
+        self._advance(timestamp)
+        self.frames_since_keyframe += 1
+        self.tracked_frames += 1
+        return [track.to_detection() for track in self.tracks if track.misses == 0]
+
+    def update(self, detections, timestamp=None):
+        """
+        Correct tracks with a keyframe's detections and adapt the interval
+        Returns:
+            The detections with stable track_id values attached
+        """
+        self._advance(timestamp)
+        self.frames_since_keyframe = 0
+        self.keyframes += 1
+
+        predicted = np.array([track.box() for track in self.tracks]).reshape(-1, 4)
+        measured = np.array([[d['xmin'], d['ymin'], d['xmax'], d['ymax']] for d in detections]).reshape(-1, 4)
+        iou = box_iou_matrix(predicted, measured)
+
+        # Same-label only; greedy assignment on IoU is enough at these object counts
+        for t, track in enumerate(self.tracks):
+            for d, detection in enumerate(detections):
+                if track.label != detection['label']:
+                    iou[t, d] = 0.0
+
+        matched_tracks, matched_detections, match_ious = set(), {}, []
+        for flat in np.argsort(iou, axis=None)[::-1]:
+            t, d = divmod(int(flat), iou.shape[1])
+            if iou[t, d] < self.iou_threshold:
+                break
+            if t in matched_tracks or d in matched_detections:
+                continue
+            matched_tracks.add(t)
+            matched_detections[d] = self.tracks[t]
+            match_ious.append(iou[t, d])
+
+        for d, track in matched_detections.items():
+            track.update(detections[d])
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+
+        born = 0
+        for d, detection in enumerate(detections):
+            if d not in matched_detections:
+                matched_detections[d] = KalmanBoxTrack(next(self.track_ids), detection)
+                self.tracks.append(matched_detections[d])
+                born += 1
+
+        lost = sum(1 for track in self.tracks if track.misses > self.max_misses)
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        self._adapt_interval(match_ious, len(predicted), born, lost)
+
+        results = []
+        for d, detection in enumerate(detections):
+            result = dict(detection)
+            result['track_id'] = matched_detections[d].track_id
+            results.append(result)
+        return results
+
+    def _adapt_interval(self, match_ious, num_predicted, born, lost):
+        """Lengthen the interval when predictions held up, shorten it on motion or churn"""
+        if num_predicted:
+            # Unmatched predictions count as zero-IoU misses
+            self.last_confidence = float(sum(match_ious) / max(num_predicted, len(match_ious)))
+        else:
+            self.last_confidence = 1.0 if born == 0 else 0.0
+
+        motion = max((track.speed() for track in self.tracks), default=0.0)
+
+        if self.last_confidence < self.confidence_threshold or born or lost or motion > self.motion_threshold:
+            self.interval = max(self.min_interval, self.interval // 2)
+        elif self.last_confidence > (1 + self.confidence_threshold) / 2:
+            self.interval = min(self.max_interval, self.interval + 1)
+
+    def get_stats(self):
+        """Get tracker state"""
+        total = self.keyframes + self.tracked_frames
+        return {
+            "tracks": len(self.tracks),
+            "interval": self.interval,
+            "keyframes": self.keyframes,
+            "tracked_frames": self.tracked_frames,
+            "keyframe_ratio": self.keyframes / total if total else 0,
+            "confidence": self.last_confidence
+        }
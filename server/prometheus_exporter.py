@@ -0,0 +1,90 @@
+"""
+Prometheus text exposition
+Fixed-bucket histograms that are fed one observation at a time, and a writer
+for the text format (version 0.0.4) served at /metrics
+"""
+
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; end-to-end SLOs sit in the 50-500 ms range
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5, 5.0)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+class Histogram:
+    """Cumulative-on-read bucket counts; observe() is safe from inference threads"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """(cumulative counts per upper bound, sum, count)"""
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.sum = 0.0
+            self.count = 0
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+class ExpositionWriter:
+    def __init__(self):
+        self.lines = []
+        self.declared = set()
+
+    def _declare(self, name, kind, help_text):
+        if name not in self.declared:
+            self.declared.add(name)
+            self.lines.append(f'# HELP {name} {help_text}')
+            self.lines.append(f'# TYPE {name} {kind}')
+
+    def counter(self, name, help_text, value, labels=None):
+        self._declare(name, 'counter', help_text)
+        self.lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    def gauge(self, name, help_text, value, labels=None):
+        self._declare(name, 'gauge', help_text)
+        self.lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    def histogram(self, name, help_text, histogram, labels=None):
+        self._declare(name, 'histogram', help_text)
+        labels = dict(labels or {})
+        cumulative, total, count = histogram.snapshot()
+        for bound, running in cumulative:
+            self.lines.append(f'{name}_bucket{_format_labels(dict(labels, le=_format_value(bound)))} {running}')
+        self.lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(float(total))}')
+        self.lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
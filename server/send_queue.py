@@ -0,0 +1,90 @@
+"""
+Per-connection outbound message queue
+Bounded FIFO drained by one writer task; a newer message with the same
+coalescing key replaces a stale queued one instead of queueing behind it
+"""
+
+import asyncio
+import time
+from collections import deque
+
+class OutboundQueue:
+    def __init__(self, max_depth=32):
+        self.max_depth = max_depth
+        self.pending = deque()  # (coalesce key, message, enqueued_at, on_sent)
+        self.event = asyncio.Event()
+        self.closed = False
+        self.sending_since = None  # Enqueue time of the message being written, if any
+        self.on_sent = None  # Callback of the message being written, if any
+        self.messages_sent = 0
+        self.messages_coalesced = 0
+        self.peak_depth = 0
+
+    def put(self, message, coalesce=None, on_sent=None):
+        """
+        Queue a message; never blocks
+        on_sent is called once the writer has written it (not if it is coalesced away)
+        Returns:
+            False if the queue is closed or full, True otherwise
+        """
+        if self.closed:
+            return False
+
+        if coalesce is not None:
+            for index, (key, _, _, _) in enumerate(self.pending):
+                if key == coalesce:
+                    # Re-append rather than replace in place so it stays behind
+                    # anything (e.g. a class table) queued after the stale one
+                    del self.pending[index]
+                    self.messages_coalesced += 1
+                    break
+
+        if len(self.pending) >= self.max_depth:
+            return False
+
+        self.pending.append((coalesce, message, time.monotonic(), on_sent))
+        self.peak_depth = max(self.peak_depth, len(self.pending))
+        self.event.set()
+        return True
+
+    async def get(self):
+        """Wait for the oldest queued message; None once closed"""
+        while not self.pending and not self.closed:
+            self.event.clear()
+            await self.event.wait()
+        if self.closed:
+            return None
+        _, message, enqueued_at, self.on_sent = self.pending.popleft()
+        self.sending_since = enqueued_at
+        return message
+
+    def sent(self):
+        """Mark the message returned by get() as written"""
+        on_sent, self.on_sent = self.on_sent, None
+        self.sending_since = None
+        self.messages_sent += 1
+        if on_sent is not None:
+            on_sent()
+
+    def lag(self):
+        """Seconds the oldest unwritten message has been waiting"""
+        oldest = self.sending_since
+        if oldest is None and self.pending:
+            oldest = self.pending[0][2]
+        return 0.0 if oldest is None else time.monotonic() - oldest
+
+    def close(self):
+        """Discard queued messages and wake the writer so it can exit"""
+        self.closed = True
+        self.pending.clear()
+        self.event.set()
+
+    def get_stats(self):
+        """Get queue counters"""
+        return {
+            "depth": len(self.pending),
+            "peak_depth": self.peak_depth,
+            "sent": self.messages_sent,
+            "coalesced": self.messages_coalesced,
+            "lag_ms": self.lag() * 1000
+        }
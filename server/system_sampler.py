@@ -0,0 +1,134 @@
+"""
+Non-blocking system sampler
+CPU as deltas between samples (process, host, and per thread group), memory, and
+network bytes attributed to this process rather than the whole host
+"""
+
+import logging
+import socket
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# struct tcp_info (linux/tcp.h): tcpi_bytes_acked / tcpi_bytes_received, Linux 4.1+
+TCP_INFO_BYTES = struct.Struct('<QQ')
+TCP_INFO_BYTES_OFFSET = 120
+
+def thread_name(native_id):
+    """Kernel name of one of our threads (ORT and codec threads are not Python threads)"""
+    try:
+        return Path(f'/proc/self/task/{native_id}/comm').read_text().strip()
+    except OSError:
+        return 'native'
+
+class SystemSampler:
+    def __init__(self, process=None):
+        self.process = process or psutil.Process()
+        self.thread_groups = {}  # native thread id -> group name, registered by the threads themselves
+        self.thread_cpu = {}  # native thread id -> (user + system) seconds at the last sample
+        self.tcp_bytes = {}  # (fd, local, remote) -> (acked, received) at the last sample
+        self.tcp_sent = 0
+        self.tcp_received = 0
+        self.last_sample = None
+        self.tcp_info_available = sys.platform.startswith('linux') and hasattr(socket, 'TCP_INFO')
+        self.process_name = thread_name(self.process.pid)
+
+        # Prime the non-blocking percentages; their first real reading is the next call
+        self.process.cpu_percent()
+        psutil.cpu_percent(interval=None)
+
+    def register_thread(self, group):
+        """Attribute the calling thread's CPU to a named group (e.g. 'event_loop')"""
+        self.thread_groups[threading.get_native_id()] = group
+
+    def _group(self, native_id, python_threads):
+        if native_id in self.thread_groups:
+            return self.thread_groups[native_id]
+        name = python_threads.get(native_id)
+        if name is None:
+            # Native threads (ORT intra-op, codecs) inherit the process name unless they set one
+            name = thread_name(native_id)
+            if name == self.process_name:
+                return 'native'
+        # Executor threads are named "<prefix>_<n>"; group them by prefix
+        return name.rsplit('_', 1)[0] if '_' in name else name
+
+    def _thread_cpu(self, elapsed):
+        """CPU percent per thread group since the last sample"""
+        python_threads = {thread.native_id: thread.name for thread in threading.enumerate()}
+        groups = {}
+        seen = {}
+        for thread in self.process.threads():
+            cpu = thread.user_time + thread.system_time
+            seen[thread.id] = cpu
+            previous = self.thread_cpu.get(thread.id)
+            if previous is None or elapsed <= 0:
+                continue
+            group = self._group(thread.id, python_threads)
+            groups[group] = groups.get(group, 0.0) + (cpu - previous) / elapsed * 100
+        self.thread_cpu = seen
+        return groups
+
+    def _tcp_counters(self):
+        """Cumulative bytes acked/received on this process's TCP sockets (TCP_INFO deltas)"""
+        current = {}
+        # psutil < 6 names it connections()
+        net_connections = getattr(self.process, 'net_connections', None) or self.process.connections
+        for connection in net_connections(kind='tcp'):
+            if connection.fd < 0 or not connection.raddr:
+                continue
+            key = (connection.fd, connection.laddr, connection.raddr)
+            try:
+                with socket.socket(fileno=socket.dup(connection.fd)) as sock:
+                    info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 256)
+            except OSError:
+                continue
+            if len(info) < TCP_INFO_BYTES_OFFSET + TCP_INFO_BYTES.size:
+                self.tcp_info_available = False
+                return None
+            current[key] = TCP_INFO_BYTES.unpack_from(info, TCP_INFO_BYTES_OFFSET)
+
+        for key, (acked, received) in current.items():
+            previous_acked, previous_received = self.tcp_bytes.get(key, (0, 0))
+            self.tcp_sent += max(0, acked - previous_acked)
+            self.tcp_received += max(0, received - previous_received)
+        self.tcp_bytes = current
+        return self.tcp_sent, self.tcp_received
+
+    def sample(self):
+        """One snapshot; never sleeps, so the caller sets the interval"""
+        now = time.monotonic()
+        elapsed = now - self.last_sample if self.last_sample is not None else 0.0
+        self.last_sample = now
+
+        memory_info = self.process.memory_info()
+        snapshot = {
+            'timestamp': int(time.time() * 1000),
+            'process_cpu_percent': self.process.cpu_percent(),
+            'system_cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_rss': memory_info.rss,
+            'memory_vms': memory_info.vms,
+            'thread_cpu_percent': self._thread_cpu(elapsed)
+        }
+
+        counters = None
+        if self.tcp_info_available:
+            try:
+                counters = self._tcp_counters()
+            except (psutil.Error, OSError) as e:
+                logger.debug(f"Per-process TCP accounting unavailable: {e}")
+                self.tcp_info_available = False
+        if counters is not None:
+            snapshot.update(net_source='process_tcp', bytes_sent=counters[0], bytes_recv=counters[1])
+        else:
+            # Host-wide fallback: includes every process on the box
+            net_io = psutil.net_io_counters()
+            snapshot.update(net_source='host', bytes_sent=net_io.bytes_sent if net_io else 0,
+                            bytes_recv=net_io.bytes_recv if net_io else 0)
+        return snapshot
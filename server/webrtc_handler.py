@@ -8,10 +8,16 @@ import logging
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
 from aiortc.contrib.media import MediaStreamTrack
 import av
+import cv2
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Detection results travel on a pre-negotiated channel both sides create with
+# the same id, so no renegotiation is needed once the offer carries SCTP
+DETECTION_CHANNEL_LABEL = "detections"
+DETECTION_CHANNEL_ID = 1
+
 class WebRTCHandler:
     def __init__(self):
         # STUN servers for NAT traversal
@@ -23,6 +29,12 @@ class WebRTCHandler:
         self.config = RTCConfiguration(iceServers=self.ice_servers)
         self.peer_connections = {}
         self.video_tracks = {}
+        self.on_video_track = None  # Optional callback(client_id, track) for server-side consumers
+        self.data_channels = {}  # client_id -> detections RTCDataChannel
+        self.max_buffered_bytes = 64 * 1024  # Beyond this, a result would only arrive stale
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.transport_bytes = {}  # client_id -> (sent, received) transport bytes at the last poll
         
         logger.info("🔗 WebRTC Handler initialized")
 
@@ -49,11 +61,26 @@ class WebRTCHandler:
                 if track.kind == "video":
                     self.video_tracks[client_id] = track
                     logger.info(f"✅ Video track registered for {client_id}")
+                    if self.on_video_track is not None:
+                        self.on_video_track(client_id, track)
 
             # Set remote description (offer)
             offer = RTCSessionDescription(sdp=sdp_offer, type="offer")
             await pc.setRemoteDescription(offer)
             
+            # Unordered, no retransmits: a lost result is never resent and
+            # never holds back a newer one
+            if "m=application" in sdp_offer:
+                channel = pc.createDataChannel(
+                    DETECTION_CHANNEL_LABEL, ordered=False, maxRetransmits=0,
+                    negotiated=True, id=DETECTION_CHANNEL_ID
+                )
+                self.data_channels[client_id] = channel
+                
+                @channel.on("open")
+                def on_open():
+                    logger.info(f"📡 Detection data channel open for {client_id}")
+            
             # Create answer
             answer = await pc.createAnswer()
             await pc.setLocalDescription(answer)
@@ -103,8 +130,8 @@ class WebRTCHandler:
             logger.error(f"❌ Error adding ICE candidate: {e}")
             logger.debug(f"Candidate data: {candidate_data}")
 
-    async def get_video_frame(self, client_id=None):
-        """Get latest video frame from client"""
+    async def get_video_frame(self, client_id=None, size=None):
+        """Get latest video frame from client, optionally scaled to size=(width, height)"""
         if client_id is None and self.video_tracks:
             client_id = list(self.video_tracks.keys())[0]
         
@@ -116,13 +143,70 @@ class WebRTCHandler:
             frame = await track.recv()
             
             # Convert to numpy array
-            img = frame.to_ndarray(format="rgb24")
-            return img
+            return self.frame_to_rgb(frame, size)
             
         except Exception as e:
             logger.error(f"❌ Error getting video frame: {e}")
             return None
 
+    def send_detections(self, client_id, message):
+        """
+        Send a detection message on the peer's data channel
+        Returns:
+            True if the channel took the message; False when there is no open
+            channel (use the WebSocket instead)
+        """
+        channel = self.data_channels.get(client_id)
+        if channel is None or channel.readyState != "open":
+            return False
+        
+        if channel.bufferedAmount > self.max_buffered_bytes:
+            # Congested: drop rather than queue behind older results
+            self.messages_dropped += 1
+            return True
+        
+        channel.send(message)
+        self.messages_sent += 1
+        return True
+
+    @staticmethod
+    def frame_to_rgb(frame, size=None):
+        """
+        Convert a decoded av.VideoFrame to an RGB numpy array
+        With size=(width, height) the frame is scaled before colour conversion,
+        so the full-resolution RGB frame is never materialised: yuv420p (what
+        the aiortc decoders produce) is resized plane by plane and converted
+        at the target size; other formats go through one swscale reformat.
+        """
+        if size is None or (frame.width, frame.height) == tuple(size):
+            return frame.to_ndarray(format="rgb24")
+        width, height = size
+        if frame.format.name == "yuv420p" and width % 2 == 0 and height % 2 == 0:
+            return WebRTCHandler._yuv420p_to_rgb(frame, width, height)
+        return frame.reformat(width=width, height=height, format="rgb24", interpolation="BILINEAR").to_ndarray()
+
+    @staticmethod
+    def _yuv420p_to_rgb(frame, width, height):
+        """Resize Y, U and V straight from the frame's planes into one I420 buffer, then convert"""
+        def plane(index, plane_w, plane_h):
+            # Zero-copy view; rows may be padded out to line_size
+            data = frame.planes[index]
+            return np.frombuffer(data, dtype=np.uint8).reshape(-1, data.line_size)[:plane_h, :plane_w]
+        
+        i420 = np.empty((height * 3 // 2, width), dtype=np.uint8)
+        flat = i420.reshape(-1)
+        chroma_w, chroma_h = width // 2, height // 2
+        src_chroma_w, src_chroma_h = (frame.width + 1) // 2, (frame.height + 1) // 2
+        
+        cv2.resize(plane(0, frame.width, frame.height), (width, height),
+                   dst=i420[:height], interpolation=cv2.INTER_LINEAR)
+        for index, offset in ((1, width * height), (2, width * height + chroma_w * chroma_h)):
+            cv2.resize(plane(index, src_chroma_w, src_chroma_h), (chroma_w, chroma_h),
+                       dst=flat[offset:offset + chroma_w * chroma_h].reshape(chroma_h, chroma_w),
+                       interpolation=cv2.INTER_LINEAR)
+        
+        return cv2.cvtColor(i420, cv2.COLOR_YUV2RGB_I420)
+
     async def cleanup_peer_connection(self, client_id):
         """Clean up peer connection and related resources"""
         try:
@@ -135,6 +219,9 @@ class WebRTCHandler:
             if client_id in self.video_tracks:
                 del self.video_tracks[client_id]
                 logger.info(f"🧹 Cleaned up video track for {client_id}")
+            
+            self.data_channels.pop(client_id, None)
+            self.transport_bytes.pop(client_id, None)
                 
         except Exception as e:
             logger.error(f"❌ Error cleaning up peer connection: {e}")
@@ -146,11 +233,32 @@ class WebRTCHandler:
         
         logger.info("🛑 All peer connections closed")
 
+    async def poll_transport_bytes(self):
+        """Bytes sent and received on all peer transports since the last poll"""
+        sent = received = 0
+        for client_id, pc in list(self.peer_connections.items()):
+            try:
+                report = await pc.getStats()
+            except Exception as e:
+                logger.debug(f"getStats failed for {client_id}: {e}")
+                continue
+            transports = {stats.id: stats for stats in report.values() if stats.type == 'transport'}
+            total_sent = sum(stats.bytesSent for stats in transports.values())
+            total_received = sum(stats.bytesReceived for stats in transports.values())
+            previous_sent, previous_received = self.transport_bytes.get(client_id, (0, 0))
+            sent += max(0, total_sent - previous_sent)
+            received += max(0, total_received - previous_received)
+            self.transport_bytes[client_id] = (total_sent, total_received)
+        return sent, received
+
     def get_connection_stats(self):
         """Get statistics for all connections"""
         stats = {
             "total_connections": len(self.peer_connections),
             "active_video_tracks": len(self.video_tracks),
+            "open_data_channels": sum(1 for channel in self.data_channels.values() if channel.readyState == "open"),
+            "data_channel_messages": self.messages_sent,
+            "data_channel_dropped": self.messages_dropped,
             "connections": {}
         }
         
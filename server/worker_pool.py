@@ -0,0 +1,401 @@
+"""
+Inference Worker Pool
+Runs InferenceEngine sessions in separate processes fed by a shared-memory frame ring
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from inferencr_engine import letterbox_geometry
+
+logger = logging.getLogger(__name__)
+
+# Slot payload kinds
+PAYLOAD_ENCODED = 0  # Raw JPEG/WebP bytes
+PAYLOAD_BASE64 = 1  # Base64 data URL text, decoded in the worker
+PAYLOAD_RAW = 2  # Decoded uint8 pixels
+
+HEARTBEAT_INTERVAL = 1.0  # Seconds an idle worker waits before reporting in
+
+def _worker_main(worker_id, shm_name, slot_bytes, task_queue, result_queue, engine_config):
+    """Worker process entry point: own one InferenceEngine and serve ring slots"""
+    from inferencr_engine import InferenceEngine
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - worker-%(process)d - %(levelname)s - %(message)s')
+
+    # Spawned workers share the parent's resource tracker, so attaching here
+    # does not take ownership; the parent unlinks the ring on stop()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    engine_settings = engine_config.pop('settings', {})
+    engine = InferenceEngine(mode="server", max_workers=0, **engine_config)
+    for attr, value in engine_settings.items():
+        setattr(engine, attr, value)
+    result_queue.put(('ready', worker_id, tuple(engine.input_size), 0.0))
+
+    try:
+        while True:
+            try:
+                task = task_queue.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                result_queue.put(('heartbeat', worker_id, None, 0.0))
+                continue
+            if task is None:
+                break
+
+            job_id, slot, kind, nbytes, shape = task
+            start_time = time.perf_counter()
+            offset = slot * slot_bytes
+            view = shm.buf[offset:offset + nbytes]
+            try:
+                if kind == PAYLOAD_RAW:
+                    image = np.ndarray(shape, dtype=np.uint8, buffer=view)
+                elif kind == PAYLOAD_BASE64:
+                    image = bytes(view).decode('ascii')
+                else:
+                    image = view
+                detections = engine._detect_sync(image)
+            finally:
+                # Drop every export of the slot before releasing it
+                image = None
+                view.release()
+
+            result_queue.put(('result', worker_id, (job_id, detections), time.perf_counter() - start_time))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shm.close()
+
+class InferenceWorkerPool:
+    def __init__(self, num_workers=2, model_path="models/yolov5n.onnx", input_size=None, ring_slots=16,
+                 slot_bytes=4 * 1024 * 1024, intra_op_threads=1, health_interval=5.0,
+                 health_timeout=30.0, metrics_collector=None, engine_settings=None,
+                 max_restarts=5, restart_backoff=1.0, max_restart_backoff=60.0):
+        self.num_workers = max(1, num_workers)
+        self.ring_slots = max(1, ring_slots)
+        self.slot_bytes = slot_bytes
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.max_restarts = max_restarts  # Consecutive failures after which a worker is left down
+        self.restart_backoff = restart_backoff  # Seconds before the first restart, doubled per failure
+        self.max_restart_backoff = max_restart_backoff  # Also how long a worker must stay up to reset its failures
+        self.metrics_collector = metrics_collector
+        self.engine_config = {
+            'model_path': str(model_path),
+            'input_size': input_size,
+            'intra_op_threads': intra_op_threads,
+            'settings': dict(engine_settings or {})
+        }
+
+        # Spawn, not fork: ORT thread pools do not survive a fork
+        self.ctx = mp.get_context('spawn')
+        self.shm = None
+        self.free_slots = deque()
+        self.result_queue = None
+        self.workers = {}
+        self.jobs = {}  # job_id -> (worker_id, slot, future)
+        self.job_ids = itertools.count()
+        self.frames_rejected = 0
+        self.input_size = None  # Model input (width, height), reported by the workers once loaded
+
+        self.loop = None
+        self.reader_thread = None
+        self.health_task = None
+
+        logger.info(f"🏭 Worker pool configured: {self.num_workers} processes, {self.ring_slots} slots")
+
+    def start(self):
+        """Create the shared-memory ring, spawn workers and start monitoring"""
+        if self.shm is not None:
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self.shm = shared_memory.SharedMemory(create=True, size=self.ring_slots * self.slot_bytes)
+        self.free_slots = deque(range(self.ring_slots))
+        self.result_queue = self.ctx.Queue()
+
+        for worker_id in range(self.num_workers):
+            self._spawn_worker(worker_id)
+
+        self.reader_thread = threading.Thread(target=self._read_results, daemon=True)
+        self.reader_thread.start()
+        self.health_task = asyncio.create_task(self._health_loop())
+
+        logger.info(f"🏭 Worker pool started (ring {self.shm.name}, {self.ring_slots * self.slot_bytes // (1024 * 1024)} MB)")
+
+    def _spawn_worker(self, worker_id):
+        """Start (or restart) one worker process with a fresh task queue"""
+        previous = self.workers.get(worker_id)
+        task_queue = self.ctx.Queue()
+        process = self.ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.shm.name, self.slot_bytes, task_queue, self.result_queue, self.engine_config),
+            name=f"inference-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+
+        now = time.time()
+        self.workers[worker_id] = {
+            'process': process,
+            'spawned_at': now,
+            'failures': previous['failures'] if previous else 0,  # Consecutive, reset once stable
+            'restart_at': None,  # Pending respawn time while backing off
+            'failed': False,  # Gave up after max_restarts
+            'task_queue': task_queue,
+            'ready': False,
+            'in_flight': set(),
+            'frames': previous['frames'] if previous else 0,
+            'busy_seconds': previous['busy_seconds'] if previous else 0.0,
+            'restarts': previous['restarts'] + 1 if previous else 0,
+            'last_seen': now,
+            'window_start': now,
+            'window_busy': previous['busy_seconds'] if previous else 0.0,
+            'utilisation': 0.0
+        }
+        logger.info(f"👷 Worker {worker_id} spawned (pid {process.pid})")
+
+    async def detect_objects(self, image_data):
+        """
+        Run detection on a worker process
+        Returns:
+            List of detection dictionaries, or None if the frame was dropped
+            (ring full, no healthy worker, or the worker crashed mid-frame)
+        """
+        if self.shm is None:
+            self.start()
+
+        worker_id = self._pick_worker()
+        if worker_id is None or not self.free_slots:
+            self.frames_rejected += 1
+            logger.warning("⚠️ Worker pool saturated, dropping frame")
+            return None
+
+        slot = self.free_slots.popleft()
+        try:
+            kind, nbytes, shape = self._write_slot(slot, image_data)
+        except ValueError as e:
+            self.free_slots.append(slot)
+            logger.error(f"❌ Cannot queue frame: {e}")
+            return []
+
+        job_id = next(self.job_ids)
+        future = self.loop.create_future()
+        self.jobs[job_id] = (worker_id, slot, future)
+        worker = self.workers[worker_id]
+        worker['in_flight'].add(job_id)
+        worker['task_queue'].put((job_id, slot, kind, nbytes, shape))
+
+        return await future
+
+    def letterbox_size(self, src_w, src_h):
+        """Size workers scale a frame to before padding, or None until one has loaded its model"""
+        if self.input_size is None:
+            return None
+        _, new_w, new_h, _, _ = letterbox_geometry(self.input_size, src_w, src_h)
+        return new_w, new_h
+
+    def _pick_worker(self):
+        """Least-loaded worker that is alive and has finished loading"""
+        candidates = [
+            (len(worker['in_flight']), worker_id)
+            for worker_id, worker in self.workers.items()
+            if worker['ready'] and worker['process'].is_alive()
+        ]
+        return min(candidates)[1] if candidates else None
+
+    def _write_slot(self, slot, image_data):
+        """Copy a frame into a ring slot; only the slot index crosses the process boundary"""
+        offset = slot * self.slot_bytes
+
+        if isinstance(image_data, np.ndarray):
+            if image_data.dtype != np.uint8:
+                raise ValueError(f"Unsupported frame dtype: {image_data.dtype}")
+            kind, nbytes, shape = PAYLOAD_RAW, image_data.nbytes, image_data.shape
+            if nbytes > self.slot_bytes:
+                raise ValueError(f"Frame of {nbytes} bytes exceeds slot size {self.slot_bytes}")
+            target = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+            target[...] = image_data
+            del target
+            return kind, nbytes, shape
+
+        if isinstance(image_data, str):
+            kind, payload = PAYLOAD_BASE64, image_data.encode('ascii')
+        elif isinstance(image_data, (bytes, bytearray, memoryview)):
+            kind, payload = PAYLOAD_ENCODED, image_data
+        else:
+            raise ValueError("Unsupported image format")
+
+        nbytes = len(payload)
+        if nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {nbytes} bytes exceeds slot size {self.slot_bytes}")
+        self.shm.buf[offset:offset + nbytes] = payload
+        return kind, nbytes, None
+
+    def _read_results(self):
+        """Background thread: forward worker messages to the event loop"""
+        while True:
+            try:
+                message = self.result_queue.get()
+            except (EOFError, OSError):
+                break
+            if message is None:
+                break
+            self.loop.call_soon_threadsafe(self._handle_message, message)
+
+    def _handle_message(self, message):
+        """Apply a worker message on the event loop thread"""
+        kind, worker_id, payload, busy_seconds = message
+        worker = self.workers.get(worker_id)
+        if worker is not None:
+            worker['last_seen'] = time.time()
+
+        if kind == 'ready':
+            if worker is not None:
+                worker['ready'] = True
+            self.input_size = payload
+            logger.info(f"✅ Worker {worker_id} ready")
+        elif kind == 'result':
+            job_id, detections = payload
+            self._finish_job(job_id, detections)
+            if worker is not None:
+                worker['frames'] += 1
+                worker['busy_seconds'] += busy_seconds
+
+    def _finish_job(self, job_id, detections):
+        """Release a job's slot and wake its caller"""
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return  # Already failed by a restart
+        worker_id, slot, future = job
+        self.free_slots.append(slot)
+        worker = self.workers.get(worker_id)
+        if worker is not None:
+            worker['in_flight'].discard(job_id)
+        if not future.done():
+            future.set_result(detections)
+
+    async def _health_loop(self):
+        """Restart crashed or hung workers and publish per-worker utilisation"""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            now = time.time()
+
+            for worker_id, worker in list(self.workers.items()):
+                process = worker['process']
+                if worker['failed']:
+                    continue
+                if worker['restart_at'] is not None:
+                    if now >= worker['restart_at']:
+                        self._spawn_worker(worker_id)
+                    continue
+                if not process.is_alive():
+                    logger.error(f"💥 Worker {worker_id} died (exit code {process.exitcode})")
+                    self._restart_worker(worker_id, now)
+                    continue
+                if now - worker['last_seen'] > self.health_timeout:
+                    logger.error(f"⏱️ Worker {worker_id} unresponsive for {now - worker['last_seen']:.1f}s")
+                    process.terminate()
+                    process.join(timeout=2)
+                    self._restart_worker(worker_id, now)
+                    continue
+                if worker['failures'] and worker['ready'] and now - worker['spawned_at'] > self.max_restart_backoff:
+                    worker['failures'] = 0
+
+                window = now - worker['window_start']
+                if window > 0:
+                    worker['utilisation'] = min(1.0, (worker['busy_seconds'] - worker['window_busy']) / window)
+                worker['window_start'] = now
+                worker['window_busy'] = worker['busy_seconds']
+
+            if self.metrics_collector is not None:
+                for worker_id, worker in self.workers.items():
+                    self.metrics_collector.record_worker_utilisation(
+                        worker_id,
+                        utilisation=worker['utilisation'],
+                        frames=worker['frames'],
+                        restarts=worker['restarts'],
+                        in_flight=len(worker['in_flight']),
+                        alive=worker['process'].is_alive(),
+                        failed=worker['failed']
+                    )
+
+    def _restart_worker(self, worker_id, now):
+        """Fail the worker's in-flight frames, then schedule a respawn with exponential backoff"""
+        worker = self.workers[worker_id]
+        for job_id in list(worker['in_flight']):
+            self._finish_job(job_id, None)
+
+        worker['failures'] += 1
+        if worker['failures'] > self.max_restarts:
+            worker['failed'] = True
+            logger.error(f"🛑 Worker {worker_id} failed {worker['failures']} times in a row, not restarting it")
+            return
+
+        delay = min(self.max_restart_backoff, self.restart_backoff * 2 ** (worker['failures'] - 1))
+        worker['restart_at'] = now + delay
+        logger.warning(f"🔁 Restarting worker {worker_id} in {delay:.0f}s "
+                       f"(failure {worker['failures']}/{self.max_restarts})")
+
+    async def stop(self):
+        """Stop workers, the reader thread and release the shared-memory ring"""
+        if self.shm is None:
+            return
+
+        if self.health_task is not None:
+            self.health_task.cancel()
+            try:
+                await self.health_task
+            except asyncio.CancelledError:
+                pass
+
+        for worker in self.workers.values():
+            worker['task_queue'].put(None)
+        for worker in self.workers.values():
+            worker['process'].join(timeout=5)
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+
+        for job_id in list(self.jobs):
+            self._finish_job(job_id, None)
+
+        self.result_queue.put(None)
+        self.reader_thread.join(timeout=2)
+
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+        logger.info("🛑 Worker pool stopped")
+
+    def get_stats(self):
+        """Get pool and per-worker state"""
+        return {
+            "num_workers": self.num_workers,
+            "ring_slots": self.ring_slots,
+            "free_slots": len(self.free_slots),
+            "in_flight": len(self.jobs),
+            "rejected": self.frames_rejected,
+            "failed_workers": sorted(worker_id for worker_id, worker in self.workers.items() if worker['failed']),
+            "workers": {
+                worker_id: {
+                    "pid": worker['process'].pid,
+                    "alive": worker['process'].is_alive(),
+                    "ready": worker['ready'],
+                    "in_flight": len(worker['in_flight']),
+                    "frames": worker['frames'],
+                    "utilisation": worker['utilisation'],
+                    "restarts": worker['restarts'],
+                    "failures": worker['failures'],
+                    "failed": worker['failed']
+                }
+                for worker_id, worker in self.workers.items()
+            }
+        }